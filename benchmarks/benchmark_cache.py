@@ -0,0 +1,45 @@
+import os
+import shutil
+import tempfile
+
+import dask.array as da
+
+from napari_workflow_tasks._widget import invalidate_cache, wipe_cache
+
+from .utils import write_image_zarr
+
+
+class DaskCacheSuite:
+    """Drop cached chunks after a task wrote one of many arrays."""
+    params = [[1, 10, 50]]
+    param_names = ['n_arrays']
+    # Every sample needs a freshly filled cache
+    number = 1
+    warmup_time = 0
+    timeout = 300
+
+    def setup(self, n_arrays):
+        from napari.utils import resize_dask_cache
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.arrays = []
+        self.written_paths = []
+        for i in range(n_arrays):
+            zarr_url = os.path.join(self.tmp_dir, f'image_{i}.zarr')
+            write_image_zarr(zarr_url, shape=(1, 512, 512), chunks=(1, 128, 128), n_levels=1)
+            self.arrays.append(da.from_zarr(os.path.join(zarr_url, '0')))
+            self.written_paths.append(os.path.join(zarr_url, '0'))
+
+        self.cache = resize_dask_cache(nbytes=2 * 1024 ** 3)
+        with self.cache:
+            da.compute(*self.arrays)
+
+    def teardown(self, n_arrays):
+        self.cache.cache.resize(0)
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def time_wipe_cache(self, n_arrays):
+        wipe_cache()
+
+    def time_invalidate_cache(self, n_arrays):
+        invalidate_cache(self.written_paths[:1])
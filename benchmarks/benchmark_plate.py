@@ -0,0 +1,30 @@
+import os
+import shutil
+import tempfile
+
+from napari_workflow_tasks._plate import find_image_zarr_urls, get_plate_url
+
+from .utils import write_plate_zarr
+
+
+class PlateSuite:
+    """Discover the images of plates with many wells."""
+    params = [[(2, 3), (8, 12), (16, 24)]]
+    param_names = ['rows_columns']
+    timeout = 300
+
+    def setup(self, rows_columns):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.plate_url = os.path.join(self.tmp_dir, 'plate.zarr')
+        n_rows, n_columns = rows_columns
+        self.image_urls = write_plate_zarr(self.plate_url, n_rows=n_rows, n_columns=n_columns,
+                                           shape=(1, 64, 64), chunks=(1, 64, 64), n_levels=1)
+
+    def teardown(self, rows_columns):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def time_find_image_zarr_urls(self, rows_columns):
+        find_image_zarr_urls(self.plate_url)
+
+    def time_get_plate_url(self, rows_columns):
+        get_plate_url(self.image_urls[-1])
@@ -0,0 +1,34 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from napari_workflow_tasks._reader import napari_get_reader, reader_function
+
+
+class ReaderSuite:
+    """Read stacks of ``.npy`` files through the reader contribution."""
+    params = [[1, 10, 100], [256, 1024]]
+    param_names = ['n_files', 'size']
+
+    def setup(self, n_files, size):
+        self.tmp_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.paths = []
+        for i in range(n_files):
+            path = os.path.join(self.tmp_dir, f'{i:04d}.npy')
+            np.save(path, rng.integers(0, 1000, size=(size, size), dtype='uint16'))
+            self.paths.append(path)
+
+    def teardown(self, n_files, size):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def time_get_reader(self, n_files, size):
+        napari_get_reader(self.paths)
+
+    def time_reader_function(self, n_files, size):
+        reader_function(self.paths)
+
+    def peakmem_reader_function(self, n_files, size):
+        reader_function(self.paths)
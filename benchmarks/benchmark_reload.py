@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+
+import dask.array as da
+
+from napari_workflow_tasks._scheduler import TaskJob
+from napari_workflow_tasks._zarr_utils import load_labels, load_multiscale
+
+from .utils import write_image_zarr, write_task_args, write_task_package
+
+
+class ReloadSuite:
+    """Reload the output labels of a finished task into the viewer."""
+    params = [[1024, 4096]]
+    param_names = ['size']
+    timeout = 300
+
+    def setup(self, size):
+        # The widget needs a QApplication, run headless unless told otherwise
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from napari.components import ViewerModel
+        from napari.utils import resize_dask_cache
+        from qtpy.QtWidgets import QApplication
+
+        from napari_workflow_tasks._widget import TasksQWidget
+
+        self.app = QApplication.instance() or QApplication([])
+        self.tmp_dir = tempfile.mkdtemp()
+        # Keep the manifest index and result cache of the user out of this
+        self.xdg_cache_home = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = os.path.join(self.tmp_dir, 'cache')
+
+        package_dir = os.path.join(self.tmp_dir, 'tasks')
+        write_task_package(package_dir)
+        self.zarr_url = os.path.join(self.tmp_dir, 'image.zarr')
+        write_image_zarr(self.zarr_url, shape=(1, size, size), label_names=['nuclei'])
+
+        self.viewer = ViewerModel()
+        image, _ = load_multiscale(self.zarr_url)
+        self.viewer.add_image(image, name='image', multiscale=True)
+        labels, _ = load_labels(self.zarr_url, 'nuclei')
+        self.viewer.add_labels(labels, name='nuclei', multiscale=True)
+        # Fill the cache with chunks the reload makes stale
+        with resize_dask_cache(nbytes=1024 ** 3):
+            da.compute(*[level[:256, :256] for level in labels])
+
+        self.widget = TasksQWidget(self.viewer)
+        path_to_task_args = write_task_args(os.path.join(self.tmp_dir, 'args.json'),
+                                            zarr_url=self.zarr_url, label_name='nuclei')
+        self.job = TaskJob(task_name='Thresholding Label Task',
+                           executable=os.path.join(package_dir, 'threshold_task.py'),
+                           path_to_task_args=path_to_task_args,
+                           task_args=dict(zarr_url=self.zarr_url, label_name='nuclei'))
+        self.job.status = 'finished'
+        self.job.result = dict(status='finished', error=None,
+                               written_paths=[os.path.join(self.zarr_url, 'labels', 'nuclei', str(level))
+                                              for level in range(len(labels))])
+
+    def teardown(self, size):
+        self.widget.executor.shutdown()
+        self.widget.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        if self.xdg_cache_home is None:
+            os.environ.pop('XDG_CACHE_HOME', None)
+        else:
+            os.environ['XDG_CACHE_HOME'] = self.xdg_cache_home
+
+    def time_fetch_subprocess_output(self, size):
+        self.widget._fetch_subprocess_output(self.job)
+
+    def time_fetch_subprocess_output_without_written_paths(self, size):
+        # Falls back to wiping the whole cache
+        self.job.result['written_paths'] = None
+        self.widget._fetch_subprocess_output(self.job)
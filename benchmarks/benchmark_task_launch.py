@@ -0,0 +1,81 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import napari_workflow_tasks.task_wrapper as task_wrapper
+from napari_workflow_tasks._runner import TaskRunner
+from napari_workflow_tasks._scheduler import TaskJob
+from napari_workflow_tasks._task_pool import TaskProcessPool
+
+from .utils import write_image_zarr, write_task_args, write_task_package
+
+
+class TaskLaunchSuite:
+    """Overhead of getting a task running, in a fresh interpreter and in a warm worker.
+
+    The task does nothing but record when its first line runs, so the
+    numbers are the cost of the launch path itself.
+    """
+    timeout = 120
+
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        package_dir = os.path.join(self.tmp_dir, 'tasks')
+        write_task_package(package_dir)
+        self.executable = os.path.join(package_dir, 'noop_task.py')
+        self.zarr_url = os.path.join(self.tmp_dir, 'image.zarr')
+        write_image_zarr(self.zarr_url, shape=(1, 64, 64), chunks=(1, 64, 64), n_levels=1)
+
+        self.first_line_path = os.path.join(self.tmp_dir, 'first_line.txt')
+        self.path_to_task_args = write_task_args(os.path.join(self.tmp_dir, 'args.json'),
+                                                 zarr_url=self.zarr_url,
+                                                 first_line_path=self.first_line_path)
+
+        self.pool = TaskProcessPool(n_workers=1)
+        # The first job waits for the worker to start and import the task
+        self.pool.run(self.executable, self.path_to_task_args)
+        self.runner = TaskRunner(executor=self.pool)
+
+    def teardown(self):
+        self.pool.shutdown()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _run_cold(self):
+        subprocess.run([sys.executable, task_wrapper.__file__,
+                        '--executable', self.executable,
+                        '--path_to_task_args', self.path_to_task_args],
+                       check=True, stdout=subprocess.DEVNULL)
+
+    def _read_first_line_time(self):
+        with open(self.first_line_path) as f:
+            return float(f.read())
+
+    def time_cold_task_wrapper(self):
+        self._run_cold()
+
+    def time_warm_pool_run(self):
+        self.pool.run(self.executable, self.path_to_task_args)
+
+    def time_launch_task_subprocess(self):
+        job = TaskJob(task_name='Noop Task',
+                      executable=self.executable,
+                      path_to_task_args=self.path_to_task_args,
+                      task_args=dict(zarr_url=self.zarr_url))
+        self.runner._launch_task_subprocess(job)
+
+    def track_cold_spawn_to_first_line(self):
+        started = time.time()
+        self._run_cold()
+        return self._read_first_line_time() - started
+
+    track_cold_spawn_to_first_line.unit = 'seconds'
+
+    def track_warm_spawn_to_first_line(self):
+        started = time.time()
+        self.pool.run(self.executable, self.path_to_task_args)
+        return self._read_first_line_time() - started
+
+    track_warm_spawn_to_first_line.unit = 'seconds'
@@ -0,0 +1,144 @@
+"""
+Synthetic OME-Zarr images, plates and task packages for the benchmarks.
+
+Everything is written with plain zarr so that the benchmarks do not depend on
+the code they measure, and sizes are parameters so that the same generators
+cover small smoke runs and realistic image sizes.
+"""
+import json
+import os
+
+import numpy as np
+import zarr
+
+NOOP_TASK = '''
+import time
+
+def noop_task(zarr_url, first_line_path=None):
+    if first_line_path is not None:
+        with open(first_line_path, 'w') as f:
+            f.write(repr(time.time()))
+'''
+
+THRESHOLD_TASK = '''
+import zarr
+
+def threshold_task(zarr_url, label_name='nuclei', threshold=100):
+    image = zarr.open(zarr_url + '/0', mode='r')[0]
+    labels = zarr.open_group(zarr_url, mode='a').require_group('labels')
+    labels.attrs['labels'] = [label_name]
+    group = labels.require_group(label_name)
+    group.create_dataset('0', data=(image > threshold).astype('uint32'),
+                         chunks=(256, 256), overwrite=True)
+    group.attrs['multiscales'] = [dict(version='0.4',
+                                       axes=[dict(name='y', type='space'), dict(name='x', type='space')],
+                                       datasets=[dict(path='0')])]
+'''
+
+
+def _multiscales(axes, n_levels, pixel_size=0.5):
+    spatial = [axis['type'] == 'space' for axis in axes]
+    return [dict(version='0.4',
+                 axes=axes,
+                 datasets=[dict(path=str(level), coordinateTransformations=[dict(
+                     type='scale',
+                     scale=[pixel_size * 2 ** level if is_spatial else 1 for is_spatial in spatial])])
+                           for level in range(n_levels)])]
+
+
+def write_image_zarr(zarr_url,
+                     shape=(1, 1024, 1024),
+                     chunks=(1, 256, 256),
+                     n_levels=3,
+                     dtype='uint16',
+                     label_names=(),
+                     seed=0):
+    """Write a CYX OME-Zarr image with an image pyramid and label images.
+
+    Returns the highest resolution level as a numpy array.
+    """
+    rng = np.random.default_rng(seed)
+    data = rng.integers(0, 1000, size=shape, dtype=dtype)
+
+    root = zarr.open_group(zarr_url, mode='w')
+    for level in range(n_levels):
+        factor = 2 ** level
+        root.create_dataset(str(level), data=data[:, ::factor, ::factor], chunks=chunks)
+    axes = [dict(name='c', type='channel'), dict(name='y', type='space'), dict(name='x', type='space')]
+    root.attrs['multiscales'] = _multiscales(axes, n_levels)
+    root.attrs['omero'] = dict(channels=[dict(label=f'channel_{c}') for c in range(shape[0])])
+
+    if label_names:
+        labels = root.require_group('labels')
+        labels.attrs['labels'] = list(label_names)
+        for label_name in label_names:
+            group = labels.require_group(label_name)
+            for level in range(n_levels):
+                factor = 2 ** level
+                group.create_dataset(str(level), data=(data[0, ::factor, ::factor] > 500).astype('uint32'),
+                                     chunks=chunks[1:])
+            group.attrs['multiscales'] = _multiscales(axes[1:], n_levels)
+    return data
+
+
+def write_plate_zarr(plate_url, n_rows=2, n_columns=3, n_images_per_well=1, **image_kwargs):
+    """Write an OME-Zarr plate, every field of view is a ``write_image_zarr`` image.
+
+    Returns the urls of all images of the plate.
+    """
+    rows = [chr(ord('A') + i) for i in range(n_rows)]
+    columns = [f'{i + 1:02d}' for i in range(n_columns)]
+
+    root = zarr.open_group(plate_url, mode='w')
+    root.attrs['plate'] = dict(rows=[dict(name=row) for row in rows],
+                               columns=[dict(name=column) for column in columns],
+                               wells=[dict(path=f'{row}/{column}') for row in rows for column in columns])
+
+    image_urls = []
+    for row in rows:
+        for column in columns:
+            well = root.require_group(row).require_group(column)
+            well.attrs['well'] = dict(images=[dict(path=str(i)) for i in range(n_images_per_well)])
+            for i in range(n_images_per_well):
+                image_url = os.path.join(plate_url, row, column, str(i))
+                write_image_zarr(image_url, **image_kwargs)
+                image_urls.append(image_url)
+    return image_urls
+
+
+def write_task_package(package_dir):
+    """Write dummy task executables and a Fractal manifest describing them.
+
+    Returns the path of the manifest.
+    """
+    os.makedirs(package_dir, exist_ok=True)
+    tasks = [('Noop Task', 'noop_task', NOOP_TASK,
+              dict(first_line_path=dict(title='First line path', type='string'))),
+             ('Thresholding Label Task', 'threshold_task', THRESHOLD_TASK,
+              dict(label_name=dict(title='Label name', type='string', default='nuclei'),
+                   threshold=dict(title='Threshold', type='integer', default=100)))]
+
+    task_list = []
+    for name, module_name, source, properties in tasks:
+        with open(os.path.join(package_dir, f'{module_name}.py'), 'w') as f:
+            f.write(source)
+        task_list.append(dict(
+            name=name,
+            category='Segmentation',
+            executable_parallel=f'{module_name}.py',
+            args_schema_parallel=dict(title=module_name.title().replace('_', ''),
+                                      type='object',
+                                      required=['zarr_url'],
+                                      properties=dict(zarr_url=dict(title='Zarr Url', type='string'),
+                                                      **properties))))
+
+    path_to_manifest = os.path.join(package_dir, '__FRACTAL_MANIFEST__.json')
+    with open(path_to_manifest, 'w') as f:
+        json.dump(dict(manifest_version='2', task_list=task_list), f)
+    return path_to_manifest
+
+
+def write_task_args(path_to_task_args, **task_args):
+    with open(path_to_task_args, 'w') as f:
+        json.dump(task_args, f)
+    return path_to_task_args
@@ -2,13 +2,21 @@ __version__ = "0.0.1"
 
 from ._reader import napari_get_reader
 from ._sample_data import make_sample_data
-from ._widget import TasksQWidget
-from ._writer import write_multiple, write_single_image
+from ._writer import write_multiple, write_single_image, write_single_labels
 
 __all__ = (
     "napari_get_reader",
     "write_single_image",
+    "write_single_labels",
     "write_multiple",
     "make_sample_data",
     "TasksQWidget",
 )
+
+
+def __getattr__(name):
+    # The widget needs Qt and napari, the command line runner does not
+    if name == "TasksQWidget":
+        from ._widget import TasksQWidget
+        return TasksQWidget
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,132 @@
+"""
+Resume a run on tiles or ROIs of an image after it was interrupted.
+
+A task processes the ROIs of an image one after the other in a single call,
+so a run that dies halfway, e.g. because the machine ran out of memory or
+went to sleep, has to start over. Runs split into tiles or ROIs by
+``_tiling.run_tiled`` can instead keep a checkpoint next to their output, in
+``<zarr_url>/.checkpoints/<key>``: the label images being stitched, and for
+every tile done the labels and border bands needed to stitch it. Running the
+same task with the same arguments on the same input again only processes the
+tiles that are left. The key covers the task executable, its arguments, the
+tiling and a fingerprint of the input arrays, so a checkpoint is never
+resumed with other inputs. It is removed once the run finished.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from ._result_cache import _hash_file, fingerprint, get_input_arrays
+
+CHECKPOINT_DIR = '.checkpoints'
+CHECKPOINT_FILE = 'checkpoint.json'
+
+
+def get_checkpoint_dir(zarr_url, executable, task_args, tiling):
+    """Return the checkpoint directory of a run.
+
+    Parameters
+    ----------
+    zarr_url : str
+        The image the run writes into.
+    executable : str
+        Path to the task executable.
+    task_args : dict
+        Arguments of the task.
+    tiling : dict
+        Everything that decides how the image is split into tiles, but not
+        how many run at once.
+    """
+    sha = hashlib.sha256()
+    sha.update(_hash_file(executable).encode())
+    sha.update(json.dumps(dict(task_args=task_args, tiling=tiling), sort_keys=True).encode())
+    sha.update(fingerprint(get_input_arrays(zarr_url, task_args)).encode())
+    return os.path.join(zarr_url, CHECKPOINT_DIR, sha.hexdigest()[:16])
+
+
+class TileCheckpoint:
+    """Tiles of a run that are done, kept on disk.
+
+    ``checkpoint.json`` in the directory lists the tiles done and the state
+    of the label images, the arrays of every tile are kept in an ``.npz``
+    file per tile and label image. A tile is only listed once its arrays
+    are written, so a run killed at any point resumes from a consistent
+    state.
+
+    Parameters
+    ----------
+    checkpoint_dir : str
+        See ``get_checkpoint_dir``, an existing checkpoint in it is loaded.
+    """
+    def __init__(self, checkpoint_dir):
+        self.checkpoint_dir = checkpoint_dir
+        self._lock = threading.Lock()
+        path = os.path.join(checkpoint_dir, CHECKPOINT_FILE)
+        if os.path.exists(path):
+            with open(path) as f:
+                self.state = json.load(f)
+        else:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+            self.state = dict(label_images=dict(), tiles=dict())
+
+    @property
+    def done_tiles(self):
+        return sorted(int(i) for i in self.state['tiles'])
+
+    @property
+    def label_images(self):
+        """State of every label image, see ``_StitchedLabels.get_state``."""
+        return self.state['label_images']
+
+    def get_tile(self, i):
+        """Return the state of a tile done, per label image."""
+        return self.state['tiles'][str(i)]
+
+    def get_scratch_url(self, label_name):
+        return os.path.join(self.checkpoint_dir, f'{label_name}.zarr')
+
+    def _get_arrays_path(self, i, label_name):
+        return os.path.join(self.checkpoint_dir, f'{label_name}-tile{i}.npz')
+
+    def save_arrays(self, i, label_name, arrays):
+        """Write the arrays of a label image of a tile, a dict of name to array."""
+        np.savez(self._get_arrays_path(i, label_name), **arrays)
+
+    def load_arrays(self, i, label_name):
+        with np.load(self._get_arrays_path(i, label_name)) as f:
+            return {name: f[name] for name in f.files}
+
+    def mark_done(self, i, tile_state, label_images):
+        """Record a tile as done once all its arrays are written.
+
+        Parameters
+        ----------
+        tile_state : dict
+            State of the tile per label image.
+        label_images : dict
+            State of every label image after adding the tile.
+        """
+        with self._lock:
+            self.state['tiles'][str(i)] = tile_state
+            # Labels are only ever added, a resumed tile must not reuse the
+            # labels of a tile recorded with a newer state
+            for label_name, state in label_images.items():
+                recorded = self.state['label_images'].get(label_name, dict())
+                self.state['label_images'][label_name] = dict(
+                    state, n_labels=max(state.get('n_labels', 0), recorded.get('n_labels', 0)))
+            # Replacing the file is atomic, a run killed meanwhile keeps the old one
+            path = os.path.join(self.checkpoint_dir, CHECKPOINT_FILE)
+            with open(path + '.tmp', 'w') as f:
+                json.dump(self.state, f)
+            os.replace(path + '.tmp', path)
+
+    def remove(self):
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+        # Only removed if no other run keeps a checkpoint in it
+        with contextlib.suppress(OSError):
+            os.rmdir(os.path.dirname(self.checkpoint_dir))
@@ -0,0 +1,294 @@
+"""
+Run a task of a task package on many OME-Zarr images without napari or Qt.
+
+::
+
+    napari-workflow-tasks MANIFEST TASK ZARR_URL [ZARR_URL ...] --params params.json
+
+runs the task on every image in parallel, or on every image of a plate if
+a ``ZARR_URL`` is an OME-Zarr plate, and writes a JSON summary with the
+status, error, written arrays and run statistics of every job. The
+parameter file holds the task arguments as a JSON object; parameter groups
+may be given as objects of their fields. Jobs run through the same
+executors, result cache and scheduler as in the widget.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from ._executors import EXECUTORS, create_executor
+from ._memory import (
+    GIB,
+    get_default_memory_budget,
+    get_memory_warning,
+    get_worker_memory_limit,
+)
+from ._plate import find_image_zarr_urls, is_plate
+from ._preview import DEFAULT_ROI_TABLES
+from ._result_cache import ResultCache
+from ._runner import TaskRunner, create_task_job
+from ._scheduler import TaskScheduler
+from ._task_manager import FractalTaskManager, TaskArgsError
+from ._tiling import DEFAULT_HALO
+
+
+def expand_zarr_urls(zarr_urls):
+    """Return ``(zarr_url, plate_url)`` of every image, plates are expanded.
+
+    ``plate_url`` is None for images that were given directly.
+    """
+    targets = []
+    for zarr_url in zarr_urls:
+        zarr_url = os.path.abspath(zarr_url)
+        if is_plate(zarr_url):
+            targets.extend((image_url, zarr_url) for _, image_url in find_image_zarr_urls(zarr_url))
+        else:
+            targets.append((zarr_url, None))
+    return targets
+
+
+def _get_job_summary(job):
+    result = job.result or dict()
+    return dict(job_id=job.job_id,
+                zarr_url=job.task_args.get('zarr_url'),
+                plate_url=job.group,
+                status=job.status,
+                error=job.error,
+                cached=result.get('cached', False),
+                pid=result.get('pid'),
+                written_paths=result.get('written_paths'),
+                started_at=job.started_at,
+                finished_at=job.finished_at,
+                stats=result.get('stats'))
+
+
+def run_batch(path_to_manifest,
+              task_name,
+              zarr_urls,
+              task_args=None,
+              max_workers=1,
+              executor='Local processes',
+              executor_options='',
+              timeout=None,
+              use_cache=True,
+              force_rerun=False,
+              tile_size=0,
+              halo=DEFAULT_HALO,
+              roi_wise=False,
+              checkpoint=False,
+              memory_budget=None,
+              max_worker_memory=None):
+    """Run a task on several images in parallel and summarise the jobs.
+
+    Parameters
+    ----------
+    path_to_manifest : str
+        Manifest of the task package.
+    task_name : str
+        Name of the task in the manifest.
+    zarr_urls : list of str
+        OME-Zarr images or plates to run on.
+    task_args : dict, optional
+        Arguments of the task other than ``zarr_url``.
+    max_workers : int
+        Number of jobs, or tiles, that run at once.
+    executor, executor_options : str
+        See ``_executors.create_executor``.
+    timeout : float, optional
+        Seconds after which a job is killed.
+    use_cache, force_rerun : bool
+        Reuse cached results of earlier runs, and whether to run the task
+        anyway and update the cache.
+    tile_size, halo : int
+        Run on tiles of every image in parallel if ``tile_size`` is not 0,
+        see ``_tiling.run_tiled``.
+    roi_wise : bool
+        Run on every ROI of the ``input_ROI_table`` of the task in parallel
+        instead of on tiles.
+    checkpoint : bool
+        Keep the tiles or ROIs done in a checkpoint next to every image, so
+        that running again after an interruption resumes, see
+        ``_checkpoint``.
+    memory_budget : int, optional
+        Bytes the estimated peak memory of the running jobs may add up to.
+    max_worker_memory : int, optional
+        Bytes above which a local worker is recycled after a job, by default
+        its share of ``memory_budget``, see
+        ``_memory.get_worker_memory_limit``.
+
+    Returns
+    -------
+    dict
+        The task, its arguments, the number of jobs per status and a
+        summary of every job in ``jobs``.
+
+    Raises
+    ------
+    TaskArgsError
+        If the arguments do not match the schema of the task.
+    ValueError
+        If the task is not in the manifest, or ``roi_wise`` or
+        ``checkpoint`` are given without what they need.
+    """
+    started_at = time.time()
+    task_manager = FractalTaskManager()
+    # Every task with a parallel part can be run, not only those the widget offers
+    task_manager.load_package(path_to_manifest, categories=None)
+    if task_name not in task_manager.tasks:
+        raise ValueError(f'{path_to_manifest} has no task {task_name}, '
+                         f'choose one of {", ".join(sorted(task_manager.tasks))}')
+    task_manager.set_args(task_name, dict() if task_args is None else task_args)
+
+    targets = expand_zarr_urls(zarr_urls)
+    context = dict(force_rerun=force_rerun)
+    roi_table = task_manager.get_args_dict(task_name).get('input_ROI_table')
+    roi_table = roi_table if isinstance(roi_table, str) else None
+    if roi_wise and roi_table is None:
+        raise ValueError(f'{task_name} has no input_ROI_table to run ROI by ROI on')
+    if checkpoint and not (tile_size or roi_wise):
+        raise ValueError('Only runs on tiles or ROI by ROI keep a checkpoint')
+    if tile_size or roi_wise:
+        roi_tables = set(DEFAULT_ROI_TABLES) | ({roi_table} if roi_table is not None else set())
+        context['tiling'] = dict(tile_size=0 if roi_wise else tile_size, halo=halo, n_parallel=max_workers,
+                                 roi_tables=sorted(roi_tables), roi_table=roi_table if roi_wise else None,
+                                 checkpoint=checkpoint)
+
+    def _on_update(job):
+        if job.is_done:
+            message = '' if job.error is None else f': {job.error.strip().splitlines()[-1]}'
+            print(f'Job {job.job_id} {job.status}{message} ({job.task_args.get("zarr_url")})')
+
+    if max_worker_memory is None:
+        max_worker_memory = get_worker_memory_limit(memory_budget, max_workers)
+    runner = TaskRunner(executor=create_executor(executor, executor_options, n_workers=max_workers,
+                                                 max_worker_memory=max_worker_memory),
+                        result_cache=ResultCache() if use_cache else None)
+    # Remote jobs read their arguments from the job directory they share with us
+    task_manager.args_dir = tempfile.mkdtemp(prefix='napari-workflow-tasks-args-',
+                                             dir=getattr(runner.executor, 'job_dir', None))
+    scheduler = TaskScheduler(runner=runner.run, max_concurrency=max_workers, on_update=_on_update,
+                              memory_budget=memory_budget)
+    jobs = []
+    try:
+        for zarr_url, plate_url in targets:
+            task_manager.update_task_property(task_name, 'zarr_url', zarr_url)
+            job = create_task_job(task_manager, task_name, scheduler.new_job_id(),
+                                  timeout=timeout, group=plate_url, context=dict(context))
+            jobs.append(job)
+            warning = get_memory_warning(job, memory_budget)
+            if warning is not None:
+                print(warning)
+            scheduler.submit(job)
+        print(f'Submitted {len(jobs)} jobs of {task_name}, {max_workers} at once')
+        try:
+            scheduler.wait()
+        except KeyboardInterrupt:
+            print('Cancelling all jobs')
+            for job in jobs:
+                scheduler.cancel(job.job_id)
+            scheduler.wait()
+    finally:
+        runner.executor.shutdown()
+        shutil.rmtree(task_manager.args_dir, ignore_errors=True)
+
+    task_args = task_manager.get_args_dict(task_name)
+    task_args.pop('zarr_url', None)
+    return dict(manifest=os.path.abspath(path_to_manifest),
+                task_name=task_name,
+                task_args=task_args,
+                executor=executor,
+                started_at=started_at,
+                finished_at=time.time(),
+                n_jobs=len(jobs),
+                **{f'n_{status}': sum(job.status == status for job in jobs)
+                   for status in ('finished', 'failed', 'cancelled')},
+                jobs=[_get_job_summary(job) for job in jobs])
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='napari-workflow-tasks',
+                                     description='Run a task of a Fractal task package on OME-Zarr images '
+                                                 'or plates in parallel, without napari.')
+    parser.add_argument('manifest', help='Manifest (__FRACTAL_MANIFEST__.json) of the task package')
+    parser.add_argument('task', help='Name of the task in the manifest')
+    parser.add_argument('zarr_urls', nargs='+', metavar='ZARR_URL', help='OME-Zarr images or plates')
+    parser.add_argument('--params', help='JSON file with the task arguments')
+    parser.add_argument('--summary', default='results.json',
+                        help='Where to write the JSON summary of the jobs (default: %(default)s)')
+    parser.add_argument('-j', '--max-workers', type=int, default=os.cpu_count() or 1,
+                        help='Number of jobs, or tiles, running at once (default: number of CPUs)')
+    parser.add_argument('--executor', choices=EXECUTORS, default=EXECUTORS[0],
+                        help='Where jobs run (default: %(default)s)')
+    parser.add_argument('--executor-options', default='',
+                        help='Dask scheduler address, or options of the batch jobs such as "--mem=16G"')
+    parser.add_argument('--timeout', type=float, help='Kill a job after this many seconds')
+    parser.add_argument('--no-cache', action='store_true', help='Neither reuse nor store cached results')
+    parser.add_argument('--force-rerun', action='store_true',
+                        help='Run the task even if a cached result exists')
+    parser.add_argument('--tile-size', type=int, default=0,
+                        help='Run on tiles of this size in parallel and stitch the labels')
+    parser.add_argument('--halo', type=int, default=DEFAULT_HALO,
+                        help='Pixels of context around every tile (default: %(default)s)')
+    parser.add_argument('--roi-wise', action='store_true',
+                        help='Run on every ROI of the input_ROI_table in parallel instead of on tiles')
+    parser.add_argument('--checkpoint', action='store_true',
+                        help='Keep the tiles or ROIs done next to every image, running the same command '
+                             'again after an interruption only processes those left')
+    parser.add_argument('--memory-budget', type=float,
+                        help='GiB the estimated peak memory of the running jobs may add up to '
+                             '(default: 80%% of the available memory, 0 for no limit)')
+    parser.add_argument('--max-worker-memory', type=float,
+                        help='GiB above which a local worker process is restarted after a job '
+                             '(default: its share of the memory budget)')
+    return parser
+
+
+def main(argv=None):
+    """Entry point of the ``napari-workflow-tasks`` command.
+
+    Returns 0 if every job finished, 1 if one did not.
+    """
+    parser = get_parser()
+    args = parser.parse_args(argv)
+
+    task_args = dict()
+    if args.params is not None:
+        with open(args.params) as f:
+            task_args = json.load(f)
+        if not isinstance(task_args, dict):
+            parser.error(f'{args.params} has to hold a JSON object of task arguments')
+
+    memory_budget = get_default_memory_budget() if args.memory_budget is None else int(args.memory_budget * GIB)
+    try:
+        summary = run_batch(args.manifest,
+                            args.task,
+                            args.zarr_urls,
+                            task_args=task_args,
+                            max_workers=max(1, args.max_workers),
+                            executor=args.executor,
+                            executor_options=args.executor_options,
+                            timeout=args.timeout,
+                            use_cache=not args.no_cache,
+                            force_rerun=args.force_rerun,
+                            tile_size=args.tile_size,
+                            halo=args.halo,
+                            roi_wise=args.roi_wise,
+                            checkpoint=args.checkpoint,
+                            memory_budget=memory_budget or None,
+                            max_worker_memory=None if args.max_worker_memory is None
+                            else int(args.max_worker_memory * GIB))
+    except (TaskArgsError, ValueError, OSError) as e:
+        parser.error(str(e))
+
+    with open(args.summary, 'w') as f:
+        json.dump(summary, f, indent=2)
+    print(f'{summary["n_finished"]}/{summary["n_jobs"]} jobs finished, summary written to {args.summary}')
+    return 0 if summary['n_finished'] == summary['n_jobs'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
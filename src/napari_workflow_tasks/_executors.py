@@ -0,0 +1,420 @@
+"""
+Backends that run task jobs, locally or on compute nodes.
+
+Every executor takes the same jobs as ``TaskProcessPool.run`` and
+``TaskProcessPool.run_pipeline`` and returns the same result dicts, so the
+widget does not care where a job runs. Remote executors start
+``task_wrapper.py --job`` on the compute node and talk to it through files
+next to the job file, which requires the task package, the OME-Zarr images
+and the job directory to be on a file system shared with the compute nodes:
+
+- ``<job>.progress``, the last progress event, written by the task
+- ``<job>.result``, the result, written by the task once it is done
+- ``<job>.cancel``, created by the executor to kill the task
+
+Cancel files outlive their job until the task had time to see them, stale
+ones are removed when a later job starts and on ``shutdown``.
+"""
+import abc
+import json
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+from ._task_pool import TaskProcessPool
+
+# Seconds between two checks of the state of a remote job
+POLL_INTERVAL = 0.5
+# Seconds a remote job may be unknown to the scheduler before its result file appears
+RESULT_GRACE_PERIOD = 10
+# Seconds after which a task has surely seen its cancel file
+CANCEL_FILE_LIFETIME = 60
+
+TASK_WRAPPER_PATH = os.path.join(os.path.dirname(__file__), 'task_wrapper.py')
+
+
+class TaskExecutor(abc.ABC):
+    """Interface of the execution backends.
+
+    Attributes
+    ----------
+    shares_memory : bool
+        Whether jobs run on this machine and can read its shared memory,
+        which in-memory layers require.
+    """
+    shares_memory = False
+
+    def run(self, executable, path_to_task_args, timeout=None, cancel_event=None, zarr_url=None,
+            on_progress=None, profile_path=None):
+        """Run a task and block until it is done, see ``TaskProcessPool.run``."""
+        return self._run_job(dict(executable=executable,
+                                  path_to_task_args=path_to_task_args,
+                                  zarr_url=zarr_url,
+                                  profile_path=profile_path),
+                             timeout, cancel_event, on_progress)
+
+    def run_pipeline(self, steps, zarr_url, timeout=None, cancel_event=None, on_progress=None,
+                     profile_path=None, scratch_dir=None):
+        """Run a pipeline in one job, see ``TaskProcessPool.run_pipeline``."""
+        return self._run_job(dict(pipeline=steps,
+                                  zarr_url=zarr_url,
+                                  profile_path=profile_path,
+                                  scratch_dir=scratch_dir),
+                             timeout, cancel_event, on_progress)
+
+    @abc.abstractmethod
+    def _run_job(self, job, timeout, cancel_event, on_progress):
+        """Run a job dict built by ``run`` or ``run_pipeline``, return its result."""
+
+    def resize(self, n_workers):  # noqa: B027, an optional hook
+        """Adapt the executor to running ``n_workers`` jobs at once.
+
+        Does nothing unless the executor keeps a pool of workers.
+        """
+
+    def set_worker_memory_limit(self, n_bytes):  # noqa: B027, an optional hook
+        """Recycle workers that keep more than ``n_bytes`` after a job.
+
+        Only executors with long-lived workers do anything, None removes the
+        limit.
+        """
+
+    def shutdown(self):  # noqa: B027, an optional hook
+        """Release the resources of the executor.
+
+        Does nothing unless the executor holds workers or a connection.
+        """
+
+
+class LocalExecutor(TaskExecutor):
+    """Run jobs in warm worker processes on this machine.
+
+    Parameters
+    ----------
+    n_workers : int
+        Number of worker processes, see ``TaskProcessPool``.
+    """
+    shares_memory = True
+
+    def __init__(self, n_workers=1, **pool_kwargs):
+        self.pool = TaskProcessPool(n_workers=n_workers, **pool_kwargs)
+
+    def _run_job(self, job, timeout, cancel_event, on_progress):
+        if 'pipeline' in job:
+            return self.pool.run_pipeline(job['pipeline'], job['zarr_url'], timeout=timeout,
+                                          cancel_event=cancel_event, on_progress=on_progress,
+                                          profile_path=job['profile_path'], scratch_dir=job['scratch_dir'])
+        return self.pool.run(job['executable'], job['path_to_task_args'], timeout=timeout,
+                             cancel_event=cancel_event, zarr_url=job['zarr_url'], on_progress=on_progress,
+                             profile_path=job['profile_path'])
+
+    def resize(self, n_workers):
+        self.pool.resize(n_workers)
+
+    def set_worker_memory_limit(self, n_bytes):
+        self.pool.max_memory_bytes = n_bytes
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+
+class _FileJobExecutor(TaskExecutor):
+    # Runs jobs through task_wrapper.py --job and polls the files of the job
+
+    def __init__(self, job_dir=None, python=sys.executable):
+        self.owns_job_dir = job_dir is None
+        self.job_dir = tempfile.mkdtemp(prefix='napari-workflow-tasks-jobs-') if job_dir is None else job_dir
+        os.makedirs(self.job_dir, exist_ok=True)
+        self.python = python
+
+    def _write_job(self, job):
+        job_path = os.path.join(self.job_dir, f'{uuid.uuid4().hex}.job.json')
+        with open(job_path, 'w') as f:
+            json.dump(job, f)
+        return job_path
+
+    def _command(self, job_path):
+        return [self.python, TASK_WRAPPER_PATH, '--job', job_path]
+
+    @abc.abstractmethod
+    def _submit(self, job_path):
+        """Start the job and return a handle of it."""
+
+    @abc.abstractmethod
+    def _poll(self, handle):
+        """Return the stage of a job that is still alive, None once it is gone."""
+
+    def _cancel(self, handle):
+        pass
+
+    def _describe_failure(self, job_path, handle):
+        # Output of a job that ended without a result
+        return ''
+
+    def _run_job(self, job, timeout, cancel_event, on_progress):
+        self._remove_stale_cancel_files()
+        job_path = self._write_job(job)
+        try:
+            return self._wait_for_result(job_path, self._submit(job_path), timeout, cancel_event, on_progress)
+        except (OSError, subprocess.SubprocessError) as e:
+            return dict(status='failed', error=f'Could not run the job: {e}', rss=None, pid=None)
+        finally:
+            # A cancel file stays until the task has seen it
+            for suffix in ['', '.progress', '.result', '.sh', '.log']:
+                if os.path.exists(job_path + suffix):
+                    os.remove(job_path + suffix)
+
+    def _remove_stale_cancel_files(self):
+        # The job dir may be shared by several sessions, so only the cancel
+        # files of jobs that are gone for long enough are removed
+        now = time.time()
+        try:
+            entries = list(os.scandir(self.job_dir))
+        except OSError:
+            return
+        for entry in entries:
+            if not entry.name.endswith('.cancel'):
+                continue
+            try:
+                if (not os.path.exists(entry.path[:-len('.cancel')])
+                        and now - entry.stat().st_mtime > CANCEL_FILE_LIFETIME):
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    def _kill(self, job_path, handle):
+        # The task exits once it sees the cancel file, the scheduler is
+        # told as well in case it has not started yet
+        open(job_path + '.cancel', 'w').close()
+        self._cancel(handle)
+
+    def _wait_for_result(self, job_path, handle, timeout, cancel_event, on_progress):
+        started = time.monotonic()
+        progress_mtime = None
+        gone_since = None
+        last_stage = None
+        while True:
+            if os.path.exists(job_path + '.result'):
+                with open(job_path + '.result') as f:
+                    return json.load(f)
+
+            if on_progress is not None and os.path.exists(job_path + '.progress'):
+                mtime = os.stat(job_path + '.progress').st_mtime_ns
+                if mtime != progress_mtime:
+                    progress_mtime = mtime
+                    try:
+                        with open(job_path + '.progress') as f:
+                            on_progress(json.load(f))
+                    except (OSError, ValueError):
+                        pass
+
+            stage = self._poll(handle)
+            if stage is None:
+                # The result file may show up late on network file systems
+                gone_since = time.monotonic() if gone_since is None else gone_since
+                if time.monotonic() - gone_since > RESULT_GRACE_PERIOD:
+                    error = f'Job {handle} ended without a result\n{self._describe_failure(job_path, handle)}'
+                    return dict(status='failed', error=error.strip(), rss=None, pid=None)
+            elif stage != last_stage and progress_mtime is None and on_progress is not None:
+                # Until the task reports progress itself, show where the job is
+                last_stage = stage
+                on_progress(dict(current=None, total=None, stage=stage, rate=None, eta=None))
+
+            if cancel_event is not None and cancel_event.is_set():
+                self._kill(job_path, handle)
+                return dict(status='cancelled', error='Cancelled by user', rss=None, pid=None)
+            if timeout is not None and time.monotonic() - started > timeout:
+                self._kill(job_path, handle)
+                return dict(status='failed', error=f'Timed out after {timeout} s', rss=None, pid=None)
+            time.sleep(POLL_INTERVAL)
+
+    def shutdown(self):
+        if self.owns_job_dir:
+            shutil.rmtree(self.job_dir, ignore_errors=True)
+        else:
+            self._remove_stale_cancel_files()
+
+
+class DaskExecutor(_FileJobExecutor):
+    """Run jobs on the workers of a ``dask.distributed`` cluster.
+
+    Parameters
+    ----------
+    address : str, optional
+        Address of the dask scheduler, a ``LocalCluster`` is started if it
+        is not given.
+    n_workers : int
+        Number of workers of the ``LocalCluster``.
+    job_dir : str, optional
+        Directory on a shared file system for the job files.
+    python : str
+        Python interpreter on the dask workers.
+    """
+    def __init__(self, address=None, n_workers=1, job_dir=None, python=sys.executable):
+        try:
+            from distributed import Client, LocalCluster
+        except ImportError:
+            raise ImportError('The dask executor requires dask.distributed, '
+                              'install it with `pip install distributed`') from None
+        super().__init__(job_dir=job_dir, python=python)
+
+        self.cluster = None
+        if address is None:
+            # Tasks run in their own interpreter anyway, the dask workers only
+            # wait for them, so they can be threads of this process
+            self.cluster = LocalCluster(n_workers=n_workers, threads_per_worker=1, processes=False)
+            address = self.cluster.scheduler_address
+        self.client = Client(address)
+        self.shares_memory = self.cluster is not None
+
+    def _submit(self, job_path):
+        # A function of the standard library, so the workers do not need to
+        # import this plugin and napari to unpickle it
+        return self.client.submit(subprocess.run, self._command(job_path), capture_output=True, text=True,
+                                  pure=False, key=f'napari-workflow-task-{os.path.basename(job_path)}')
+
+    def _poll(self, future):
+        if future.status == 'pending':
+            return 'Running on a dask worker'
+        if future.status == 'error':
+            # The wrapper did not even start, e.g. a wrong interpreter path
+            raise OSError(f'Dask task failed: {future.exception()}')
+        return None
+
+    def _cancel(self, future):
+        future.cancel()
+
+    def _describe_failure(self, job_path, future):
+        if future.status != 'finished':
+            return ''
+        completed = future.result()
+        return f'Exit code {completed.returncode}\n{completed.stderr[-2000:]}'
+
+    def resize(self, n_workers):
+        if self.cluster is not None:
+            self.cluster.scale(n_workers)
+
+    def shutdown(self):
+        self.client.close()
+        if self.cluster is not None:
+            self.cluster.close()
+        super().shutdown()
+
+
+class BatchExecutor(_FileJobExecutor):
+    """Submit every job as a batch job, by default to Slurm.
+
+    Commands are lists of arguments, ``{job_id}`` is replaced by the id of
+    the batch job.
+
+    Parameters
+    ----------
+    submit_command : list of str
+        Submits the job script appended to it and prints the job id. The
+        last number in its output is taken as the job id.
+    status_command : list of str
+        Prints the state of a job, and nothing once the job is gone.
+    cancel_command : list of str
+        Cancels a job.
+    directives : list of str
+        Scheduler options written into the job script, e.g.
+        ``['--mem=16G', '--time=01:00:00']``.
+    directive_prefix : str
+        Prefix of the option lines of the job script.
+    job_dir : str, optional
+        Directory on a shared file system for job scripts and files.
+    python : str
+        Python interpreter on the compute nodes.
+    """
+    def __init__(self,
+                 submit_command=('sbatch', '--parsable'),
+                 status_command=('squeue', '--noheader', '--format=%T', '--jobs={job_id}'),
+                 cancel_command=('scancel', '{job_id}'),
+                 directives=(),
+                 directive_prefix='#SBATCH',
+                 job_dir=None,
+                 python=sys.executable):
+        super().__init__(job_dir=job_dir, python=python)
+        self.submit_command = list(submit_command)
+        self.status_command = list(status_command)
+        self.cancel_command = list(cancel_command)
+        self.directives = list(directives)
+        self.directive_prefix = directive_prefix
+
+    def _format(self, command, job_id):
+        return [arg.replace('{job_id}', job_id) for arg in command]
+
+    def write_job_script(self, job_path):
+        lines = ['#!/bin/sh']
+        lines.extend(f'{self.directive_prefix} {directive}' for directive in self.directives)
+        lines.append(f'exec {shlex.join(self._command(job_path))} > {shlex.quote(job_path)}.log 2>&1')
+        script_path = job_path + '.sh'
+        with open(script_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.chmod(script_path, 0o755)
+        return script_path
+
+    def _submit(self, job_path):
+        script_path = self.write_job_script(job_path)
+        output = subprocess.run(self.submit_command + [script_path],
+                                capture_output=True, text=True, check=True).stdout
+        job_ids = re.findall(r'\d+', output)
+        if not job_ids:
+            raise OSError(f'No job id in the output of {self.submit_command[0]}: {output!r}')
+        return job_ids[-1]
+
+    def _poll(self, job_id):
+        completed = subprocess.run(self._format(self.status_command, job_id), capture_output=True, text=True)
+        state = completed.stdout.strip()
+        if completed.returncode != 0 or not state:
+            return None
+        return f'Batch job {job_id}: {state.splitlines()[0].lower()}'
+
+    def _cancel(self, job_id):
+        subprocess.run(self._format(self.cancel_command, job_id), capture_output=True)
+
+    def _describe_failure(self, job_path, job_id):
+        try:
+            with open(job_path + '.log') as f:
+                return f.read()[-2000:]
+        except OSError:
+            return ''
+
+
+EXECUTORS = ['Local processes', 'Dask cluster', 'Batch scheduler']
+
+
+def get_default_job_dir():
+    # Home directories are usually shared with the compute nodes
+    return os.path.join(os.path.expanduser('~'), '.napari-workflow-tasks', 'jobs')
+
+
+def create_executor(name, options='', n_workers=1, max_worker_memory=None):
+    """Create one of the ``EXECUTORS``.
+
+    Parameters
+    ----------
+    name : str
+        One of ``EXECUTORS``.
+    options : str
+        The address of the dask scheduler, a local cluster if empty, or the
+        options of the batch jobs, e.g. ``--mem=16G --time=01:00:00``.
+    n_workers : int
+        Number of jobs that run at once.
+    max_worker_memory : int, optional
+        Bytes above which a worker is recycled after a job, see
+        ``_memory.get_worker_memory_limit``.
+    """
+    if name == 'Local processes':
+        return LocalExecutor(n_workers=n_workers, max_memory_bytes=max_worker_memory)
+    if name == 'Dask cluster':
+        return DaskExecutor(address=options or None, n_workers=n_workers)
+    if name == 'Batch scheduler':
+        return BatchExecutor(directives=shlex.split(options), job_dir=get_default_job_dir())
+    raise ValueError(f'Unknown executor {name}, expected one of {EXECUTORS}')
@@ -0,0 +1,182 @@
+"""
+Read the measurement tables of an OME-Zarr image as features of its labels.
+
+Measurement tasks write AnnData feature tables into the ``tables`` group of
+an image, one row per object of a label image named by the ``region`` of
+the table. The tables are read with zarr directly instead of anndata, so
+that only the label ids and the requested columns of ``X`` are loaded, and
+every column is read once. ``LabelIndex`` maps a label id to its row in
+constant time, also for tables with millions of objects.
+"""
+import os
+
+import numpy as np
+import zarr
+
+from ._zarr_utils import read_zattrs
+
+# Table types that hold one row per object of a label image
+FEATURE_TABLE_TYPES = ('feature_table',)
+# A dense label index may be this many times longer than the table
+MAX_DENSE_INDEX_RATIO = 4
+
+
+def find_feature_tables(zarr_url, label_name):
+    """Return the urls of the feature tables of a label image."""
+    table_urls = []
+    for table_name in read_zattrs(os.path.join(zarr_url, 'tables')).get('tables', []):
+        table_url = os.path.join(zarr_url, 'tables', table_name)
+        attrs = read_zattrs(table_url)
+        if attrs.get('type') not in FEATURE_TABLE_TYPES:
+            continue
+        # Usually '../labels/<label_name>', relative to the tables group
+        region_path = (attrs.get('region') or dict()).get('path', '')
+        if os.path.normpath(region_path).split(os.sep)[-2:] == ['labels', label_name]:
+            table_urls.append(table_url)
+    return table_urls
+
+
+def _read_index(group):
+    return np.asarray(group[group.attrs.get('_index', '_index')][:])
+
+
+class LabelIndex:
+    """Row of every label id of a table.
+
+    Compact label ids, the usual case, are looked up in an array indexed by
+    the label id, sparse ones in a dict.
+    """
+    def __init__(self, label_ids):
+        label_ids = np.asarray(label_ids, dtype=np.int64)
+        self.n_rows = len(label_ids)
+        self._rows = None
+        self._row_dict = None
+        max_label = int(label_ids.max()) if self.n_rows else -1
+        if self.n_rows and label_ids.min() >= 0 and max_label < MAX_DENSE_INDEX_RATIO * self.n_rows + 1024:
+            self._rows = np.full(max_label + 1, -1, dtype=np.int64)
+            self._rows[label_ids] = np.arange(self.n_rows)
+        else:
+            self._row_dict = {int(label): row for row, label in enumerate(label_ids)}
+
+    def get(self, label, default=None):
+        if self._rows is not None:
+            row = self._rows[label] if 0 <= label < len(self._rows) else -1
+            return default if row < 0 else int(row)
+        return self._row_dict.get(int(label), default)
+
+    def __getitem__(self, label):
+        row = self.get(label)
+        if row is None:
+            raise KeyError(label)
+        return row
+
+    def __contains__(self, label):
+        return self.get(label) is not None
+
+    def __len__(self):
+        return self.n_rows
+
+    def get_rows(self, labels):
+        """Rows of an array of label ids, -1 for labels not in the table."""
+        labels = np.asarray(labels, dtype=np.int64)
+        if self._rows is not None:
+            rows = np.full(labels.shape, -1, dtype=np.int64)
+            inside = (labels >= 0) & (labels < len(self._rows))
+            rows[inside] = self._rows[labels[inside]]
+            return rows
+        return np.array([self._row_dict.get(int(label), -1) for label in labels.ravel()],
+                        dtype=np.int64).reshape(labels.shape)
+
+
+class FeatureTable:
+    """An AnnData feature table whose columns are read on first use.
+
+    Parameters
+    ----------
+    table_url : str
+        The table group, e.g. ``<zarr_url>/tables/nuclei``.
+    """
+    def __init__(self, table_url):
+        self.table_url = table_url
+        self.name = os.path.basename(os.path.normpath(table_url))
+        self._group = zarr.open_group(table_url, mode='r')
+        if not isinstance(self._group.get('X'), zarr.Array):
+            raise ValueError(f'{table_url} has no dense X array to read features from')
+        self.columns = [str(column) for column in _read_index(self._group['var'])]
+        self._column_index = {column: i for i, column in enumerate(self.columns)}
+        self._label_ids = None
+        self._label_index = None
+        self._values = dict()
+
+    @property
+    def label_ids(self):
+        if self._label_ids is None:
+            # The instance key names the obs column of the label ids, the
+            # index holds them as strings otherwise
+            obs = self._group['obs']
+            instance_key = self._group.attrs.get('instance_key')
+            if instance_key is not None and instance_key in obs:
+                label_ids = obs[instance_key][:]
+            else:
+                label_ids = _read_index(obs)
+            self._label_ids = np.asarray(label_ids).astype(np.int64)
+        return self._label_ids
+
+    @property
+    def label_index(self):
+        if self._label_index is None:
+            self._label_index = LabelIndex(self.label_ids)
+        return self._label_index
+
+    def read_column(self, column):
+        """Return the values of one column, one per row of the table."""
+        if column not in self._values:
+            try:
+                j = self._column_index[column]
+            except KeyError:
+                raise KeyError(f'{self.name} has no column {column}') from None
+            # Only the chunks of X holding the column are read
+            self._values[column] = self._group['X'].get_orthogonal_selection((slice(None), j))
+        return self._values[column]
+
+    def get_value(self, label, column):
+        row = self.label_index.get(label)
+        return None if row is None else self.read_column(column)[row]
+
+    def get_features(self, columns=None):
+        """Return the label ids and columns as napari layer features.
+
+        Parameters
+        ----------
+        columns : list of str, optional
+            Columns to read, all by default. Columns the table does not
+            have are skipped.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The label ids in ``index``, which napari looks labels up by,
+            and one column per feature.
+        """
+        import pandas as pd
+
+        columns = self.columns if columns is None else [c for c in columns if c in self._column_index]
+        features = {'index': self.label_ids}
+        features.update((column, self.read_column(column)) for column in columns)
+        return pd.DataFrame(features)
+
+
+def merge_features(tables, columns=None):
+    """Return the features of several tables of the same labels, one row per label.
+
+    Columns that several tables have are suffixed with the table name.
+    """
+    features = None
+    for table in tables:
+        table_features = table.get_features(columns)
+        if features is None:
+            features = table_features
+        else:
+            features = features.merge(table_features, on='index', how='outer',
+                                      suffixes=(None, f' ({table.name})'))
+    return features
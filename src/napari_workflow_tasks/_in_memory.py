@@ -0,0 +1,118 @@
+"""
+Run tasks on napari layers that have no OME-Zarr on disk.
+
+Fractal tasks read their input from a ``zarr_url``, so the layer is written
+into a temporary OME-Zarr in shared memory (``/dev/shm``). The image is
+stored without compression and with one chunk per y/x plane, so handing it
+to the task process costs one memory copy and no encoding. Output label
+images are read back from there straight into a napari layer; an
+uncompressed single chunk label image is memory-mapped instead of read.
+"""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import zarr
+
+from ._preview import DEFAULT_ROI_TABLES, write_covering_roi_tables
+from ._writer import write_multiple
+from ._zarr_utils import get_label_url, get_multiscale_metadata
+
+SHARED_MEMORY_DIR = '/dev/shm'
+
+
+def get_shared_memory_dir():
+    # tmpfs is not available on every platform, fall back to a temporary dir
+    if os.path.isdir(SHARED_MEMORY_DIR) and os.access(SHARED_MEMORY_DIR, os.W_OK):
+        return SHARED_MEMORY_DIR
+    return tempfile.gettempdir()
+
+
+def write_in_memory_zarr(data, meta, roi_tables=None):
+    """Write the data of an image layer into a temporary OME-Zarr image.
+
+    Parameters
+    ----------
+    data : array-like or list of array-like
+        The layer data, of multiscale data only the highest resolution level
+        is written.
+    meta : dict
+        Layer attributes, as returned by ``Layer.as_layer_data_tuple``.
+    roi_tables : list of str, optional
+        Names of the ROI tables to write, each with a single ROI spanning
+        the image.
+
+    Returns
+    -------
+    str
+        The ``zarr_url`` of the image, remove it with ``remove_in_memory_zarr``.
+    """
+    if roi_tables is None:
+        roi_tables = DEFAULT_ROI_TABLES
+    if isinstance(data, list):
+        data = data[0]
+
+    meta = dict(meta)
+    meta.setdefault('name', 'image')
+    if data.ndim == 2 and not meta.get('rgb', False):
+        # Fractal tasks expect czyx images
+        data = data[np.newaxis]
+        meta['axis_labels'] = ['z', 'y', 'x']
+        for key, value in [('scale', 1), ('translate', 0)]:
+            if meta.get(key) is not None:
+                meta[key] = [value] + list(meta[key])
+
+    zarr_url = os.path.join(tempfile.mkdtemp(prefix='napari-workflow-tasks-', dir=get_shared_memory_dir()),
+                            'layer.zarr')
+    write_multiple(zarr_url, [(data, meta, 'image')],
+                   compressor=None, chunk_size=max(data.shape[-2:]), max_levels=1)
+
+    if roi_tables:
+        metadata = get_multiscale_metadata(zarr_url)
+        shape = zarr.open(os.path.join(zarr_url, metadata['paths'][0]), mode='r').shape
+        try:
+            write_covering_roi_tables(zarr_url, shape, metadata['scale'], roi_tables)
+        except ImportError:
+            print('anndata is not installed, the in-memory image has no ROI tables')
+    return zarr_url
+
+
+def _memmap_array(array):
+    # Only an uncompressed array in one chunk is laid out like a numpy array
+    if (array.compressor is not None or array.filters or array.order != 'C'
+            or tuple(array.chunks) != tuple(array.shape)):
+        return None
+    store_path = getattr(array.store, 'path', None)
+    if store_path is None:
+        return None
+    separator = getattr(array, '_dimension_separator', None) or '.'
+    chunk_path = os.path.join(store_path, array.path, separator.join(['0'] * array.ndim))
+    if not os.path.exists(chunk_path):
+        return None
+    # Copy-on-write, painting on the layer must not write to the file
+    return np.memmap(chunk_path, dtype=array.dtype, mode='c', shape=array.shape)
+
+
+def read_in_memory_labels(zarr_url, label_name):
+    """Read the highest resolution level of a label image into memory.
+
+    Returns
+    -------
+    data : numpy.ndarray
+        Memory-mapped if the label image is stored in a single uncompressed
+        chunk. The mapping outlives ``remove_in_memory_zarr``.
+    metadata : dict
+        See ``get_multiscale_metadata``.
+    """
+    label_url = get_label_url(zarr_url, label_name)
+    metadata = get_multiscale_metadata(label_url)
+    array = zarr.open(os.path.join(label_url, metadata['paths'][0]), mode='r')
+    data = _memmap_array(array)
+    if data is None:
+        data = array[...]
+    return data, metadata
+
+
+def remove_in_memory_zarr(zarr_url):
+    shutil.rmtree(os.path.dirname(zarr_url), ignore_errors=True)
@@ -0,0 +1,208 @@
+"""
+Write back hand edits of OME-Zarr label images chunk by chunk.
+
+napari can only paint single resolution labels held in memory or in an array
+that supports fancy indexing. ``EditableLabels`` presents the highest
+resolution level of a label image as such an array: chunks are read from the
+Zarr store when they are displayed, and kept in memory once they are painted.
+Only painted (dirty) chunks are written back by ``flush``, together with the
+matching regions of the lower resolution levels.
+"""
+import itertools
+import os
+
+import numpy as np
+import zarr
+
+from ._writer import mode_downsample
+from ._zarr_utils import get_label_url, get_multiscale_metadata
+
+
+def _is_fancy_index(key, ndim):
+    return (isinstance(key, tuple) and len(key) == ndim
+            and all(isinstance(k, (np.ndarray, list)) for k in key))
+
+
+def _normalize_basic_index(key, shape):
+    # Per axis indices of a basic selection, and the axes an int removes
+    key = key if isinstance(key, tuple) else (key,)
+    if any(k is Ellipsis for k in key):
+        i = [k is Ellipsis for k in key].index(True)
+        key = key[:i] + (slice(None),) * (len(shape) - len(key) + 1) + key[i + 1:]
+    key = key + (slice(None),) * (len(shape) - len(key))
+
+    indices = []
+    dropped = []
+    for axis, (k, n) in enumerate(zip(key, shape)):
+        if isinstance(k, slice):
+            indices.append(np.arange(*k.indices(n)))
+        else:
+            k = int(k)
+            indices.append(np.array([k + n if k < 0 else k]))
+            dropped.append(axis)
+    return indices, tuple(dropped)
+
+
+class EditableLabels:
+    """Paintable view of level 0 of a Zarr label image.
+
+    Parameters
+    ----------
+    zarr_url : str
+        OME-Zarr image the labels belong to.
+    label_name : str
+        Name of the label image in ``labels/``.
+    """
+    def __init__(self, zarr_url, label_name):
+        self.zarr_url = zarr_url
+        self.label_name = label_name
+        self.label_url = get_label_url(zarr_url, label_name)
+        self.level_paths = get_multiscale_metadata(self.label_url)['paths']
+        self.array = zarr.open(os.path.join(self.label_url, self.level_paths[0]), mode='r+')
+
+        # Chunks that were painted, by chunk grid position
+        self._chunks = dict()
+        self.dirty = set()
+
+    @property
+    def shape(self):
+        return self.array.shape
+
+    @property
+    def dtype(self):
+        return self.array.dtype
+
+    @property
+    def ndim(self):
+        return self.array.ndim
+
+    @property
+    def size(self):
+        return self.array.size
+
+    @property
+    def chunks(self):
+        return self.array.chunks
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[...]
+        return data if dtype is None else data.astype(dtype)
+
+    def _chunk_slices(self, position):
+        return tuple(slice(p * c, min((p + 1) * c, n)) for p, c, n in zip(position, self.chunks, self.shape))
+
+    def _read_chunk(self, position):
+        if position in self._chunks:
+            return self._chunks[position]
+        return self.array[self._chunk_slices(position)]
+
+    def _edit_chunk(self, position):
+        if position not in self._chunks:
+            self._chunks[position] = self.array[self._chunk_slices(position)]
+        return self._chunks[position]
+
+    def _group_by_chunk(self, indices):
+        # Map every chunk touched by the point indices to the points in it
+        positions = np.stack([np.asarray(i) // c for i, c in zip(indices, self.chunks)], axis=-1)
+        unique, inverse = np.unique(positions.reshape(-1, self.ndim), axis=0, return_inverse=True)
+        for i, position in enumerate(unique):
+            yield tuple(int(p) for p in position), np.flatnonzero(inverse.ravel() == i)
+
+    def _group_orthogonal_by_chunk(self, indices):
+        per_axis = []
+        for index, chunk_size in zip(indices, self.chunks):
+            positions = index // chunk_size
+            per_axis.append([(int(p), np.flatnonzero(positions == p)) for p in np.unique(positions)])
+        for combination in itertools.product(*per_axis):
+            yield tuple(p for p, _ in combination), tuple(selected for _, selected in combination)
+
+    def __getitem__(self, key):
+        if _is_fancy_index(key, self.ndim):
+            indices = [np.asarray(k) for k in key]
+            out = np.empty(np.broadcast(*indices).shape, dtype=self.dtype)
+            flat = [np.broadcast_to(i, out.shape).ravel() for i in indices]
+            out_flat = out.reshape(-1)
+            for position, points in self._group_by_chunk(flat):
+                chunk = self._read_chunk(position)
+                out_flat[points] = chunk[tuple(i[points] - p * c for i, p, c in zip(flat, position, self.chunks))]
+            return out
+
+        indices, dropped = _normalize_basic_index(key, self.shape)
+        out = np.empty([len(i) for i in indices], dtype=self.dtype)
+        for position, selected in self._group_orthogonal_by_chunk(indices):
+            chunk = self._read_chunk(position)
+            chunk_index = tuple(i[s] - p * c for i, s, p, c in zip(indices, selected, position, self.chunks))
+            out[np.ix_(*selected)] = chunk[np.ix_(*chunk_index)]
+        return out.reshape([n for axis, n in enumerate(out.shape) if axis not in dropped]) if dropped else out
+
+    def __setitem__(self, key, value):
+        if _is_fancy_index(key, self.ndim):
+            indices = [np.asarray(k) for k in key]
+            shape = np.broadcast(*indices).shape
+            flat = [np.broadcast_to(i, shape).ravel() for i in indices]
+            values = np.broadcast_to(np.asarray(value, dtype=self.dtype), shape).ravel()
+            for position, points in self._group_by_chunk(flat):
+                chunk = self._edit_chunk(position)
+                chunk[tuple(i[points] - p * c for i, p, c in zip(flat, position, self.chunks))] = values[points]
+                self.dirty.add(position)
+            return
+
+        indices, dropped = _normalize_basic_index(key, self.shape)
+        values = np.asarray(value, dtype=self.dtype)
+        if dropped and values.ndim > 0:
+            values = np.expand_dims(values, dropped)
+        values = np.broadcast_to(values, [len(i) for i in indices])
+        for position, selected in self._group_orthogonal_by_chunk(indices):
+            chunk = self._edit_chunk(position)
+            chunk_index = tuple(i[s] - p * c for i, s, p, c in zip(indices, selected, position, self.chunks))
+            chunk[np.ix_(*chunk_index)] = values[np.ix_(*selected)]
+            self.dirty.add(position)
+
+    def flush(self):
+        """Write the painted chunks and the matching pyramid regions to disk.
+
+        Returns
+        -------
+        list of str
+            Paths of the Zarr arrays that were written.
+        """
+        if not self.dirty:
+            return []
+
+        regions = []
+        for position in sorted(self.dirty):
+            region = self._chunk_slices(position)
+            self.array[region] = self._chunks[position]
+            regions.append([(s.start, s.stop) for s in region])
+        # Painted chunks stay cached, they may be painted again
+        self.dirty = set()
+
+        written_paths = [os.path.join(self.label_url, self.level_paths[0])]
+        source = self.array
+        for path in self.level_paths[1:]:
+            target = zarr.open(os.path.join(self.label_url, path), mode='r+')
+            factors = [max(1, round(n / m)) for n, m in zip(source.shape, target.shape)]
+            # The region of this level covering the edits of the level above
+            regions = [[(start // f, min(-(-stop // f), m)) for (start, stop), f, m in zip(region, factors, target.shape)]
+                       for region in regions]
+            for region in regions:
+                _downsample_region(source, target, region, factors)
+            written_paths.append(os.path.join(self.label_url, path))
+            source = target
+        return written_paths
+
+
+def _downsample_region(source, target, region, factors):
+    # Recompute ``region`` of ``target`` from the blocks of ``source`` it covers
+    if any(start >= stop for start, stop in region):
+        return
+    block = source[tuple(slice(start * f, stop * f) for (start, stop), f in zip(region, factors))]
+    shape = []
+    for n, f in zip(block.shape, factors):
+        shape.extend([n // f, f])
+    block = block.reshape(shape)
+    target[tuple(slice(start, stop) for start, stop in region)] = mode_downsample(
+        block, axis=tuple(range(1, len(shape), 2)))
@@ -0,0 +1,163 @@
+"""
+Persistent, searchable index of the tasks of Fractal task package manifests.
+
+Parsing a large manifest and resolving the argument schema of every task is
+only done once per manifest version: the parsed task summaries and schemas
+are cached on disk keyed by the manifest path, size and mtime. Loading a
+package reads the small summary only; the schema of a task is read when it
+is needed, i.e. when its tab is opened.
+"""
+import hashlib
+import json
+import os
+import threading
+
+# Bump to invalidate caches written by older versions of this module
+INDEX_VERSION = 2
+SUMMARY_KEYS = ('name', 'category', 'executable_parallel', 'modality', 'tags')
+
+
+def get_default_index_dir():
+    cache_home = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(cache_home, 'napari-workflow-tasks', 'manifests')
+
+
+class ManifestIndex:
+    """Index of the tasks of every loaded task package.
+
+    Parameters
+    ----------
+    index_dir : str, optional
+        Where parsed manifests are cached, see ``get_default_index_dir``.
+    """
+    def __init__(self, index_dir=None):
+        self.index_dir = get_default_index_dir() if index_dir is None else index_dir
+        os.makedirs(self.index_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        # path_to_manifest -> list of task summaries
+        self._packages = dict()
+        # (path_to_manifest, task name) -> args_schema_parallel
+        self._schemas = dict()
+
+    def _cache_stem(self, path_to_manifest):
+        digest = hashlib.sha256(path_to_manifest.encode()).hexdigest()[:32]
+        return os.path.join(self.index_dir, digest)
+
+    @staticmethod
+    def _manifest_version(path_to_manifest):
+        stat = os.stat(path_to_manifest)
+        return [INDEX_VERSION, stat.st_size, stat.st_mtime_ns]
+
+    def _read_cached_summary(self, path_to_manifest):
+        path_to_summary = self._cache_stem(path_to_manifest) + '.json'
+        if not os.path.exists(path_to_summary):
+            return None
+        try:
+            with open(path_to_summary) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if cached.get('version') != self._manifest_version(path_to_manifest):
+            return None
+        return cached['tasks']
+
+    def _parse_manifest(self, path_to_manifest):
+        with open(path_to_manifest) as f:
+            manifest = json.load(f)
+
+        tasks = []
+        schemas = dict()
+        for task in manifest.get('task_list', []):
+            # Tasks without a parallel part cannot be run on a single image
+            if 'executable_parallel' not in task or 'args_schema_parallel' not in task:
+                continue
+            tasks.append({key: task.get(key) for key in SUMMARY_KEYS})
+            schemas[task['name']] = task['args_schema_parallel']
+
+        stem = self._cache_stem(path_to_manifest)
+        version = self._manifest_version(path_to_manifest)
+        with open(stem + '.schemas.json', 'w') as f:
+            json.dump(dict(version=version, schemas=schemas), f)
+        # Schemas were pickled before version 2
+        if os.path.exists(stem + '.pickle'):
+            os.remove(stem + '.pickle')
+        # The summary is written last, it marks the cache entry as complete
+        with open(stem + '.json', 'w') as f:
+            json.dump(dict(version=version, path=path_to_manifest, tasks=tasks), f)
+
+        with self._lock:
+            for name, schema in schemas.items():
+                self._schemas[(path_to_manifest, name)] = schema
+        return tasks
+
+    def load(self, path_to_manifest):
+        """Add a task package and return the summaries of its tasks.
+
+        Each summary holds the ``name``, ``category``, ``executable_parallel``,
+        ``modality`` and ``tags`` of a task.
+        """
+        path_to_manifest = os.path.abspath(path_to_manifest)
+        tasks = self._read_cached_summary(path_to_manifest)
+        if tasks is None:
+            print(f'Indexing task package {path_to_manifest}')
+            tasks = self._parse_manifest(path_to_manifest)
+
+        with self._lock:
+            self._packages[path_to_manifest] = tasks
+        return tasks
+
+    def get_schema(self, path_to_manifest, name):
+        """Return the ``args_schema_parallel`` of a task of a loaded package."""
+        path_to_manifest = os.path.abspath(path_to_manifest)
+        key = (path_to_manifest, name)
+        if key not in self._schemas:
+            schemas = None
+            path_to_schemas = self._cache_stem(path_to_manifest) + '.schemas.json'
+            try:
+                with open(path_to_schemas) as f:
+                    cached = json.load(f)
+                if cached.get('version') == self._manifest_version(path_to_manifest):
+                    schemas = cached['schemas']
+            except (OSError, ValueError):
+                pass
+            if schemas is None:
+                self._parse_manifest(path_to_manifest)
+            else:
+                with self._lock:
+                    for task_name, schema in schemas.items():
+                        self._schemas[(path_to_manifest, task_name)] = schema
+        return self._schemas[key]
+
+    @property
+    def packages(self):
+        return list(self._packages.keys())
+
+    def search(self, query='', categories=None):
+        """Find tasks of all loaded packages by name, category or tag.
+
+        Returns
+        -------
+        list of tuple
+            ``(path_to_manifest, summary)`` of every matching task.
+        """
+        query = query.lower().strip()
+        matches = []
+        for path_to_manifest, tasks in self._packages.items():
+            for task in tasks:
+                if categories is not None and task.get('category') not in categories:
+                    continue
+                haystack = [task['name'], task.get('category') or '', *(task.get('tags') or [])]
+                if query in ' '.join(haystack).lower():
+                    matches.append((path_to_manifest, task))
+        return matches
+
+    def get_recent_packages(self):
+        path_to_recent = os.path.join(self.index_dir, 'recent.json')
+        if not os.path.exists(path_to_recent):
+            return []
+        with open(path_to_recent) as f:
+            return [path for path in json.load(f) if os.path.exists(path)]
+
+    def save_recent_packages(self):
+        with open(os.path.join(self.index_dir, 'recent.json'), 'w') as f:
+            json.dump(self.packages, f)
@@ -0,0 +1,218 @@
+"""
+Estimate the peak memory of a job before it runs.
+
+The estimate is the input a task holds at once times a factor for the task,
+plus the memory of the worker process. Fractal tasks process an image ROI by
+ROI, so the input is the largest ROI of the input ROI table, rounded up to
+whole chunks, of the pyramid level and channel the task reads. The scheduler
+only starts a job if its estimate fits the memory budget next to the jobs
+that are running, see ``TaskScheduler.memory_budget``.
+"""
+import os
+
+import numpy as np
+import zarr
+
+from ._preview import read_roi_table
+from ._tiling import DEFAULT_HALO
+from ._zarr_utils import get_multiscale_metadata
+
+GIB = 2 ** 30
+# (multiple of the input, fixed bytes) a task needs, e.g. for its model
+TASK_MEMORY = {
+    'Cellpose Segmentation': (10, 1.5 * GIB),
+    'Thresholding Label Task': (3, 0),
+}
+DEFAULT_TASK_MEMORY = (4, 0)
+# Python, numpy, zarr and the task package in a worker process
+WORKER_BYTES = 200 * 2 ** 20
+# Share of the available memory jobs may use by default
+MEMORY_BUDGET_FRACTION = 0.8
+# ROI tables that split an image into small parts, smallest first
+ROI_WISE_TABLES = ['FOV_ROI_table', 'well_ROI_table']
+SUGGESTED_TILE_SIZES = [4096, 2048, 1024, 512]
+# Workers are never recycled for keeping less than this after a job
+MIN_WORKER_MEMORY_LIMIT = 2 * GIB
+
+
+def format_gib(n_bytes):
+    return f'{n_bytes / GIB:.1f} GiB'
+
+
+def get_default_memory_budget():
+    """Return a share of the memory available now, None if it is unknown."""
+    try:
+        import psutil
+        available = psutil.virtual_memory().available
+    except ImportError:
+        try:
+            available = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+        except (AttributeError, ValueError, OSError):
+            return None
+    return int(available * MEMORY_BUDGET_FRACTION)
+
+
+def get_worker_memory_limit(memory_budget, n_workers):
+    """Return the memory above which a worker is recycled after a job.
+
+    A worker keeping more than its share of the memory budget while it is
+    idle takes memory the jobs of the other workers were admitted with.
+    None without a memory budget.
+    """
+    if memory_budget is None:
+        return None
+    return max(int(memory_budget // max(1, n_workers)), MIN_WORKER_MEMORY_LIMIT)
+
+
+def _get_largest_roi_yx(zarr_url, table_name, pixel_size_yx, factors_yx, chunks_yx):
+    # Extent of the chunks the largest ROI touches, in pixels of the level
+    try:
+        roi_table = read_roi_table(zarr_url, table_name)
+    except (KeyError, OSError, ValueError):
+        return None
+    if len(roi_table['label']) == 0:
+        return None
+    region_yx = []
+    for axis, pixel_size, factor, chunk in zip('yx', pixel_size_yx, factors_yx, chunks_yx):
+        start = roi_table[f'{axis}_micrometer'] / pixel_size * factor
+        stop = start + roi_table[f'len_{axis}_micrometer'] / pixel_size * factor
+        n_chunks = np.ceil(np.round(stop, 6) / chunk) - np.floor(np.round(start, 6) / chunk)
+        region_yx.append(int(np.max(n_chunks)) * chunk)
+    return region_yx
+
+
+def estimate_task_memory(zarr_url, task_name, task_args, region_yx=None):
+    """Estimate the peak memory of one task run on an OME-Zarr image.
+
+    Parameters
+    ----------
+    task_args : dict
+        ``level``, ``channel`` and ``input_ROI_table`` are taken into
+        account if the task has them.
+    region_yx : tuple of float, optional
+        Size in level 0 pixels of the region the task processes at once,
+        anywhere in the image. The largest ROI of the input ROI table, or
+        the whole image, by default.
+
+    Returns
+    -------
+    dict
+        The estimate in ``bytes``, the ``input_bytes`` held at once, the
+        ``level``, the ``roi_table`` it is based on and the ``region_yx``
+        in pixels of the level.
+    """
+    metadata = get_multiscale_metadata(zarr_url)
+    paths = metadata['paths']
+    level = task_args.get('level')
+    level = max(0, min(level, len(paths) - 1)) if isinstance(level, int) else 0
+    full_shape = zarr.open(os.path.join(zarr_url, paths[0]), mode='r').shape
+    array = zarr.open(os.path.join(zarr_url, paths[level]), mode='r')
+    shape = list(array.shape)
+    factors_yx = [size / full_size for size, full_size in zip(shape[-2:], full_shape[-2:])]
+
+    axes = metadata['axes'] or []
+    if 'c' in axes and task_args.get('channel') is not None:
+        # Tasks given a channel only read that one
+        shape[axes.index('c')] = 1
+
+    chunks_yx = array.chunks[-2:]
+    roi_table = task_args.get('input_ROI_table')
+    roi_table = roi_table if isinstance(roi_table, str) else None
+    level_region_yx = None
+    if region_yx is not None:
+        # Whole chunks are read, and the region may straddle chunk borders
+        level_region_yx = [(int(np.ceil(size * factor / chunk)) + 1) * chunk
+                           for size, factor, chunk in zip(region_yx, factors_yx, chunks_yx)]
+    elif roi_table is not None and metadata['scale'] is not None:
+        level_region_yx = _get_largest_roi_yx(zarr_url, roi_table, metadata['scale'][-2:],
+                                              factors_yx, chunks_yx)
+    if region_yx is not None or level_region_yx is None:
+        roi_table = None
+    if level_region_yx is not None:
+        shape[-2:] = [min(size, region_size) for size, region_size in zip(shape[-2:], level_region_yx)]
+
+    input_bytes = int(np.prod(shape)) * array.dtype.itemsize
+    factor, fixed_bytes = TASK_MEMORY.get(task_name, DEFAULT_TASK_MEMORY)
+    return dict(bytes=int(input_bytes * factor + fixed_bytes + WORKER_BYTES),
+                input_bytes=input_bytes,
+                level=level,
+                roi_table=roi_table,
+                region_yx=tuple(shape[-2:]))
+
+
+def estimate_job_memory(job):
+    """Estimate the peak memory of a scheduler job, None if unknown.
+
+    Pipelines need as much as their largest step, tiled jobs as much as
+    their tiles, or ROIs, running at once.
+    """
+    zarr_url = job.task_args.get('zarr_url')
+    if zarr_url is None:
+        return None
+    try:
+        if 'pipeline' in job.context:
+            return max(estimate_task_memory(zarr_url, step['task_name'], step['task_args'])['bytes']
+                       for step in job.context['pipeline'])
+        if 'tiling' in job.context:
+            tiling = job.context['tiling']
+            if tiling.get('roi_table') is not None:
+                estimate = estimate_task_memory(zarr_url, job.task_name,
+                                                dict(job.task_args, input_ROI_table=tiling['roi_table']))
+                return estimate['bytes'] * tiling['n_parallel']
+            tile_yx = (tiling['tile_size'] + 2 * tiling['halo'],) * 2
+            estimate = estimate_task_memory(zarr_url, job.task_name, job.task_args, region_yx=tile_yx)
+            return estimate['bytes'] * tiling['n_parallel']
+        return estimate_task_memory(zarr_url, job.task_name, job.task_args)['bytes']
+    except (KeyError, OSError, ValueError):
+        return None
+
+
+def suggest_alternatives(zarr_url, task_name, task_args, budget):
+    """Return ways to run a task that does not fit the budget within it."""
+    suggestions = []
+    estimate = estimate_task_memory(zarr_url, task_name, task_args)
+    n_levels = len(get_multiscale_metadata(zarr_url)['paths'])
+    if 'level' in task_args:
+        for level in range(estimate['level'] + 1, n_levels):
+            level_estimate = estimate_task_memory(zarr_url, task_name, dict(task_args, level=level))
+            if level_estimate['bytes'] <= budget:
+                suggestions.append(f'run on pyramid level {level} (about {format_gib(level_estimate["bytes"])})')
+                break
+
+    if 'input_ROI_table' in task_args:
+        for table_name in ROI_WISE_TABLES:
+            if table_name == estimate['roi_table']:
+                break
+            roi_estimate = estimate_task_memory(zarr_url, task_name, dict(task_args, input_ROI_table=table_name))
+            if roi_estimate['roi_table'] == table_name and roi_estimate['bytes'] <= budget:
+                suggestions.append(f'process ROI-wise with input_ROI_table {table_name} '
+                                   f'(about {format_gib(roi_estimate["bytes"])})')
+                break
+
+    for tile_size in SUGGESTED_TILE_SIZES:
+        if tile_size >= max(estimate['region_yx']):
+            continue
+        tile_estimate = estimate_task_memory(zarr_url, task_name, task_args,
+                                             region_yx=(tile_size + 2 * DEFAULT_HALO,) * 2)
+        if tile_estimate['bytes'] <= budget:
+            suggestions.append(f'split the image into tiles of {tile_size} '
+                               f'(about {format_gib(tile_estimate["bytes"])} per tile)')
+            break
+    return suggestions
+
+
+def get_memory_warning(job, budget):
+    """Return a warning if a job alone exceeds the budget, None otherwise."""
+    if budget is None or job.memory is None or job.memory <= budget:
+        return None
+    message = (f'Job {job.job_id} ({job.task_name}) may need {format_gib(job.memory)}, more than the memory '
+               f'budget of {format_gib(budget)}. It only runs once no other job is running.')
+    if 'pipeline' in job.context or 'tiling' in job.context:
+        return message
+    try:
+        suggestions = suggest_alternatives(job.task_args['zarr_url'], job.task_name, job.task_args, budget)
+    except (KeyError, OSError, ValueError):
+        suggestions = []
+    if suggestions:
+        message += ' To stay within it, ' + ', or '.join(suggestions) + '.'
+    return message
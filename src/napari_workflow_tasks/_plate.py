@@ -0,0 +1,52 @@
+"""
+Helpers to find the images of an OME-Zarr HCS plate.
+
+Only the ``.zattrs`` metadata of the plate and its wells is read, so
+listing a 384-well plate does not touch any image data.
+"""
+import os
+
+from ._zarr_utils import read_zattrs
+
+
+def is_plate(zarr_url):
+    return 'plate' in read_zattrs(zarr_url)
+
+
+def get_plate_url(zarr_url):
+    """Return the plate containing ``zarr_url`` or None.
+
+    ``zarr_url`` may be the plate itself, a well or an image of a well.
+    """
+    zarr_url = os.path.normpath(zarr_url)
+    # An image sits at most two levels (row/column) plus itself below the plate
+    for _ in range(4):
+        if is_plate(zarr_url):
+            return zarr_url
+        parent = os.path.dirname(zarr_url)
+        if parent == zarr_url:
+            break
+        zarr_url = parent
+    return None
+
+
+def find_image_zarr_urls(plate_url):
+    """List the ``zarr_url`` of every image in every well of a plate.
+
+    Returns
+    -------
+    list of tuple
+        ``(well_path, zarr_url)`` pairs in plate order, e.g.
+        ``('B/03', '/data/plate.zarr/B/03/0')``.
+    """
+    plate = read_zattrs(plate_url).get('plate')
+    if plate is None:
+        raise ValueError(f'{plate_url} is not an OME-Zarr plate')
+
+    image_urls = []
+    for well in plate.get('wells', []):
+        well_url = os.path.join(plate_url, well['path'])
+        images = read_zattrs(well_url).get('well', dict()).get('images', [])
+        for image in images:
+            image_urls.append((well['path'], os.path.join(well_url, image['path'])))
+    return image_urls
@@ -0,0 +1,263 @@
+"""
+Crop a region of an OME-Zarr image into a small temporary OME-Zarr.
+
+Running a task on the crop instead of the full image gives a preview of its
+output within seconds, which makes tuning task parameters interactive. The
+region can be the current viewport, a rectangle of a Shapes layer or a
+single ROI of one of the image's ROI tables. For an even faster preview the
+crop can be taken from a coarser level of the image pyramid.
+"""
+import os
+import tempfile
+
+import numpy as np
+import zarr
+
+from ._zarr_utils import get_multiscale_metadata, read_zattrs
+
+# Largest extent in pixels along y and x of a preview crop
+PREVIEW_MAX_SIZE = 2048
+# ROI tables written into the crop, covering the whole crop
+DEFAULT_ROI_TABLES = ['FOV_ROI_table', 'well_ROI_table']
+ROI_TABLE_COLUMNS = ['x_micrometer', 'y_micrometer', 'z_micrometer',
+                     'len_x_micrometer', 'len_y_micrometer', 'len_z_micrometer']
+
+
+def _clip_bbox(y_start, y_stop, x_start, x_stop, shape_yx, max_size=PREVIEW_MAX_SIZE):
+    bbox = []
+    for start, stop, size in [(y_start, y_stop, shape_yx[0]), (x_start, x_stop, shape_yx[1])]:
+        start, stop = int(np.floor(start)), int(np.ceil(stop))
+        # Shrink oversized regions around their centre
+        if max_size is not None and stop - start > max_size:
+            centre = (start + stop) // 2
+            start, stop = centre - max_size // 2, centre + max_size // 2
+        start, stop = max(0, start), min(size, stop)
+        if stop <= start:
+            raise ValueError('The preview region does not overlap the image')
+        bbox.extend([start, stop])
+    return tuple(bbox)
+
+
+def _get_level0_shape_yx(zarr_url):
+    metadata = get_multiscale_metadata(zarr_url)
+    return zarr.open(os.path.join(zarr_url, metadata['paths'][0]), mode='r').shape[-2:]
+
+
+def _get_camera(viewer):
+    # napari 0.9 moved the camera to the scene, viewer.camera is deprecated
+    scene = getattr(viewer, 'scene', None)
+    return viewer.camera if scene is None else scene.camera
+
+
+def get_viewport_bbox(viewer, layer, zarr_url, canvas_size=None):
+    """Return the (y_start, y_stop, x_start, x_stop) level 0 pixels on screen.
+
+    Parameters
+    ----------
+    canvas_size : tuple of int, optional
+        (height, width) of the canvas in screen pixels, by default the size
+        of ``viewer.canvas``, which napari has since 0.9.
+    """
+    if canvas_size is None:
+        if getattr(viewer, 'canvas', None) is None:
+            raise ValueError('The canvas size is unknown in this version of napari')
+        canvas_size = viewer.canvas.size
+    camera = _get_camera(viewer)
+    centre = np.asarray(camera.center)
+    half_extent = np.asarray(canvas_size) / camera.zoom / 2
+
+    # The camera centre covers the displayed dimensions only
+    world_min = np.array(viewer.dims.point, dtype=float)
+    world_max = np.array(viewer.dims.point, dtype=float)
+    world_min[-2:] = centre[-2:] - half_extent
+    world_max[-2:] = centre[-2:] + half_extent
+
+    data_min = np.asarray(layer.world_to_data(world_min))[-2:]
+    data_max = np.asarray(layer.world_to_data(world_max))[-2:]
+    return _clip_bbox(data_min[0], data_max[0], data_min[1], data_max[1],
+                      _get_level0_shape_yx(zarr_url))
+
+
+def get_shapes_bbox(shapes_layer, layer, zarr_url):
+    """Return the level 0 pixel bounding box of a shape in a Shapes layer.
+
+    The first selected shape is used, or the last one drawn if none is
+    selected.
+    """
+    if len(shapes_layer.data) == 0:
+        raise ValueError(f'Shapes layer {shapes_layer.name} is empty')
+    selected = sorted(shapes_layer.selected_data)
+    vertices = shapes_layer.data[selected[0] if selected else -1]
+
+    data_vertices = np.array([layer.world_to_data(shapes_layer.data_to_world(vertex))
+                              for vertex in vertices])[:, -2:]
+    y_start, x_start = data_vertices.min(axis=0)
+    y_stop, x_stop = data_vertices.max(axis=0)
+    return _clip_bbox(y_start, y_stop, x_start, x_stop, _get_level0_shape_yx(zarr_url))
+
+
+def read_roi_table(zarr_url, table_name):
+    """Read an AnnData ROI table of an OME-Zarr image.
+
+    Returns
+    -------
+    dict
+        Maps each column name, and ``label`` for the ROI names, to a numpy
+        array with one entry per ROI.
+    """
+    table = zarr.open_group(os.path.join(zarr_url, 'tables', table_name), mode='r')
+    columns = list(table['var'][table['var'].attrs.get('_index', '_index')][:])
+    values = table['X'][:]
+    roi_table = {column: values[:, i] for i, column in enumerate(columns)}
+    roi_table['label'] = np.asarray(table['obs'][table['obs'].attrs.get('_index', '_index')][:])
+    return roi_table
+
+
+def get_roi_bbox(zarr_url, table_name, roi_index):
+    """Return the level 0 pixel bounding box of one ROI of a ROI table."""
+    roi_table = read_roi_table(zarr_url, table_name)
+    n_rois = len(roi_table['label'])
+    if not 0 <= roi_index < n_rois:
+        raise ValueError(f'{table_name} has {n_rois} ROIs, got ROI index {roi_index}')
+
+    pixel_size_y, pixel_size_x = get_multiscale_metadata(zarr_url)['scale'][-2:]
+    y_start = roi_table['y_micrometer'][roi_index] / pixel_size_y
+    x_start = roi_table['x_micrometer'][roi_index] / pixel_size_x
+    y_stop = y_start + roi_table['len_y_micrometer'][roi_index] / pixel_size_y
+    x_stop = x_start + roi_table['len_x_micrometer'][roi_index] / pixel_size_x
+    # A ROI is processed as a whole, so it is not shrunk
+    return _clip_bbox(y_start, y_stop, x_start, x_stop,
+                      _get_level0_shape_yx(zarr_url), max_size=None)
+
+
+def write_roi_table(zarr_url, table_name, roi_values):
+    """Write a ROI table in the AnnData format the Fractal tasks read.
+
+    Parameters
+    ----------
+    roi_values : array-like
+        One row per ROI with the values of ``ROI_TABLE_COLUMNS``.
+    """
+    import anndata as ad
+    import pandas as pd
+
+    roi_values = np.asarray(roi_values, dtype=np.float32)
+    adata = ad.AnnData(X=roi_values,
+                       obs=pd.DataFrame(index=[str(i) for i in range(len(roi_values))]),
+                       var=pd.DataFrame(index=ROI_TABLE_COLUMNS))
+    table_url = os.path.join(zarr_url, 'tables', table_name)
+    adata.write_zarr(table_url)
+
+    zarr.open_group(table_url, mode='a').attrs.update(type='roi_table',
+                                                     fractal_table_version='1')
+    tables = zarr.open_group(os.path.join(zarr_url, 'tables'), mode='a')
+    tables.attrs['tables'] = sorted(set(tables.attrs.get('tables', [])) | {table_name})
+
+
+def write_covering_roi_tables(zarr_url, shape, scale, roi_tables):
+    """Write ROI tables with a single ROI spanning the whole image.
+
+    Parameters
+    ----------
+    shape : tuple of int
+        Shape of the full resolution level.
+    scale : sequence of float or None
+        Pixel sizes of the full resolution level.
+    """
+    scale = scale or [1] * len(shape)
+    pixel_size_y, pixel_size_x = scale[-2:]
+    pixel_size_z = scale[-3] if len(shape) >= 3 else 1
+    n_z = shape[-3] if len(shape) >= 3 else 1
+    roi = [0, 0, 0,
+           shape[-1] * pixel_size_x,
+           shape[-2] * pixel_size_y,
+           n_z * pixel_size_z]
+    for table_name in roi_tables:
+        write_roi_table(zarr_url, table_name, [roi])
+
+
+def get_level_bbox(zarr_url, bbox, level):
+    """Return a level 0 pixel bounding box in the pixels of a pyramid level.
+
+    Returns
+    -------
+    level : int
+        The level, at most the coarsest level of the image.
+    bbox : tuple of int
+        ``(y_start, y_stop, x_start, x_stop)`` covering at least the box.
+    """
+    paths = get_multiscale_metadata(zarr_url)['paths']
+    level = max(0, min(level, len(paths) - 1))
+    if level == 0:
+        return level, tuple(bbox)
+
+    full_shape = zarr.open(os.path.join(zarr_url, paths[0]), mode='r').shape[-2:]
+    level_shape = zarr.open(os.path.join(zarr_url, paths[level]), mode='r').shape[-2:]
+    level_bbox = []
+    for start, stop, size, full_size in zip(bbox[::2], bbox[1::2], level_shape, full_shape):
+        factor = size / full_size
+        start = int(np.floor(start * factor))
+        stop = min(size, max(start + 1, int(np.ceil(stop * factor))))
+        level_bbox.extend([start, stop])
+    return level, tuple(level_bbox)
+
+
+def write_cropped_zarr(zarr_url, bbox, out_url=None, roi_tables=None, level=0):
+    """Copy a y/x region of a pyramid level into a new OME-Zarr.
+
+    Parameters
+    ----------
+    zarr_url : str
+        Source OME-Zarr image.
+    bbox : tuple of int
+        ``(y_start, y_stop, x_start, x_stop)`` in level 0 pixels.
+    out_url : str, optional
+        Where to write the crop, a new temporary directory by default.
+    roi_tables : list of str, optional
+        Names of the ROI tables to write, each with a single ROI spanning
+        the crop.
+    level : int
+        Pyramid level to crop, it becomes the full resolution level of the
+        crop. See ``get_level_bbox`` for the region it covers.
+
+    Returns
+    -------
+    str
+        The ``zarr_url`` of the crop.
+    """
+    if out_url is None:
+        out_url = os.path.join(tempfile.mkdtemp(prefix='napari-workflow-tasks-'), 'preview.zarr')
+    if roi_tables is None:
+        roi_tables = DEFAULT_ROI_TABLES
+
+    level, (y_start, y_stop, x_start, x_stop) = get_level_bbox(zarr_url, bbox, level)
+    attrs = read_zattrs(zarr_url)
+    metadata = get_multiscale_metadata(zarr_url)
+    source = zarr.open(os.path.join(zarr_url, metadata['paths'][level]), mode='r')
+    index = (slice(None),) * (source.ndim - 2) + (slice(y_start, y_stop), slice(x_start, x_stop))
+
+    out = zarr.open_group(out_url, mode='w')
+    out.create_dataset(metadata['paths'][0],
+                       data=source[index],
+                       chunks=source.chunks,
+                       compressor=source.compressor,
+                       dimension_separator=getattr(source, '_dimension_separator', None))
+
+    # Only the cropped level is part of the crop, under the path of level 0
+    datasets = attrs['multiscales'][0]['datasets']
+    attrs['multiscales'][0]['datasets'] = [dict(datasets[level], path=datasets[0]['path'])]
+    out.attrs.update(attrs)
+
+    if roi_tables:
+        shape = source.shape[:-2] + (y_stop - y_start, x_stop - x_start)
+        scale = metadata['scale']
+        if scale is not None and level > 0:
+            full_shape = zarr.open(os.path.join(zarr_url, metadata['paths'][0]), mode='r').shape
+            scale = list(scale[:-2]) + [pixel_size * full_size / size for pixel_size, full_size, size
+                                        in zip(scale[-2:], full_shape[-2:], source.shape[-2:])]
+        try:
+            write_covering_roi_tables(out_url, shape, scale, roi_tables)
+        except ImportError:
+            print('anndata is not installed, the preview crop has no ROI tables')
+
+    return out_url
@@ -4,8 +4,23 @@ This module is an example of a barebones numpy reader plugin for napari.
 It implements the Reader specification, but your plugin may choose to
 implement multiple readers or even other plugin contributions. see:
 https://napari.org/stable/plugins/guides.html?#readers
+
+Files are not read when they are opened: only the ``.npy`` headers are parsed
+and the stack is returned as a lazy dask array with one chunk per file, whose
+chunks memory-map their file when napari displays them.
+
+OME-Zarr images are returned as one multiscale layer per channel plus one
+per label image. The ``zarr_url``, the channel and the label name are stored
+in ``layer.metadata``, so that the widget knows which image a layer shows.
 """
+import os
+
+import dask.array as da
 import numpy as np
+from dask.base import tokenize
+from dask.highlevelgraph import HighLevelGraph
+
+from ._zarr_utils import load_labels, load_multiscale, read_zattrs
 
 
 def napari_get_reader(path):
@@ -28,6 +43,9 @@ def napari_get_reader(path):
         # so we are only going to look at the first file.
         path = path[0]
 
+    if is_ome_zarr_image(path):
+        return ome_zarr_reader_function
+
     # if we know we cannot read the file, we immediately return None.
     if not path.endswith(".npy"):
         return None
@@ -60,13 +78,173 @@ def reader_function(path):
     """
     # handle both a string and a list of strings
     paths = [path] if isinstance(path, str) else path
-    # load all files into array
-    arrays = [np.load(_path) for _path in paths]
-    # stack arrays into single array
-    data = np.squeeze(np.stack(arrays))
+    # stack the files lazily, without reading any data
+    data = da.squeeze(load_npy_stack(paths))
 
     # optional kwargs for the corresponding viewer.add_* method
     add_kwargs = {}
 
     layer_type = "image"  # optional, default is "image"
     return [(data, add_kwargs, layer_type)]
+
+
+def read_npy_header(path):
+    """Return the shape and dtype of a ``.npy`` file without reading its data."""
+    with open(path, 'rb') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+    return shape, dtype
+
+
+def _load_npy(path, dtype):
+    # One chunk of the stack: the memory-mapped file with a leading axis
+    data = np.load(path, mmap_mode='r')
+    if data.dtype != dtype:
+        data = data.astype(dtype)
+    return data[np.newaxis]
+
+
+def load_npy_stack(paths):
+    """Stack ``.npy`` files along a new first axis as a lazy dask array.
+
+    Raises
+    ------
+    ValueError
+        If the files do not all have the same shape.
+    """
+    shapes = []
+    dtypes = []
+    for path in paths:
+        shape, dtype = read_npy_header(path)
+        if shapes and shape != shapes[0]:
+            raise ValueError(f'{path} has shape {shape}, expected {shapes[0]} like {paths[0]}')
+        shapes.append(shape)
+        dtypes.append(dtype)
+    # Like np.stack, mixed dtypes are promoted to a common one
+    dtype = np.result_type(*dtypes)
+
+    # Files that change on disk must not be served from the dask cache
+    name = 'npy-stack-' + tokenize([(os.path.abspath(p), os.path.getmtime(p)) for p in paths])
+    dsk = {(name, i) + (0,) * len(shapes[0]): (_load_npy, path, dtype)
+           for i, path in enumerate(paths)}
+    chunks = ((1,) * len(paths),) + tuple((n,) for n in shapes[0])
+    return da.Array(HighLevelGraph.from_collections(name, dsk, dependencies=()),
+                    name, chunks, dtype=dtype)
+
+
+def is_ome_zarr_image(path):
+    # Plates and wells are left to other readers
+    return os.path.isdir(path) and 'multiscales' in read_zattrs(path)
+
+
+def ome_zarr_reader_function(path):
+    """Read OME-Zarr images as lazy multiscale layers.
+
+    Parameters
+    ----------
+    path : str or list of str
+        Path to an OME-Zarr image, or list of paths.
+
+    Returns
+    -------
+    layer_data : list of tuples
+        One image layer per channel and one labels layer per label image of
+        every image.
+    """
+    paths = [path] if isinstance(path, str) else path
+    layer_data = []
+    for zarr_url in paths:
+        zarr_url = os.path.normpath(os.path.abspath(zarr_url))
+        layer_data.extend(read_ome_zarr_image(zarr_url))
+        layer_data.extend(read_ome_zarr_labels(zarr_url))
+    return layer_data
+
+
+def _get_colormap(color, name):
+    from napari.utils.colormaps import Colormap
+
+    return Colormap(['black', f'#{color}'], name=name)
+
+
+def _get_contrast_limits(channel, pyramid):
+    window = channel.get('window', dict())
+    if 'start' in window and 'end' in window:
+        return [window['start'], window['end']]
+    if len(pyramid) > 1:
+        # The coarsest level is enough to estimate the range, and cheap
+        low, high = da.compute(pyramid[-1].min(), pyramid[-1].max())
+        return [float(low), float(high) if high > low else float(low) + 1]
+    # napari estimates it for single level images
+    return None
+
+
+def read_ome_zarr_image(zarr_url):
+    """Return one image layer per channel of an OME-Zarr image."""
+    pyramid, metadata = load_multiscale(zarr_url)
+    zattrs = read_zattrs(zarr_url)
+    channels = zattrs.get('omero', dict()).get('channels', [])
+    axes = metadata['axes']
+    channel_axis = axes.index('c') if 'c' in axes else None
+    n_channels = 1 if channel_axis is None else pyramid[0].shape[channel_axis]
+
+    def drop_channel_axis(values):
+        if values is None or channel_axis is None:
+            return values
+        return [v for i, v in enumerate(values) if i != channel_axis]
+
+    label_names = read_zattrs(os.path.join(zarr_url, 'labels')).get('labels', [])
+    layer_data = []
+    for c in range(n_channels):
+        channel = channels[c] if c < len(channels) else dict()
+        if channel_axis is None:
+            data = pyramid
+        else:
+            index = (slice(None),) * channel_axis + (c,)
+            data = [level[index] for level in pyramid]
+
+        name = channel.get('label')
+        if name is None:
+            name = os.path.basename(zarr_url) if n_channels == 1 else f'{os.path.basename(zarr_url)}_c{c}'
+        add_kwargs = dict(name=name,
+                          multiscale=len(data) > 1,
+                          visible=channel.get('active', True),
+                          blending='additive' if n_channels > 1 else 'translucent',
+                          metadata=dict(zarr_url=zarr_url,
+                                        channel=dict(channel, index=c, label=name),
+                                        label_names=label_names))
+        scale = drop_channel_axis(metadata['scale'])
+        translate = drop_channel_axis(metadata['translate'])
+        if scale is not None:
+            add_kwargs['scale'] = scale
+        if translate is not None:
+            add_kwargs['translate'] = translate
+        contrast_limits = _get_contrast_limits(channel, data)
+        if contrast_limits is not None:
+            add_kwargs['contrast_limits'] = contrast_limits
+        if 'color' in channel:
+            add_kwargs['colormap'] = _get_colormap(channel['color'], name)
+
+        layer_data.append((data if len(data) > 1 else data[0], add_kwargs, 'image'))
+    return layer_data
+
+
+def read_ome_zarr_labels(zarr_url):
+    """Return one labels layer per label image listed in ``labels/.zattrs``."""
+    layer_data = []
+    for label_name in read_zattrs(os.path.join(zarr_url, 'labels')).get('labels', []):
+        try:
+            data, metadata = load_labels(zarr_url, label_name)
+        except ValueError:
+            continue
+        add_kwargs = dict(name=label_name,
+                          multiscale=isinstance(data, list),
+                          metadata=dict(zarr_url=zarr_url, label_name=label_name))
+        if metadata['scale'] is not None:
+            add_kwargs['scale'] = metadata['scale']
+        if metadata['translate'] is not None:
+            add_kwargs['translate'] = metadata['translate']
+        layer_data.append((data, add_kwargs, 'labels'))
+    return layer_data
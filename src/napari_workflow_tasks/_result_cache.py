@@ -0,0 +1,324 @@
+"""
+Content-addressed cache of task outputs.
+
+A task invocation is identified by the hash of the task executable, its
+normalized arguments and a fingerprint of the Zarr arrays it reads. After a
+successful run, the arrays the task wrote are hard-linked (or copied) into the
+cache; running the same invocation again relinks them into the OME-Zarr
+instead of running the task. Zarr writes chunks by renaming new files over old
+ones, so editing an output later never modifies the cached copy. The widget
+and the command line may share a cache directory, so the index is only
+changed while holding a lock on ``index.lock``.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+from ._zarr_utils import get_multiscale_metadata
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+DEFAULT_MAX_BYTES = 20 * 1024 ** 3
+ZARR_METADATA_FILES = ('.zattrs', '.zgroup', '.zarray')
+
+
+def get_default_cache_dir():
+    cache_home = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(cache_home, 'napari-workflow-tasks', 'results')
+
+
+def _hash_file(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _fingerprint_array(array_path, sha):
+    # Chunk names, sizes and modification times stand in for their content
+    sha.update(array_path.encode())
+    for dirpath, dirnames, filenames in os.walk(array_path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            stat = os.stat(os.path.join(dirpath, filename))
+            sha.update(f'{os.path.relpath(os.path.join(dirpath, filename), array_path)}'
+                       f':{stat.st_size}:{stat.st_mtime_ns};'.encode())
+
+
+def _list_arrays(group_url):
+    arrays = []
+    for dirpath, dirnames, filenames in os.walk(group_url):
+        if '.zarray' in filenames:
+            arrays.append(dirpath)
+            dirnames[:] = []
+        # Not the arrays of checkpoints, see ``_checkpoint``
+        dirnames[:] = sorted(dirname for dirname in dirnames if not dirname.startswith('.'))
+    return sorted(arrays)
+
+
+def get_input_arrays(zarr_url, task_args):
+    """Return the Zarr arrays a task invocation is assumed to read.
+
+    These are the image pyramid levels plus every label or table group that
+    is referred to by name in the task arguments.
+    """
+    try:
+        arrays = [os.path.join(zarr_url, path) for path in get_multiscale_metadata(zarr_url)['paths']]
+    except ValueError:
+        arrays = []
+
+    # Paths, above all the zarr_url itself, are not names of a group
+    names = {value for key, value in task_args.items()
+             if key != 'zarr_url' and isinstance(value, str) and value
+             and os.sep not in value and '/' not in value and value not in (os.curdir, os.pardir)}
+    for group in ['labels', 'tables']:
+        for name in sorted(names):
+            group_url = os.path.join(zarr_url, group, name)
+            if os.path.isdir(group_url):
+                arrays.extend(_list_arrays(group_url))
+    return arrays
+
+
+def fingerprint(array_paths, exclude=()):
+    sha = hashlib.sha256()
+    exclude = {os.path.normpath(p) for p in exclude}
+    for array_path in sorted(array_paths):
+        if os.path.normpath(array_path) not in exclude:
+            _fingerprint_array(array_path, sha)
+    return sha.hexdigest()
+
+
+def _link_or_copy(src, dst):
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _copy_tree(src, dst):
+    for dirpath, _, filenames in os.walk(src):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            _link_or_copy(path, os.path.join(dst, os.path.relpath(path, src)))
+
+
+def _tree_size(path):
+    return sum(os.path.getsize(os.path.join(dirpath, filename))
+               for dirpath, _, filenames in os.walk(path) for filename in filenames)
+
+
+def _is_group_list(path):
+    # The .zattrs listing the label images or tables of an image
+    group, filename = os.path.split(path)
+    return filename == '.zattrs' and group in ('labels', 'tables')
+
+
+def _merge_group_list(src, dst):
+    # Label images or tables added since the entry was stored stay listed,
+    # names are only listed if they exist on disk
+    group = os.path.basename(os.path.dirname(dst))
+    with open(src) as f:
+        attrs = json.load(f)
+    cached_names = attrs.get(group, [])
+    if os.path.exists(dst):
+        with open(dst) as f:
+            attrs = json.load(f)
+    names = attrs.get(group, [])
+    names = names + [name for name in cached_names if name not in names]
+    attrs[group] = [name for name in names if os.path.isdir(os.path.join(os.path.dirname(dst), name))]
+    with open(dst + '.partial', 'w') as f:
+        json.dump(attrs, f, indent=4)
+    os.replace(dst + '.partial', dst)
+
+
+@contextlib.contextmanager
+def _lock_file(path):
+    # Blocks until no other process holds the lock
+    with open(path, 'a+') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class ResultCache:
+    """Store and restore task outputs keyed on what went into the task.
+
+    Parameters
+    ----------
+    cache_dir : str, optional
+        Where cached outputs are kept, see ``get_default_cache_dir``.
+    max_bytes : int
+        Least recently used entries are evicted above this size.
+    """
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = get_default_cache_dir() if cache_dir is None else cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._executable_hashes = dict()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @property
+    def _path_to_index(self):
+        return os.path.join(self.cache_dir, 'index.json')
+
+    @contextlib.contextmanager
+    def _index_lock(self):
+        # Other threads and other processes using the same cache directory
+        with self._lock, _lock_file(os.path.join(self.cache_dir, 'index.lock')):
+            yield
+
+    def _read_index(self):
+        if not os.path.exists(self._path_to_index):
+            return dict()
+        with open(self._path_to_index) as f:
+            return json.load(f)
+
+    def _write_index(self, index):
+        tmp_path = self._path_to_index + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self._path_to_index)
+
+    def _hash_executable(self, executable):
+        key = (executable, os.path.getmtime(executable))
+        if key not in self._executable_hashes:
+            self._executable_hashes[key] = _hash_file(executable)
+        return self._executable_hashes[key]
+
+    def make_key(self, executable, task_args):
+        """Hash the executable and the normalized arguments of a task."""
+        normalized_args = json.dumps(task_args, sort_keys=True, separators=(',', ':'))
+        sha = hashlib.sha256()
+        sha.update(self._hash_executable(executable).encode())
+        sha.update(normalized_args.encode())
+        return sha.hexdigest()
+
+    def lookup(self, executable, task_args):
+        """Return the cache entry matching this invocation, or None."""
+        zarr_url = task_args['zarr_url']
+        key = self.make_key(executable, task_args)
+        with self._index_lock():
+            entry = self._read_index().get(key)
+        if entry is None:
+            return None
+
+        outputs = [os.path.join(zarr_url, path) for path in entry['outputs']]
+        inputs = get_input_arrays(zarr_url, task_args)
+        if fingerprint(inputs, exclude=outputs) != entry['input_fingerprint']:
+            return None
+        return dict(entry, key=key)
+
+    def restore(self, entry, zarr_url):
+        """Relink the cached outputs of ``entry`` into ``zarr_url``.
+
+        Outputs that still match the cached ones are left untouched.
+
+        Returns
+        -------
+        list of str
+            Paths of the arrays that were replaced.
+        """
+        entry_dir = os.path.join(self.cache_dir, entry['key'])
+        restored = []
+        for output, output_fingerprint in zip(entry['outputs'], entry['output_fingerprints']):
+            output_url = os.path.join(zarr_url, output)
+            if os.path.isdir(output_url) and fingerprint([output_url]) == output_fingerprint:
+                continue
+            shutil.rmtree(output_url, ignore_errors=True)
+            _copy_tree(os.path.join(entry_dir, output), output_url)
+            restored.append(output_url)
+
+        # Group metadata such as the multiscales of a label image
+        for path in entry['metadata_files']:
+            dst = os.path.join(zarr_url, path)
+            if _is_group_list(path):
+                _merge_group_list(os.path.join(entry_dir, path), dst)
+                continue
+            if os.path.exists(dst):
+                os.remove(dst)
+            _link_or_copy(os.path.join(entry_dir, path), dst)
+
+        with self._index_lock():
+            index = self._read_index()
+            if entry['key'] in index:
+                index[entry['key']]['last_used'] = time.time()
+                self._write_index(index)
+        return restored
+
+    def store(self, executable, task_args, written_paths):
+        """Cache the arrays a finished task wrote."""
+        zarr_url = task_args['zarr_url']
+        key = self.make_key(executable, task_args)
+        entry_dir = os.path.join(self.cache_dir, key)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+
+        outputs = []
+        metadata_files = set()
+        for written_path in written_paths:
+            output = os.path.relpath(written_path, zarr_url)
+            if output.startswith(os.pardir):
+                continue
+            _copy_tree(written_path, os.path.join(entry_dir, output))
+            outputs.append(output)
+
+            # Metadata of the groups between the image and the array
+            parent = os.path.dirname(output)
+            while parent:
+                for filename in ZARR_METADATA_FILES:
+                    if os.path.exists(os.path.join(zarr_url, parent, filename)):
+                        metadata_files.add(os.path.join(parent, filename))
+                parent = os.path.dirname(parent)
+
+        for path in metadata_files:
+            _link_or_copy(os.path.join(zarr_url, path), os.path.join(entry_dir, path))
+
+        output_urls = [os.path.join(zarr_url, output) for output in outputs]
+        entry = dict(outputs=outputs,
+                     output_fingerprints=[fingerprint([url]) for url in output_urls],
+                     metadata_files=sorted(metadata_files),
+                     input_fingerprint=fingerprint(get_input_arrays(zarr_url, task_args), exclude=output_urls),
+                     nbytes=_tree_size(entry_dir) if os.path.isdir(entry_dir) else 0,
+                     last_used=time.time())
+
+        with self._index_lock():
+            index = self._read_index()
+            index[key] = entry
+            self._evict(index)
+            self._write_index(index)
+        return key
+
+    def _evict(self, index):
+        total_bytes = sum(entry['nbytes'] for entry in index.values())
+        for key in sorted(index, key=lambda k: index[k]['last_used']):
+            if total_bytes <= self.max_bytes:
+                break
+            total_bytes -= index[key]['nbytes']
+            shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+            del index[key]
+
+    def clear(self):
+        with self._index_lock():
+            for key in self._read_index():
+                shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+            self._write_index(dict())
@@ -0,0 +1,48 @@
+"""
+Where the statistics and profiles of runs are kept.
+
+Every run leaves a JSON record of its statistics and, if it was profiled, its
+profile. The task arguments may sit inside the installed package, so these
+are not written next to them but to ``<cache>/napari-workflow-tasks/runs``,
+next to the result cache. Only the newest ``MAX_RUN_FILES`` files are kept.
+"""
+import contextlib
+import os
+
+MAX_RUN_FILES = 500
+
+
+def get_default_runs_dir():
+    cache_home = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(cache_home, 'napari-workflow-tasks', 'runs')
+
+
+def get_run_prefix(path_to_task_args, runs_dir=None):
+    """Return the path, without extension, of the records of a run.
+
+    The records are named after the args file of the job, e.g.
+    ``<runs_dir>/<task>_job<id>_stats.json``.
+    """
+    runs_dir = get_default_runs_dir() if runs_dir is None else runs_dir
+    os.makedirs(runs_dir, exist_ok=True)
+    return os.path.join(runs_dir, os.path.splitext(os.path.basename(path_to_task_args))[0])
+
+
+def prune_runs(runs_dir=None, max_files=MAX_RUN_FILES):
+    """Remove all but the newest ``max_files`` files of the run directory."""
+    runs_dir = get_default_runs_dir() if runs_dir is None else runs_dir
+    try:
+        paths = [entry.path for entry in os.scandir(runs_dir) if entry.is_file()]
+    except OSError:
+        return
+    paths.sort(key=_get_mtime, reverse=True)
+    for path in paths[max_files:]:
+        with contextlib.suppress(OSError):
+            os.remove(path)
+
+
+def _get_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0
@@ -0,0 +1,179 @@
+"""
+Qt-free execution of scheduler jobs.
+
+``TaskRunner.run`` is the ``runner`` of a ``TaskScheduler``: it reuses a
+cached result if there is one, and otherwise runs the job through an
+executor, as a single task, a pipeline or on tiles of the image, depending on
+the context of the job. ``create_task_job`` turns the current arguments of a
+task of a ``FractalTaskManager`` into a job.
+"""
+import threading
+
+from ._in_memory import get_shared_memory_dir
+from ._memory import estimate_job_memory
+from ._run_records import get_run_prefix
+from ._scheduler import TaskJob
+from ._tiling import run_tiled
+
+
+def create_task_job(task_manager, task_name, job_id, priority=0, timeout=None, group=None, context=None):
+    """Validate the arguments of a task and write them for a new job.
+
+    The peak memory of the job is estimated for the admission control of
+    the scheduler.
+
+    Raises
+    ------
+    TaskArgsError
+        If the arguments do not match the schema of the task.
+    """
+    task_manager.validate_args(task_name)
+    path_to_task_args = task_manager.write_to_json(task_name, job_id=job_id)
+    job = TaskJob(task_name=task_name,
+                  executable=task_manager.get_executable_path(task_name),
+                  path_to_task_args=path_to_task_args,
+                  task_args=task_manager.get_args_dict(task_name),
+                  priority=priority,
+                  timeout=timeout,
+                  group=group,
+                  context=context)
+    job.job_id = job_id
+    job.memory = estimate_job_memory(job)
+    return job
+
+
+def _get_cache_args(job):
+    # Tiles of another size or halo, or ROIs, give other labels, the number
+    # of tiles running at once does not change them
+    if 'tiling' not in job.context:
+        return job.task_args
+    tiling = {key: value for key, value in job.context['tiling'].items() if key not in ('n_parallel', 'checkpoint')}
+    return dict(job.task_args, tiling=tiling)
+
+
+class TaskRunner:
+    """Run jobs through an executor, reusing cached results.
+
+    Parameters
+    ----------
+    executor : TaskExecutor
+        Any backend of ``_executors``, jobs already running keep theirs when
+        it is replaced.
+    result_cache : ResultCache, optional
+        Results of finished jobs are stored in and restored from it.
+    """
+    def __init__(self, executor=None, result_cache=None):
+        self.executor = executor
+        self.result_cache = result_cache
+        self._lock = threading.Lock()
+        # zarr_url -> ids of the jobs running on it
+        self._running = dict()
+        # Jobs that ran while another job ran on the same image
+        self._overlapping = set()
+
+    def run(self, job):
+        print(f'Running job {job.job_id}: {job.task_name}')
+        # Previews run on throw-away crops, caching them is pointless
+        use_cache = (self.result_cache is not None
+                     and job.task_args.get('zarr_url') is not None
+                     and 'preview' not in job.context
+                     and 'in_memory' not in job.context
+                     and 'pipeline' not in job.context)
+
+        if use_cache and not job.context.get('force_rerun', False):
+            result = self._reuse_cached_result(job)
+            if result is not None:
+                return result
+
+        zarr_url = job.task_args.get('zarr_url')
+        with self._lock:
+            others = self._running.setdefault(zarr_url, set())
+            if others:
+                self._overlapping.update(others | {job.job_id})
+            others.add(job.job_id)
+        try:
+            result = self._launch_task_subprocess(job)
+        finally:
+            with self._lock:
+                self._running[zarr_url].discard(job.job_id)
+                if not self._running[zarr_url]:
+                    del self._running[zarr_url]
+                overlapped = job.job_id in self._overlapping
+                self._overlapping.discard(job.job_id)
+
+        if use_cache and result['status'] == 'finished' and result.get('written_paths'):
+            if overlapped:
+                # What it wrote cannot be told apart from what the others wrote
+                print(f'Not caching the result of job {job.job_id}, another job wrote to {zarr_url} meanwhile')
+                return result
+            try:
+                self.result_cache.store(job.executable, _get_cache_args(job), result['written_paths'])
+            except OSError as e:
+                print(f'Could not cache the result of job {job.job_id}: {e}')
+        return result
+
+    def _reuse_cached_result(self, job):
+        try:
+            entry = self.result_cache.lookup(job.executable, _get_cache_args(job))
+            if entry is None:
+                return None
+            restored = self.result_cache.restore(entry, job.task_args['zarr_url'])
+        except OSError as e:
+            print(f'Could not reuse the cached result of job {job.job_id}: {e}')
+            return None
+
+        print(f'Reused cached result for job {job.job_id}: {job.task_name}')
+        return dict(status='finished', error=None, pid=None, rss=None,
+                    written_paths=restored, cached=True)
+
+    def _launch_task_subprocess(self, job):
+        print('Launching subprocess...')
+        print(job.executable)
+
+        # Run in a warm worker process instead of a fresh interpreter
+        profile_path = None
+        if job.context.get('profile', False):
+            profile_path = get_run_prefix(job.path_to_task_args)
+
+        if 'pipeline' in job.context:
+            # Intermediates of the pipeline stay in shared memory
+            result = self.executor.run_pipeline(job.context['pipeline'],
+                                                job.task_args['zarr_url'],
+                                                timeout=job.timeout,
+                                                cancel_event=job.cancel_event,
+                                                on_progress=job.report_progress,
+                                                profile_path=profile_path,
+                                                scratch_dir=get_shared_memory_dir())
+        elif 'tiling' in job.context:
+            # The tiles, or ROIs, are processed by several workers at once
+            tiling = job.context['tiling']
+            result = run_tiled(self.executor,
+                               job.executable,
+                               job.path_to_task_args,
+                               job.task_args['zarr_url'],
+                               tiling['tile_size'],
+                               halo=tiling['halo'],
+                               n_parallel=tiling['n_parallel'],
+                               timeout=job.timeout,
+                               cancel_event=job.cancel_event,
+                               on_progress=job.report_progress,
+                               roi_tables=tiling['roi_tables'],
+                               roi_table=tiling.get('roi_table'),
+                               checkpoint=tiling.get('checkpoint', False),
+                               scratch_dir=get_shared_memory_dir() if self.executor.shares_memory
+                               else getattr(self.executor, 'job_dir', None))
+        else:
+            result = self.executor.run(job.executable,
+                                       job.path_to_task_args,
+                                       timeout=job.timeout,
+                                       cancel_event=job.cancel_event,
+                                       zarr_url=job.task_args.get('zarr_url'),
+                                       on_progress=job.report_progress,
+                                       profile_path=profile_path)
+        if result['status'] == 'failed':
+            print(f'Task {job.task_name} failed in worker {result["pid"]}:')
+            print(result['error'])
+
+        print('Finished running subprocess')
+
+        return result
@@ -0,0 +1,304 @@
+"""
+Priority job queue that runs tasks with bounded concurrency.
+
+The scheduler does not know how a job is executed: it is given a ``runner``
+callable that blocks until the job is done and returns a result dict with a
+``status`` and an ``error``. Every state change of a job is reported through
+``on_update``, which is called from the scheduler threads. Progress the runner
+reports with ``job.report_progress`` is passed on to ``on_progress`` at most
+once per ``progress_interval`` seconds per job; the latest update is passed
+on once the interval is over. Jobs that share a
+``limit_key`` can be limited to fewer workers than ``max_concurrency`` with
+``set_limit``, e.g. the variants of a parameter sweep. With a
+``memory_budget``, a job only starts if its estimated ``memory`` fits next to
+the jobs that are running, and the jobs queued behind it wait until it
+started; a job that alone exceeds the budget runs once no other job is
+running.
+"""
+import heapq
+import itertools
+import threading
+import time
+
+JOB_STATES = ('queued', 'running', 'finished', 'failed', 'cancelled')
+# Seconds between two progress updates of a job delivered to on_progress
+PROGRESS_INTERVAL = 0.25
+
+
+class TaskJob:
+    def __init__(self,
+                 task_name,
+                 executable,
+                 path_to_task_args,
+                 task_args=None,
+                 priority=0,
+                 timeout=None,
+                 group=None,
+                 context=None,
+                 limit_key=None,
+                 memory=None):
+        self.job_id = None
+        self.task_name = task_name
+        self.executable = executable
+        self.path_to_task_args = path_to_task_args
+        # Snapshot of the arguments the job was submitted with
+        self.task_args = dict() if task_args is None else task_args
+        self.priority = priority
+        self.timeout = timeout
+        # Jobs fanned out together, e.g. over the images of a plate, share a group
+        self.group = group
+        # Free-form information the submitter needs once the job is done
+        self.context = dict() if context is None else context
+        # Jobs with the same key share the limit set with TaskScheduler.set_limit
+        self.limit_key = limit_key
+        # Estimated peak memory in bytes, see _memory.estimate_job_memory
+        self.memory = memory
+
+        self.status = 'queued'
+        self.error = None
+        self.result = None
+        self.submitted_at = None
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        # Last progress event of the running job, see task_wrapper.ProgressReporter
+        self.progress = None
+        self.progress_callback = None
+        self._last_progress_report = None
+        self._progress_timer = None
+
+    def report_progress(self, progress):
+        self.progress = progress
+        if self.progress_callback is not None:
+            self.progress_callback(self)
+
+    @property
+    def is_done(self):
+        return self.status in ('finished', 'failed', 'cancelled')
+
+    def __repr__(self):
+        return f'TaskJob({self.job_id}, {self.task_name!r}, status={self.status!r})'
+
+
+class TaskScheduler:
+    """Run submitted jobs by priority with at most ``max_concurrency`` at once.
+
+    Parameters
+    ----------
+    runner : callable
+        ``runner(job) -> dict`` executing a job. It should return early with
+        status 'cancelled' once ``job.cancel_event`` is set.
+    max_concurrency : int
+        Maximum number of jobs running at the same time.
+    on_update : callable, optional
+        ``on_update(job)`` called whenever a job changes state.
+    on_progress : callable, optional
+        ``on_progress(job)`` called when a running job reports progress.
+    progress_interval : float
+        Minimum seconds between two ``on_progress`` calls for the same job.
+    memory_budget : int, optional
+        Bytes the estimated memory of the running jobs may add up to.
+    """
+    def __init__(self,
+                 runner,
+                 max_concurrency=1,
+                 on_update=None,
+                 on_progress=None,
+                 progress_interval=PROGRESS_INTERVAL,
+                 memory_budget=None):
+        self.runner = runner
+        self.on_update = on_update
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self._max_concurrency = max_concurrency
+        self._memory_budget = memory_budget
+
+        self._lock = threading.Lock()
+        self._queue = []
+        self._counter = itertools.count()
+        self._job_ids = itertools.count(1)
+        self._jobs = dict()
+        self._n_running = 0
+        self._limits = dict()
+        self._n_running_by_key = dict()
+        self._running_memory = 0
+        self._progress_lock = threading.Lock()
+
+    @property
+    def max_concurrency(self):
+        return self._max_concurrency
+
+    @max_concurrency.setter
+    def max_concurrency(self, value):
+        self._max_concurrency = max(1, int(value))
+        self._dispatch()
+
+    @property
+    def memory_budget(self):
+        return self._memory_budget
+
+    @memory_budget.setter
+    def memory_budget(self, value):
+        self._memory_budget = None if value is None else int(value)
+        self._dispatch()
+
+    @property
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def get_job(self, job_id):
+        return self._jobs[job_id]
+
+    def new_job_id(self):
+        # Reserve an id, e.g. to name a per-job args file before submitting
+        return next(self._job_ids)
+
+    def set_limit(self, key, max_running):
+        """Run at most ``max_running`` jobs with ``limit_key`` ``key`` at once.
+
+        None removes the limit.
+        """
+        with self._lock:
+            if max_running is None:
+                self._limits.pop(key, None)
+            else:
+                self._limits[key] = max(1, int(max_running))
+        self._dispatch()
+
+    def submit(self, job):
+        if job.job_id is None:
+            job.job_id = self.new_job_id()
+        job.status = 'queued'
+        job.submitted_at = time.time()
+        job.progress_callback = self._report_progress
+        with self._lock:
+            self._jobs[job.job_id] = job
+            # Higher priority first, then first come first served
+            heapq.heappush(self._queue, (-job.priority, next(self._counter), job))
+        self._notify(job)
+        self._dispatch()
+        return job.job_id
+
+    def cancel(self, job_id):
+        job = self._jobs[job_id]
+        with self._lock:
+            if job.is_done:
+                return False
+            job.cancel_event.set()
+            was_queued = job.status == 'queued'
+            if was_queued:
+                job.status = 'cancelled'
+                job.finished_at = time.time()
+        # Running jobs report 'cancelled' once the runner has stopped them
+        if was_queued:
+            self._notify(job)
+        return True
+
+    def wait(self, timeout=None):
+        # Block until all submitted jobs are done, mostly useful outside Qt
+        deadline = None if timeout is None else time.time() + timeout
+        while any(not job.is_done for job in self.jobs):
+            if deadline is not None and time.time() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _notify(self, job):
+        if self.on_update is not None:
+            self.on_update(job)
+
+    def _report_progress(self, job):
+        # Updates within the interval after the last one are held back, and
+        # the latest of them is passed on once the interval is over. The
+        # update completing the job is passed on at once
+        progress = job.progress or dict()
+        complete = progress.get('total') is not None and progress.get('current') == progress.get('total')
+        with self._progress_lock:
+            now = time.monotonic()
+            last_reported = job._last_progress_report
+            if not complete and last_reported is not None and now - last_reported < self.progress_interval:
+                if job._progress_timer is None:
+                    job._progress_timer = threading.Timer(last_reported + self.progress_interval - now,
+                                                          self._report_latest_progress, args=(job,))
+                    job._progress_timer.daemon = True
+                    job._progress_timer.start()
+                return
+            self._cancel_progress_timer(job)
+            job._last_progress_report = now
+        if self.on_progress is not None:
+            self.on_progress(job)
+
+    def _report_latest_progress(self, job):
+        with self._progress_lock:
+            if job._progress_timer is None or job.is_done:
+                return
+            job._progress_timer = None
+            job._last_progress_report = time.monotonic()
+        if self.on_progress is not None:
+            self.on_progress(job)
+
+    def _cancel_progress_timer(self, job):
+        if job._progress_timer is not None:
+            job._progress_timer.cancel()
+            job._progress_timer = None
+
+    def _dispatch(self):
+        to_start = []
+        with self._lock:
+            held_back = []
+            while self._queue and self._n_running < self._max_concurrency:
+                entry = heapq.heappop(self._queue)
+                job = entry[2]
+                if job.status != 'queued':
+                    continue
+                key = job.limit_key
+                if key in self._limits and self._n_running_by_key.get(key, 0) >= self._limits[key]:
+                    # Keeps its place in the queue, jobs behind it may start
+                    held_back.append(entry)
+                    continue
+                memory = job.memory or 0
+                if (self._memory_budget is not None and self._n_running > 0
+                        and self._running_memory + memory > self._memory_budget):
+                    # Jobs behind it wait too, or a stream of smaller jobs
+                    # could keep it from ever starting
+                    held_back.append(entry)
+                    break
+                job.status = 'running'
+                job.started_at = time.time()
+                self._n_running += 1
+                self._running_memory += memory
+                if key is not None:
+                    self._n_running_by_key[key] = self._n_running_by_key.get(key, 0) + 1
+                to_start.append(job)
+            for entry in held_back:
+                heapq.heappush(self._queue, entry)
+
+        for job in to_start:
+            threading.Thread(target=self._run_job, args=(job,), daemon=True).start()
+
+    def _run_job(self, job):
+        self._notify(job)
+        try:
+            result = self.runner(job)
+        except Exception as e:  # noqa: BLE001
+            # Any error of the runner fails the job, the scheduler thread
+            # must still release its slot and report the job as done
+            result = dict(status='failed', error=repr(e))
+
+        with self._progress_lock:
+            self._cancel_progress_timer(job)
+        job.result = result
+        job.error = result.get('error')
+        job.status = result.get('status', 'failed')
+        if job.cancel_event.is_set() and job.status != 'finished':
+            job.status = 'cancelled'
+        job.finished_at = time.time()
+
+        with self._lock:
+            self._n_running -= 1
+            self._running_memory -= job.memory or 0
+            if job.limit_key is not None:
+                self._n_running_by_key[job.limit_key] -= 1
+        self._notify(job)
+        self._dispatch()
@@ -0,0 +1,137 @@
+"""
+Run a task with every combination of values of one or two numeric arguments.
+
+A sweep is a list of ``(name, values)`` pairs, where ``name`` is an argument
+of the task or ``group.field`` for a field of a parameter group. Every
+combination of values is a variant that runs on its own copy of the same
+preview crop. ``SweepStack`` collects the labels of the variants into one
+array with a leading axis per swept argument, so that the variants can be
+compared by moving the sliders of napari.
+"""
+import copy
+import itertools
+
+import numpy as np
+
+from ._task_manager import is_encoded_group
+
+# JSON schema types of the arguments that can be swept
+SWEEP_TYPES = ('integer', 'number', 'float')
+# Largest number of variants of a sweep
+MAX_SWEEP_VARIANTS = 64
+
+
+def get_sweep_names(task_manager, task_name, ignore=()):
+    """Return the names of the numeric arguments of a task.
+
+    Fields of parameter groups are named ``group.field``.
+    """
+    names = []
+    for key, schema in task_manager.get_properties(task_name).items():
+        if key in ignore:
+            continue
+        if schema.get('type') in SWEEP_TYPES:
+            names.append(key)
+        elif '$ref' in schema:
+            ref_schema = task_manager.get_ref_schema(task_name, key)
+            names.extend(f'{key}.{field}' for field, field_schema in ref_schema['properties'].items()
+                         if field_schema.get('type') in SWEEP_TYPES)
+    return names
+
+
+def get_sweep_schema(task_manager, task_name, name):
+    key, _, field = name.partition('.')
+    if field:
+        return task_manager.get_ref_schema(task_name, key)['properties'][field]
+    return task_manager.get_properties(task_name)[key]
+
+
+def parse_sweep_values(text, schema):
+    """Parse the values of a swept argument.
+
+    ``start:stop:step`` is a range that includes ``stop``, anything else is
+    read as a comma separated list of values.
+
+    Raises
+    ------
+    ValueError
+        If the text is neither, or gives non-integer values for an integer
+        argument.
+    """
+    text = text.strip()
+    try:
+        if ':' in text:
+            start, stop, step = (float(value) for value in text.split(':'))
+            if step <= 0 or stop < start:
+                raise ValueError
+            # Tolerate rounding, 0.1:0.3:0.1 includes 0.3
+            n_values = int(np.floor((stop - start) / step + 1e-9)) + 1
+            values = [start + i * step for i in range(n_values)]
+        else:
+            values = [float(value) for value in text.split(',') if value.strip() != '']
+    except ValueError:
+        raise ValueError(f'{text!r} is neither start:stop:step nor a list of numbers') from None
+    if not values:
+        raise ValueError('No values given')
+
+    if schema.get('type') == 'integer':
+        if not all(value.is_integer() for value in values):
+            raise ValueError(f'{text!r} has values that are not integers')
+        values = [int(value) for value in values]
+    else:
+        values = [round(value, 10) for value in values]
+    # Duplicates would only run the same variant twice
+    return list(dict.fromkeys(values))
+
+
+def get_sweep_variants(sweep):
+    """Return the ``(index, values)`` of every combination of a sweep.
+
+    ``index`` holds the position of every value in its list, ``values``
+    maps every swept name to its value.
+    """
+    shape = [len(values) for _, values in sweep]
+    n_variants = int(np.prod(shape))
+    if n_variants > MAX_SWEEP_VARIANTS:
+        raise ValueError(f'The sweep has {n_variants} variants, at most {MAX_SWEEP_VARIANTS} are allowed')
+    return [(index, {name: values[i] for (name, values), i in zip(sweep, index)})
+            for index in itertools.product(*(range(n) for n in shape))]
+
+
+def set_sweep_values(task_manager, task_name, values):
+    """Set the arguments of a task to the values of one variant."""
+    for name, value in values.items():
+        key, _, field = name.partition('.')
+        if field:
+            group = task_manager.get_args_dict(task_name).get(key)
+            # Copied, jobs that were already created keep their arguments
+            group = copy.deepcopy(group) if is_encoded_group(group) else task_manager.get_ref_default(task_name, key)
+            group['args'][field] = value
+            value = group
+        task_manager.update_task_property(task_name, key, value)
+
+
+class SweepStack:
+    """Labels of the variants of a sweep, filled in as the variants finish.
+
+    Parameters
+    ----------
+    shape : tuple of int
+        Number of values of every swept argument.
+    """
+    def __init__(self, shape):
+        self.shape = tuple(shape)
+        self.data = None
+
+    def add(self, index, labels):
+        labels = np.asarray(labels)
+        if self.data is None:
+            # Variants that have not finished yet show no labels
+            self.data = np.zeros(self.shape + labels.shape, dtype=labels.dtype)
+        if labels.shape != self.data.shape[len(self.shape):]:
+            raise ValueError(f'Labels of shape {labels.shape} do not fit the sweep of '
+                             f'shape {self.data.shape[len(self.shape):]}')
+        if not np.can_cast(labels.dtype, self.data.dtype):
+            self.data = self.data.astype(np.promote_types(self.data.dtype, labels.dtype))
+        self.data[tuple(index)] = labels
+        return self.data
@@ -0,0 +1,306 @@
+"""
+Qt-free core that keeps the tasks of loaded task packages and their arguments.
+
+``FractalTaskManager`` registers the tasks of Fractal task package manifests,
+holds the current value of every task argument and writes the arguments of
+a job into the JSON file ``task_wrapper.py`` reads. Before a job is created
+its arguments are validated against the ``args_schema_parallel`` of the task.
+The napari widget and the ``napari-workflow-tasks`` command line runner are
+both built on it.
+"""
+import copy
+import functools
+import json
+import os
+
+from ._manifest import ManifestIndex
+
+# Categories of the tasks offered in the widget
+INCLUDE_CATEGORIES = ["Segmentation", "Measurement"]
+
+
+class TaskArgsError(ValueError):
+    """The arguments of a task do not match its ``args_schema_parallel``."""
+
+
+def parse_value(text, schema):
+    """Turn the text of a form field into a value of the type in ``schema``.
+
+    Empty text is None. Text that cannot be converted is returned as it is,
+    the validation of the arguments reports it.
+    """
+    if text == "":
+        return None
+    try:
+        if schema.get('type') == 'integer':
+            return int(text)
+        if schema.get('type') in ('number', 'float'):
+            return float(text)
+        if schema.get('type') in ('array', 'object'):
+            return json.loads(text)
+    except ValueError:
+        pass
+    return text
+
+
+def is_encoded_group(value):
+    # Parameter groups are passed to task_wrapper.py as the name of their
+    # model and its arguments, see task_wrapper.decode_task_args
+    return isinstance(value, dict) and set(value.keys()) == {'args', 'type'}
+
+
+def get_plain_args(args):
+    """Return the arguments as the task receives them.
+
+    Parameter groups are replaced by their arguments, and arguments that are
+    not set (None) are left out, so that the task uses its defaults.
+    """
+    plain_args = dict()
+    for key, value in args.items():
+        if is_encoded_group(value):
+            value = {k: v for k, v in value['args'].items() if v is not None}
+        if value is not None:
+            plain_args[key] = value
+    return plain_args
+
+
+class FractalTaskManager:
+    """Tasks of the loaded task packages and the arguments they run with.
+
+    Parameters
+    ----------
+    manifest_index : ManifestIndex, optional
+        Index the task packages are loaded through.
+    args_dir : str, optional
+        Where the argument files of jobs are written, next to the manifest
+        of the task package by default.
+    """
+    def __init__(self, manifest_index=None, args_dir=None):
+        self.tasks = dict()
+        self.manifest_index = ManifestIndex() if manifest_index is None else manifest_index
+        self.args_dir = args_dir
+
+    def load_package(self,
+                     path_to_manifest,
+                     categories=INCLUDE_CATEGORIES):
+        """Register the tasks of a task package manifest.
+
+        Only the task summaries are read, schemas are loaded on first use.
+
+        Parameters
+        ----------
+        categories : list of str, optional
+            Register only the tasks of these categories, all tasks if None.
+
+        Returns
+        -------
+        list of dict
+            Summaries of the registered tasks, see ``ManifestIndex.load``.
+        """
+        registered = []
+        for task in self.manifest_index.load(path_to_manifest):
+            if categories is not None and task.get("category") not in categories:
+                continue
+            self.register_task(name=task["name"],
+                               parent_dir=os.path.split(path_to_manifest)[0],
+                               executable_parallel=task["executable_parallel"],
+                               load_schema=functools.partial(self.manifest_index.get_schema,
+                                                             path_to_manifest,
+                                                             task["name"]))
+            registered.append(task)
+        return registered
+
+    def add_task(self,
+                 name,
+                 parent_dir,
+                 executable_parallel,
+                 properties,
+                 defs,
+                 required,
+                 type,
+                 title):
+
+        task_dict = dict(
+            title=title,
+            parent_dir=parent_dir,
+            executable_parallel=executable_parallel,
+            properties=properties,
+            defs=defs,
+            required=required,
+            type=type,
+        )
+        self.tasks[name] = task_dict
+
+    def register_task(self,
+                      name,
+                      parent_dir,
+                      executable_parallel,
+                      load_schema):
+        # Register a task without its args schema, which is only loaded by
+        # load_schema() once the task is actually used
+        self.tasks[name] = dict(parent_dir=parent_dir,
+                                executable_parallel=executable_parallel,
+                                load_schema=load_schema)
+
+    def _get(self,
+             name):
+        task_dict = self.tasks[name]
+        if 'load_schema' in task_dict:
+            # Property values are written into the schema, keep the loaded one pristine
+            schema = copy.deepcopy(task_dict.pop('load_schema')())
+            self.add_task(name=name,
+                          parent_dir=task_dict['parent_dir'],
+                          executable_parallel=task_dict['executable_parallel'],
+                          properties=schema["properties"],
+                          defs=schema.get("$defs", None),
+                          required=schema.get("required", []),
+                          type=schema["type"],
+                          title=schema["title"])
+            task_dict = self.tasks[name]
+        return task_dict
+
+    def get_executable_path(self,
+                            name):
+        parent_dir = self.tasks[name]['parent_dir']
+        exec_fname = self.tasks[name]['executable_parallel']
+
+        return os.path.join(parent_dir, exec_fname)
+
+    def get_path_to_json(self,
+                         name,
+                         job_id=None):
+
+        args_dir = self._get(name)['parent_dir'] if self.args_dir is None else self.args_dir
+        title = self._get(name)['title']
+        # Every job gets its own args file so that concurrent jobs of the
+        # same task do not overwrite each other's arguments
+        if job_id is not None:
+            return os.path.join(args_dir, f'{title}_job{job_id}.json')
+        return os.path.join(args_dir, f'{title}.json')
+
+    def get_task(self,
+                 name):
+        return self._get(name)
+
+    def get_properties(self,
+                       name):
+        return self._get(name)['properties']
+
+    def get_defs(self,
+                 name):
+        return self._get(name)['defs']
+
+    def get_ref_schema(self,
+                       name,
+                       property):
+        # Schema of a parameter group, i.e. of a property given by a $ref
+        ref = os.path.split(self._get(name)['properties'][property]['$ref'])[-1]
+        return self._get(name)['defs'][ref]
+
+    def get_ref_default(self,
+                        name,
+                        property):
+        # A parameter group with the default of every field that has one
+        ref_schema = self.get_ref_schema(name, property)
+        defs_props = ref_schema['properties']
+        args_dict = {key: defs_props[key]['default'] for key in defs_props.keys()
+                     if 'default' in defs_props[key]}
+        return dict(args=args_dict,
+                    type=ref_schema['title'])
+
+    def get_args_dict(self,
+                      name):
+
+        args_dict = dict()
+        for prop_key in self._get(name)['properties'].keys():
+            if 'value' in self._get(name)['properties'][prop_key]:
+                args_dict[prop_key] = self._get(name)['properties'][prop_key]['value']
+
+        return args_dict
+
+    def set_args(self,
+                 name,
+                 args):
+        """Set several arguments of a task, e.g. read from a parameter file.
+
+        Parameter groups may be given as plain dicts of their fields, fields
+        left out keep their defaults.
+        """
+        properties = self.get_properties(name)
+        unknown = sorted(set(args) - set(properties))
+        if unknown:
+            raise TaskArgsError(f'{name} has no argument {", ".join(unknown)}')
+
+        for key, value in args.items():
+            if '$ref' in properties[key] and isinstance(value, dict) and not is_encoded_group(value):
+                group = self.get_ref_default(name, key)
+                value = dict(group, args=dict(group['args'], **value))
+            self.update_task_property(name, key, value)
+
+    def validate_args(self,
+                      name,
+                      args=None):
+        """Check arguments against the ``args_schema_parallel`` of a task.
+
+        Parameters
+        ----------
+        args : dict, optional
+            The current arguments of the task by default.
+
+        Raises
+        ------
+        TaskArgsError
+            Listing every argument that does not match the schema.
+        """
+        try:
+            import jsonschema
+        except ImportError:
+            print(f'jsonschema is not installed, the arguments of {name} are not validated')
+            return
+
+        task = self._get(name)
+        schema = dict(title=task['title'],
+                      type=task['type'],
+                      properties=task['properties'],
+                      required=task['required'])
+        if task['defs'] is not None:
+            schema['$defs'] = task['defs']
+        args = self.get_args_dict(name) if args is None else args
+
+        try:
+            validator_class = jsonschema.validators.validator_for(schema)
+            validator_class.check_schema(schema)
+            errors = sorted(validator_class(schema).iter_errors(get_plain_args(args)), key=lambda e: list(e.path))
+        except (jsonschema.exceptions.SchemaError, jsonschema.exceptions.UnknownType) as e:
+            print(f'The schema of {name} is not valid JSON schema, its arguments are not validated: {e}')
+            return
+        if errors:
+            messages = [f'{"/".join(str(key) for key in error.path) or "arguments"}: {error.message}'
+                        for error in errors]
+            raise TaskArgsError(f'Invalid arguments for {name}:\n' + '\n'.join(messages))
+
+    def write_to_json(self,
+                      name,
+                      job_id=None):
+
+        path_to_json = self.get_path_to_json(name, job_id)
+
+        with open(path_to_json, 'w') as f:
+            json.dump(self.get_args_dict(name), f)
+
+        return path_to_json
+
+    def get_title(self,
+                  name):
+        return self._get(name)['title']
+
+    def update_task_property(self,
+                             name,
+                             property,
+                             value):
+
+        print('Property dict updated', name, property, value)
+        try:
+            self._get(name)['properties'][property]['value'] = value
+        except KeyError:
+            print(f'Property {property} not defined in MANIFEST')
@@ -0,0 +1,347 @@
+"""
+Pool of long-lived task runner processes.
+
+Every worker imports the task dependencies once and keeps loaded task modules
+around, so that executing a task does not pay for a cold interpreter start.
+Jobs are sent to the workers over a pipe and run through the same code path
+as ``python task_wrapper.py``. While a job runs, the worker sends progress
+events over the same pipe before the final result.
+"""
+import atexit
+import contextlib
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from multiprocessing.connection import Listener
+
+# Seconds between liveness checks while waiting for a job to finish
+POLL_INTERVAL = 0.1
+# Seconds a freshly started worker has to connect back to the pool
+CONNECT_TIMEOUT = 60
+
+
+class _PoolWorker:
+    def __init__(self):
+        authkey = os.urandom(32)
+        self._listener = Listener(authkey=authkey)
+        self.conn = None
+        self.jobs_done = 0
+
+        # The worker reports its start-up time relative to the spawn time
+        env = dict(os.environ, TASK_WORKER_AUTHKEY=authkey.hex(), TASK_WORKER_SPAWNED_AT=repr(time.time()))
+        self.process = subprocess.Popen([sys.executable,
+                                         os.path.join(os.path.dirname(__file__), 'task_wrapper.py'),
+                                         '--serve', self._listener.address],
+                                        env=env)
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    @property
+    def exitcode(self):
+        return self.process.poll()
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def connect(self):
+        # Wait for the worker to connect back without blocking forever on a
+        # worker that died during start-up
+        if self.conn is not None:
+            return
+
+        accepted = []
+        accept_thread = threading.Thread(target=lambda: accepted.append(self._accept()),
+                                         daemon=True)
+        accept_thread.start()
+        waited = 0
+        while accept_thread.is_alive() and self.is_alive() and waited < CONNECT_TIMEOUT:
+            accept_thread.join(POLL_INTERVAL)
+            waited += POLL_INTERVAL
+
+        if not accepted or accepted[0] is None:
+            self._listener.close()
+            raise OSError(f'Worker process {self.pid} did not connect (exit code {self.exitcode})')
+        self.conn = accepted[0]
+
+    def _accept(self):
+        try:
+            return self._listener.accept()
+        except OSError:
+            return None
+
+    def kill(self):
+        self.process.kill()
+        self.process.wait()
+
+    def stop(self, timeout=5):
+        if self.conn is None:
+            # Never handed a job, so there is nothing to shut down cleanly
+            self.kill()
+        else:
+            with contextlib.suppress(OSError, ValueError):
+                self.conn.send(None)
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.kill()
+        if self.conn is not None:
+            self.conn.close()
+        self._listener.close()
+
+
+class TaskProcessPool:
+    """Run tasks in a fixed number of warm worker processes.
+
+    Parameters
+    ----------
+    n_workers : int
+        Number of worker processes kept alive.
+    max_jobs_per_worker : int or None
+        Recycle a worker after it has run this many jobs.
+    max_memory_bytes : int or None
+        Recycle a worker once its resident memory exceeds this limit after a
+        job. Requires ``psutil``.
+    """
+    def __init__(self,
+                 n_workers=1,
+                 max_jobs_per_worker=50,
+                 max_memory_bytes=None):
+        self.n_workers = n_workers
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.max_memory_bytes = max_memory_bytes
+
+        self._lock = threading.Lock()
+        self._closed = False
+        self._workers = []
+        self._idle = queue.Queue()
+        for _ in range(n_workers):
+            self._idle.put(self._spawn_worker())
+
+        atexit.register(self.shutdown)
+
+    def _spawn_worker(self):
+        # Returns None once the pool is shut down
+        if self._closed:
+            return None
+        worker = _PoolWorker()
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._workers.append(worker)
+        if closed:
+            worker.stop()
+            return None
+        return worker
+
+    def _replace_worker(self, worker):
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+        worker.stop()
+        return self._spawn_worker()
+
+    def _acquire(self):
+        # Wait for an idle worker, but not forever once the pool is shut down
+        while True:
+            if self._closed:
+                raise RuntimeError('TaskProcessPool has been shut down')
+            try:
+                worker = self._idle.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            if self._closed:
+                worker.stop()
+                continue
+            if not worker.is_alive():
+                worker = self._replace_worker(worker)
+            if worker is not None:
+                return worker
+
+    def _needs_recycling(self, worker, result):
+        if self.max_jobs_per_worker is not None and worker.jobs_done >= self.max_jobs_per_worker:
+            print(f'Recycling worker {worker.pid} after {worker.jobs_done} jobs')
+            return True
+        rss = result.get('rss')
+        if self.max_memory_bytes is not None and rss is not None and rss > self.max_memory_bytes:
+            print(f'Recycling worker {worker.pid} using {rss} bytes')
+            return True
+        return False
+
+    def _wait_for_result(self, worker, timeout=None, cancel_event=None, on_progress=None):
+        started = time.monotonic()
+        while True:
+            if worker.conn.poll(POLL_INTERVAL):
+                try:
+                    message = worker.conn.recv()
+                except EOFError:
+                    # The worker closed its end of the pipe, i.e. it died
+                    with contextlib.suppress(subprocess.TimeoutExpired):
+                        worker.process.wait(1)
+                    break
+                if message.get('event') != 'progress':
+                    return message
+                if on_progress is not None:
+                    on_progress(message)
+            elif not worker.is_alive():
+                break
+
+            # A running task cannot be interrupted, so the worker is killed
+            # and replaced by the caller
+            if cancel_event is not None and cancel_event.is_set():
+                worker.kill()
+                return dict(status='cancelled', error='Cancelled by user', rss=None)
+            if timeout is not None and time.monotonic() - started > timeout:
+                worker.kill()
+                return dict(status='failed', error=f'Timed out after {timeout} s', rss=None)
+
+        return dict(status='failed',
+                    error=f'Worker process exited with code {worker.exitcode}',
+                    rss=None)
+
+    def run(self, executable, path_to_task_args, timeout=None, cancel_event=None, zarr_url=None,
+            on_progress=None, profile_path=None):
+        """Run a task in the next idle worker and block until it is done.
+
+        Parameters
+        ----------
+        executable : str
+            Path to the task executable.
+        path_to_task_args : str
+            Path to the JSON file with the task arguments.
+        timeout : float, optional
+            Kill the job after this many seconds.
+        cancel_event : threading.Event, optional
+            Kill the job once this event is set.
+        zarr_url : str, optional
+            OME-Zarr the task writes to, checked for modified arrays.
+        on_progress : callable, optional
+            ``on_progress(event)`` called with every progress event of the
+            job, see ``task_wrapper.ProgressReporter``.
+        profile_path : str, optional
+            Profile the task and write the profile to this path plus the
+            extension of the profiler's output format.
+
+        Returns
+        -------
+        dict
+            ``status`` ('finished', 'failed' or 'cancelled'), ``error``
+            (traceback or None), ``pid`` of the worker that ran the job and
+            ``written_paths`` of the Zarr arrays the task created or modified
+            and the ``stats`` of the run, see ``task_wrapper.RunStats``.
+        """
+        return self._run_job(dict(executable=executable,
+                                  path_to_task_args=path_to_task_args,
+                                  zarr_url=zarr_url,
+                                  profile_path=profile_path),
+                             timeout, cancel_event, on_progress)
+
+    def run_pipeline(self, steps, zarr_url, timeout=None, cancel_event=None, on_progress=None,
+                     profile_path=None, scratch_dir=None):
+        """Run several tasks on one image one after the other in one worker.
+
+        The tasks run on a scratch copy of the image, see
+        ``task_wrapper.run_pipeline``. Only the outputs of steps marked with
+        ``save`` are written to the image.
+
+        Parameters
+        ----------
+        steps : list of dict
+            ``task_name``, ``executable``, ``path_to_task_args`` and ``save``
+            of every step.
+        zarr_url : str
+            The OME-Zarr image the pipeline runs on.
+        scratch_dir : str, optional
+            Directory for the scratch copy, a tmpfs keeps intermediates in
+            memory.
+
+        See ``run`` for the other parameters and the result. ``timeout``
+        applies to the whole pipeline.
+        """
+        return self._run_job(dict(pipeline=steps,
+                                  zarr_url=zarr_url,
+                                  profile_path=profile_path,
+                                  scratch_dir=scratch_dir),
+                             timeout, cancel_event, on_progress)
+
+    def _run_job(self, message, timeout, cancel_event, on_progress):
+        worker = self._acquire()
+
+        healthy = True
+        try:
+            worker.connect()
+            worker.conn.send(message)
+            result = self._wait_for_result(worker, timeout, cancel_event, on_progress)
+        except (OSError, ValueError):
+            healthy = False
+            result = dict(status='failed', error=traceback.format_exc(), rss=None)
+
+        result['pid'] = worker.pid
+        worker.jobs_done += 1
+
+        # A crashed worker is replaced, the caller only sees a failed job
+        if not healthy or not worker.is_alive() or self._needs_recycling(worker, result):
+            worker = self._replace_worker(worker)
+        if worker is not None:
+            self._release(worker)
+
+        return result
+
+    def _release(self, worker):
+        # Retire the worker instead of idling it if the pool was shrunk or
+        # shut down while it was busy
+        with self._lock:
+            retire = self._closed or len(self._workers) > self.n_workers
+            if retire:
+                if worker in self._workers:
+                    self._workers.remove(worker)
+            else:
+                self._idle.put(worker)
+        if retire:
+            worker.stop()
+
+    def resize(self, n_workers):
+        n_workers = max(1, int(n_workers))
+        if self._closed:
+            return
+        with self._lock:
+            n_missing = n_workers - len(self._workers)
+            self.n_workers = n_workers
+        for _ in range(n_missing):
+            worker = self._spawn_worker()
+            if worker is not None:
+                self._idle.put(worker)
+
+        # Retire surplus workers that are idle right now, busy ones are
+        # retired when they finish their job
+        while True:
+            with self._lock:
+                if len(self._workers) <= self.n_workers:
+                    break
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._release(worker)
+
+    def shutdown(self):
+        # Jobs waiting for a worker fail, workers that are busy now and
+        # released later are stopped by _release
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            workers = list(self._workers)
+            self._workers = []
+            while True:
+                try:
+                    self._idle.get_nowait()
+                except queue.Empty:
+                    break
+        for worker in workers:
+            worker.stop()
@@ -0,0 +1,107 @@
+import json
+import os
+
+import pytest
+
+from napari_workflow_tasks._cli import expand_zarr_urls, main
+
+THRESHOLD_TASK = '''
+import os
+
+def threshold_task(zarr_url, threshold, label_name="nuclei"):
+    if threshold < 0:
+        raise ValueError("negative threshold")
+    os.makedirs(os.path.join(zarr_url, "tables"), exist_ok=True)
+    with open(os.path.join(zarr_url, "tables", label_name), "w") as f:
+        f.write(str(threshold))
+'''
+
+
+def _write_zattrs(path, attrs):
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, '.zattrs'), 'w') as f:
+        json.dump(attrs, f)
+
+
+@pytest.fixture
+def package(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    package_dir = tmp_path / 'pkg'
+    package_dir.mkdir()
+    (package_dir / 'threshold_task.py').write_text(THRESHOLD_TASK)
+    path_to_manifest = package_dir / '__FRACTAL_MANIFEST__.json'
+    path_to_manifest.write_text(json.dumps(dict(task_list=[dict(
+        name='Threshold',
+        category='Segmentation',
+        executable_parallel='threshold_task.py',
+        args_schema_parallel=dict(title='Threshold', type='object', required=['zarr_url', 'threshold'],
+                                  properties=dict(zarr_url=dict(type='string'),
+                                                  threshold=dict(type='integer'),
+                                                  label_name=dict(type='string', default='nuclei'))),
+    )])))
+
+    plate_url = str(tmp_path / 'plate.zarr')
+    _write_zattrs(plate_url, dict(plate=dict(wells=[dict(path='B/03')])))
+    _write_zattrs(os.path.join(plate_url, 'B', '03'), dict(well=dict(images=[dict(path='0'), dict(path='1')])))
+    image_url = str(tmp_path / 'image.zarr')
+    for zarr_url in [image_url, os.path.join(plate_url, 'B', '03', '0'), os.path.join(plate_url, 'B', '03', '1')]:
+        _write_zattrs(zarr_url, dict(multiscales=[dict(datasets=[dict(path='0')])]))
+    return str(path_to_manifest), plate_url, image_url
+
+
+def test_expand_zarr_urls(package):
+    _, plate_url, image_url = package
+    assert expand_zarr_urls([image_url, plate_url]) == [
+        (image_url, None),
+        (os.path.join(plate_url, 'B', '03', '0'), plate_url),
+        (os.path.join(plate_url, 'B', '03', '1'), plate_url),
+    ]
+
+
+def test_main_runs_jobs_and_writes_summary(package, tmp_path):
+    path_to_manifest, plate_url, image_url = package
+    path_to_params = tmp_path / 'params.json'
+    path_to_params.write_text(json.dumps(dict(threshold=3, label_name='cells')))
+    path_to_summary = str(tmp_path / 'results.json')
+
+    exit_code = main([path_to_manifest, 'Threshold', image_url, plate_url, '--params', str(path_to_params),
+                      '--summary', path_to_summary, '-j', '2', '--no-cache'])
+
+    assert exit_code == 0
+    with open(path_to_summary) as f:
+        summary = json.load(f)
+    assert summary['task_args'] == dict(threshold=3, label_name='cells')
+    assert (summary['n_jobs'], summary['n_finished'], summary['n_failed']) == (3, 3, 0)
+    assert summary['jobs'][1]['plate_url'] == plate_url
+    for job in summary['jobs']:
+        assert 'task' in job['stats']['phases']
+        with open(os.path.join(job['zarr_url'], 'tables', 'cells')) as f:
+            assert f.read() == '3'
+
+
+def test_main_reports_failed_jobs_and_invalid_arguments(package, tmp_path, capsys):
+    path_to_manifest, _, image_url = package
+    path_to_params = tmp_path / 'params.json'
+    path_to_summary = str(tmp_path / 'results.json')
+
+    path_to_params.write_text(json.dumps(dict(threshold=-1)))
+    assert main([path_to_manifest, 'Threshold', image_url, '--params', str(path_to_params),
+                 '--summary', path_to_summary, '--no-cache']) == 1
+    with open(path_to_summary) as f:
+        job = json.load(f)['jobs'][0]
+    assert job['status'] == 'failed'
+    assert 'negative threshold' in job['error']
+
+    path_to_params.write_text(json.dumps(dict(threshold='high')))
+    with pytest.raises(SystemExit) as excinfo:
+        main([path_to_manifest, 'Threshold', image_url, '--params', str(path_to_params),
+              '--summary', path_to_summary])
+    assert excinfo.value.code == 2
+    assert "threshold: 'high' is not of type 'integer'" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize('option', ['--checkpoint', '--roi-wise'])
+def test_main_rejects_options_it_cannot_apply(package, option):
+    path_to_manifest, _, image_url = package
+    with pytest.raises(SystemExit):
+        main([path_to_manifest, 'Threshold', image_url, option])
@@ -0,0 +1,195 @@
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+from napari_workflow_tasks import _executors
+from napari_workflow_tasks._executors import (
+    BatchExecutor,
+    DaskExecutor,
+    LocalExecutor,
+    TaskExecutor,
+    create_executor,
+)
+
+ROI_TASK = '''
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+def roi_task(zarr_url, n_rois=2, delay=0.0):
+    for i in range(n_rois):
+        logger.info(f"Now processing ROI {i + 1}/{n_rois}")
+        time.sleep(delay)
+    os.makedirs(os.path.join(zarr_url, "tables"), exist_ok=True)
+    with open(os.path.join(zarr_url, "tables", "out"), "w") as f:
+        f.write(str(os.getpid()))
+'''
+
+# Stands in for sbatch, squeue and scancel. Jobs run in the background and
+# are known to the scheduler until their script has exited
+FAKE_SCHEDULER = '''
+import os
+import signal
+import subprocess
+import sys
+
+state_dir = os.path.dirname(os.path.abspath(__file__))
+command = sys.argv[1]
+if command == "submit":
+    process = subprocess.Popen(["/bin/sh", "-c", f"/bin/sh {sys.argv[2]}; touch {state_dir}/$$.done"],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    print(f"Submitted batch job {process.pid}")
+elif command == "status":
+    if not os.path.exists(f"{state_dir}/{sys.argv[2]}.done"):
+        print("RUNNING")
+elif command == "cancel":
+    os.killpg(int(sys.argv[2]), signal.SIGTERM)
+'''
+
+
+@pytest.fixture
+def roi_task(tmp_path):
+    executable = tmp_path / 'roi_task.py'
+    executable.write_text(ROI_TASK)
+    zarr_url = tmp_path / 'image.zarr'
+    zarr_url.mkdir()
+
+    def _write_args(**task_args):
+        path_to_task_args = tmp_path / 'args.json'
+        path_to_task_args.write_text(json.dumps(dict(task_args, zarr_url=str(zarr_url))))
+        return str(path_to_task_args)
+
+    return str(executable), str(zarr_url), _write_args
+
+
+@pytest.fixture
+def batch_executor(tmp_path, monkeypatch):
+    monkeypatch.setattr(_executors, 'POLL_INTERVAL', 0.05)
+    scheduler_dir = tmp_path / 'scheduler'
+    scheduler_dir.mkdir()
+    fake_scheduler = scheduler_dir / 'fake_scheduler.py'
+    fake_scheduler.write_text(FAKE_SCHEDULER)
+    command = [sys.executable, str(fake_scheduler)]
+    executor = BatchExecutor(submit_command=command + ['submit'],
+                             status_command=command + ['status', '{job_id}'],
+                             cancel_command=command + ['cancel', '{job_id}'],
+                             directives=['--mem=1G'],
+                             job_dir=str(tmp_path / 'jobs'))
+    yield executor
+    executor.shutdown()
+
+
+def _check_result(result, zarr_url):
+    assert result['status'] == 'finished', result['error']
+    assert result['written_paths'] == []
+    assert 'task' in result['stats']['phases']
+    with open(os.path.join(zarr_url, 'tables', 'out')) as f:
+        assert f.read() == str(result['pid'])
+
+
+def test_local_executor(roi_task):
+    executable, zarr_url, write_args = roi_task
+    executor = LocalExecutor(n_workers=1)
+    try:
+        result = executor.run(executable, write_args(), zarr_url=zarr_url)
+    finally:
+        executor.shutdown()
+    _check_result(result, zarr_url)
+    assert executor.shares_memory
+
+
+def test_local_executor_recycles_workers_above_memory_limit(roi_task):
+    # Workers only report their memory with psutil
+    pytest.importorskip('psutil')
+    executable, zarr_url, write_args = roi_task
+    executor = create_executor('Local processes', max_worker_memory=2 ** 40)
+    try:
+        assert executor.pool.max_memory_bytes == 2 ** 40
+        first = executor.run(executable, write_args(), zarr_url=zarr_url)
+        # Any worker keeps more than one byte
+        executor.set_worker_memory_limit(1)
+        second = executor.run(executable, write_args(), zarr_url=zarr_url)
+        third = executor.run(executable, write_args(), zarr_url=zarr_url)
+    finally:
+        executor.shutdown()
+    assert first['pid'] == second['pid'] != third['pid']
+
+
+def test_batch_executor(roi_task, batch_executor):
+    executable, zarr_url, write_args = roi_task
+    events = []
+    result = batch_executor.run(executable, write_args(n_rois=3, delay=0.2), zarr_url=zarr_url,
+                                on_progress=events.append)
+
+    _check_result(result, zarr_url)
+    assert any(event['total'] == 3 for event in events)
+    assert 'preload' in result['stats']['phases']
+    # Job files are cleaned up
+    assert os.listdir(batch_executor.job_dir) == []
+
+
+def test_batch_executor_job_script(batch_executor):
+    script_path = batch_executor.write_job_script(os.path.join(batch_executor.job_dir, 'job.json'))
+    with open(script_path) as f:
+        lines = f.read().splitlines()
+    assert lines[:2] == ['#!/bin/sh', '#SBATCH --mem=1G']
+    assert '--job' in lines[2]
+
+
+def test_batch_executor_cancel(roi_task, batch_executor):
+    executable, zarr_url, write_args = roi_task
+    cancel_event = threading.Event()
+    result = batch_executor.run(executable, write_args(n_rois=100, delay=0.1), zarr_url=zarr_url,
+                                cancel_event=cancel_event,
+                                on_progress=lambda event: event['current'] and cancel_event.set())
+
+    assert result['status'] == 'cancelled'
+    assert not os.path.exists(os.path.join(zarr_url, 'tables', 'out'))
+
+
+def test_batch_executor_removes_stale_cancel_files(roi_task, batch_executor):
+    executable, zarr_url, write_args = roi_task
+    stale_path = os.path.join(batch_executor.job_dir, 'stale.job.json.cancel')
+    recent_path = os.path.join(batch_executor.job_dir, 'recent.job.json.cancel')
+    for path in [stale_path, recent_path]:
+        open(path, 'w').close()
+    os.utime(stale_path, (0, 0))
+
+    result = batch_executor.run(executable, write_args(), zarr_url=zarr_url)
+
+    _check_result(result, zarr_url)
+    # The task of a recent one may not have seen it yet
+    assert os.listdir(batch_executor.job_dir) == ['recent.job.json.cancel']
+    os.utime(recent_path, (0, 0))
+    batch_executor.shutdown()
+    assert os.listdir(batch_executor.job_dir) == []
+
+
+def test_executors_implement_the_interface():
+    with pytest.raises(TypeError):
+        TaskExecutor()
+
+    class IncompleteExecutor(_executors._FileJobExecutor):
+        def _submit(self, job_path):
+            return None
+
+    with pytest.raises(TypeError):
+        IncompleteExecutor()
+
+
+def test_dask_executor(roi_task):
+    pytest.importorskip('distributed')
+    executable, zarr_url, write_args = roi_task
+    executor = DaskExecutor(n_workers=1)
+    try:
+        events = []
+        result = executor.run(executable, write_args(), zarr_url=zarr_url, on_progress=events.append)
+    finally:
+        executor.shutdown()
+    _check_result(result, zarr_url)
+    assert events
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+import zarr
+
+from napari_workflow_tasks._features import (
+    FeatureTable,
+    LabelIndex,
+    find_feature_tables,
+    merge_features,
+)
+
+ad = pytest.importorskip('anndata')
+pd = pytest.importorskip('pandas')
+
+
+def _write_table(zarr_url, table_name, label_ids, columns, table_type='feature_table', label_name='nuclei'):
+    values = np.array([[100 * j + label for j in range(len(columns))] for label in label_ids], dtype=np.float32)
+    adata = ad.AnnData(X=values,
+                       obs=pd.DataFrame(index=[str(label) for label in label_ids]),
+                       var=pd.DataFrame(index=columns))
+    adata.write_zarr(f'{zarr_url}/tables/{table_name}')
+    zarr.open_group(f'{zarr_url}/tables/{table_name}', mode='a').attrs.update(
+        type=table_type, region=dict(path=f'../labels/{label_name}'), instance_key='label')
+    tables = zarr.open_group(f'{zarr_url}/tables', mode='a')
+    tables.attrs['tables'] = tables.attrs.get('tables', []) + [table_name]
+
+
+@pytest.fixture
+def image_zarr(tmp_path):
+    zarr_url = str(tmp_path / 'image.zarr')
+    _write_table(zarr_url, 'nuclei_morphology', [3, 7, 9], ['area', 'eccentricity'])
+    _write_table(zarr_url, 'nuclei_intensity', [7, 9, 12], ['mean_intensity', 'area'])
+    _write_table(zarr_url, 'cells', [1, 2], ['area'], label_name='cells')
+    _write_table(zarr_url, 'FOV_ROI_table', [0], ['x_micrometer'], table_type='roi_table')
+    return zarr_url
+
+
+def test_find_feature_tables(image_zarr):
+    assert find_feature_tables(image_zarr, 'nuclei') == [f'{image_zarr}/tables/nuclei_morphology',
+                                                         f'{image_zarr}/tables/nuclei_intensity']
+    assert find_feature_tables(image_zarr, 'cells') == [f'{image_zarr}/tables/cells']
+    assert find_feature_tables(image_zarr, 'organoids') == []
+
+
+@pytest.mark.parametrize('label_ids', [[5, 1, 8, 3], [5, 1, 10 ** 9, 3]])
+def test_label_index(label_ids):
+    index = LabelIndex(label_ids)
+    assert len(index) == 4
+    assert [index[label] for label in label_ids] == [0, 1, 2, 3]
+    assert index.get(2) is None and 2 not in index and -1 not in index
+    with pytest.raises(KeyError):
+        index[4]
+    np.testing.assert_array_equal(index.get_rows(np.array([[3, 4], [5, 0]])), [[3, -1], [0, -1]])
+
+
+def test_feature_table_reads_requested_columns(image_zarr):
+    table = FeatureTable(f'{image_zarr}/tables/nuclei_morphology')
+    assert table.columns == ['area', 'eccentricity']
+    np.testing.assert_array_equal(table.label_ids, [3, 7, 9])
+
+    features = table.get_features(['eccentricity', 'perimeter'])
+    assert list(features.columns) == ['index', 'eccentricity']
+    np.testing.assert_array_equal(features['eccentricity'], [103, 107, 109])
+    assert list(table._values) == ['eccentricity']
+    assert table.get_value(9, 'area') == 9
+    assert table.get_value(4, 'area') is None
+
+
+def test_merge_features(image_zarr):
+    tables = [FeatureTable(table_url) for table_url in find_feature_tables(image_zarr, 'nuclei')]
+    features = merge_features(tables).sort_values('index')
+
+    assert list(features.columns) == ['index', 'area', 'eccentricity', 'mean_intensity',
+                                      'area (nuclei_intensity)']
+    np.testing.assert_array_equal(features['index'], [3, 7, 9, 12])
+    np.testing.assert_array_equal(features['mean_intensity'], [np.nan, 7, 9, 12])
@@ -0,0 +1,52 @@
+import os
+
+import numpy as np
+import zarr
+
+from napari_workflow_tasks._in_memory import (
+    read_in_memory_labels,
+    remove_in_memory_zarr,
+    write_in_memory_zarr,
+)
+from napari_workflow_tasks._preview import read_roi_table
+
+
+def test_write_in_memory_zarr():
+    data = np.arange(64 * 48, dtype='uint16').reshape(64, 48)
+    zarr_url = write_in_memory_zarr(data, dict(name='blurred', scale=[0.5, 0.5]))
+    try:
+        image = zarr.open_group(zarr_url, mode='r')
+        assert [axis['name'] for axis in image.attrs['multiscales'][0]['axes']] == ['c', 'z', 'y', 'x']
+        assert image.attrs['omero']['channels'][0]['label'] == 'blurred'
+        # Uncompressed, one chunk per plane and no pyramid
+        assert image['0'].compressor is None
+        assert image['0'].chunks == (1, 1, 64, 48)
+        assert list(image.keys()) == ['0', 'tables']
+        np.testing.assert_array_equal(image['0'][0, 0], data)
+
+        roi_table = read_roi_table(zarr_url, 'FOV_ROI_table')
+        assert roi_table['len_y_micrometer'][0] == 32
+        assert roi_table['len_x_micrometer'][0] == 24
+    finally:
+        remove_in_memory_zarr(zarr_url)
+    assert not os.path.exists(os.path.dirname(zarr_url))
+
+
+def test_read_in_memory_labels_is_memory_mapped():
+    zarr_url = write_in_memory_zarr(np.zeros((32, 32), dtype='uint16'), dict(name='image'))
+    labels = np.zeros((1, 32, 32), dtype='uint32')
+    labels[0, 4:8, 4:8] = 3
+    group = zarr.open_group(zarr_url, mode='a').require_group('labels').require_group('nuclei')
+    group.create_dataset('0', data=labels, chunks=labels.shape, compressor=None)
+    group.create_dataset('1', data=labels, chunks=(1, 16, 16))
+    group.attrs['multiscales'] = [dict(version='0.4', axes=['z', 'y', 'x'],
+                                       datasets=[dict(path='0'), dict(path='1')])]
+
+    data, metadata = read_in_memory_labels(zarr_url, 'nuclei')
+    assert isinstance(data, np.memmap)
+    assert metadata['paths'] == ['0', '1']
+
+    # The mapping outlives the temporary image
+    remove_in_memory_zarr(zarr_url)
+    np.testing.assert_array_equal(data, labels)
+    data[0, 0, 0] = 1
@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+import zarr
+from napari.layers import Labels
+
+from napari_workflow_tasks._label_edits import EditableLabels
+from napari_workflow_tasks._writer import write_multiple
+
+
+def _write_labels(tmp_path, shape=(64, 64)):
+    labels = np.zeros(shape, dtype='uint32')
+    labels[8:24, 8:24] = 1
+    zarr_url = str(tmp_path / 'image.zarr')
+    write_multiple(zarr_url, [(np.zeros(shape, dtype='uint16'), dict(name='image'), 'image'),
+                              (labels, dict(name='nuclei'), 'labels')],
+                   chunk_size=16, min_size=8)
+    return zarr_url, labels
+
+
+def _mtimes(array_url):
+    return {os.path.relpath(os.path.join(root, name), array_url): os.stat(os.path.join(root, name)).st_mtime_ns
+            for root, _, files in os.walk(array_url) for name in files if not name.startswith('.')}
+
+
+def test_editable_labels_indexing(tmp_path):
+    zarr_url, labels = _write_labels(tmp_path)
+    data = EditableLabels(zarr_url, 'nuclei')
+
+    assert data.shape == labels.shape
+    np.testing.assert_array_equal(data[...], labels)
+    np.testing.assert_array_equal(data[10, 4:30:3], labels[10, 4:30:3])
+
+    data[np.array([0, 40]), np.array([0, 50])] = 7
+    data[28:32, 14:18] = 3
+    labels[[0, 40], [0, 50]] = 7
+    labels[28:32, 14:18] = 3
+    np.testing.assert_array_equal(np.asarray(data), labels)
+    np.testing.assert_array_equal(data[np.array([0, 31]), np.array([0, 15])], [7, 3])
+    # (0, 0), (2, 3), (1, 0) and (1, 1) in the 16 x 16 chunk grid
+    assert data.dirty == {(0, 0), (2, 3), (1, 0), (1, 1)}
+
+
+def test_flush_writes_only_painted_chunks(tmp_path):
+    zarr_url, labels = _write_labels(tmp_path)
+    label_url = os.path.join(zarr_url, 'labels', 'nuclei')
+    layer = Labels(EditableLabels(zarr_url, 'nuclei'))
+    before = _mtimes(os.path.join(label_url, '0'))
+
+    layer.brush_size = 3
+    layer.paint((50, 50), 2)
+    written_paths = layer.data.flush()
+
+    assert written_paths[0] == os.path.join(label_url, '0')
+    changed = {path for path, mtime in _mtimes(os.path.join(label_url, '0')).items() if before[path] != mtime}
+    assert changed == {os.path.join('3', '3')}
+
+    level_0 = zarr.open(os.path.join(label_url, '0'), mode='r')[:]
+    assert level_0[50, 50] == 2
+    np.testing.assert_array_equal(level_0[:48, :48], labels[:48, :48])
+    # Lower resolutions follow the edit
+    level_1 = zarr.open(os.path.join(label_url, '1'), mode='r')[:]
+    assert level_1[25, 25] == 2
+    assert level_1[8, 8] == 1
+    assert layer.data.flush() == []
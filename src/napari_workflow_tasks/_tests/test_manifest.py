@@ -0,0 +1,71 @@
+import json
+import os
+
+import pytest
+
+from napari_workflow_tasks._manifest import ManifestIndex
+
+
+def _task(name, category, tags=()):
+    return dict(name=name,
+                category=category,
+                tags=list(tags),
+                executable_parallel=f'{name.lower()}.py',
+                args_schema_parallel=dict(title=name.replace(' ', ''),
+                                          type='object',
+                                          required=['zarr_url'],
+                                          properties=dict(zarr_url=dict(type='string'))))
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    path_to_manifest = str(tmp_path / 'pkg' / '__FRACTAL_MANIFEST__.json')
+    os.makedirs(os.path.dirname(path_to_manifest))
+    task_list = [_task('Cellpose Segmentation', 'Segmentation', tags=['Deep Learning']),
+                 _task('Measure Features', 'Measurement'),
+                 _task('Create OME-Zarr', 'Conversion')]
+    # Init-only tasks have no parallel part and are not indexed
+    task_list.append(dict(name='Init only', category='Conversion', executable_non_parallel='init.py'))
+    with open(path_to_manifest, 'w') as f:
+        json.dump(dict(task_list=task_list), f)
+    return path_to_manifest
+
+
+def test_manifest_index_search(manifest, tmp_path):
+    index = ManifestIndex(index_dir=str(tmp_path / 'index'))
+    tasks = index.load(manifest)
+
+    assert [task['name'] for task in tasks] == ['Cellpose Segmentation', 'Measure Features', 'Create OME-Zarr']
+    assert [task['name'] for _, task in index.search('deep')] == ['Cellpose Segmentation']
+    assert [task['name'] for _, task in index.search('', categories=['Measurement'])] == ['Measure Features']
+    assert index.get_schema(manifest, 'Measure Features')['title'] == 'MeasureFeatures'
+
+
+def test_manifest_index_uses_persistent_cache(manifest, tmp_path):
+    ManifestIndex(index_dir=str(tmp_path / 'index')).load(manifest)
+    # Summaries and schemas are cached as JSON
+    cached = sorted(os.listdir(tmp_path / 'index'))
+    assert len(cached) == 2 and all(name.endswith('.json') for name in cached)
+    with open(tmp_path / 'index' / next(name for name in cached if name.endswith('.schemas.json'))) as f:
+        assert set(json.load(f)['schemas']) == {'Cellpose Segmentation', 'Measure Features', 'Create OME-Zarr'}
+
+    # A new session must not parse the manifest again
+    index = ManifestIndex(index_dir=str(tmp_path / 'index'))
+    index._parse_manifest = None
+    tasks = index.load(manifest)
+    assert len(tasks) == 3
+    assert index.get_schema(manifest, 'Cellpose Segmentation')['required'] == ['zarr_url']
+
+
+def test_manifest_index_reparses_modified_manifest(manifest, tmp_path):
+    index = ManifestIndex(index_dir=str(tmp_path / 'index'))
+    index.load(manifest)
+
+    with open(manifest, 'w') as f:
+        json.dump(dict(task_list=[_task('Threshold', 'Segmentation')]), f)
+    os.utime(manifest, ns=(0, 0))
+
+    index = ManifestIndex(index_dir=str(tmp_path / 'index'))
+    assert [task['name'] for task in index.load(manifest)] == ['Threshold']
+    index.save_recent_packages()
+    assert index.get_recent_packages() == [os.path.abspath(manifest)]
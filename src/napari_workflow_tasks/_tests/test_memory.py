@@ -0,0 +1,99 @@
+import pytest
+import zarr
+
+from napari_workflow_tasks._memory import (
+    GIB,
+    MIN_WORKER_MEMORY_LIMIT,
+    TASK_MEMORY,
+    WORKER_BYTES,
+    estimate_job_memory,
+    estimate_task_memory,
+    get_memory_warning,
+    get_worker_memory_limit,
+    suggest_alternatives,
+)
+from napari_workflow_tasks._preview import write_roi_table
+from napari_workflow_tasks._scheduler import TaskJob
+
+pytest.importorskip('anndata')
+
+
+@pytest.fixture
+def image_zarr(tmp_path):
+    # Two channels of 4096 x 4096 pixels of 0.5 um, only the metadata is written
+    zarr_url = str(tmp_path / 'image.zarr')
+    root = zarr.open_group(zarr_url, mode='w')
+    for level in range(3):
+        size = 4096 // 2 ** level
+        root.create_dataset(str(level), shape=(2, 1, size, size), chunks=(1, 1, 1024, 1024), dtype='uint16')
+    root.attrs['multiscales'] = [dict(
+        version='0.4',
+        axes=[dict(name=axis) for axis in 'czyx'],
+        datasets=[dict(path=str(level), coordinateTransformations=[
+            dict(type='scale', scale=[1, 1, 0.5 * 2 ** level, 0.5 * 2 ** level])]) for level in range(3)],
+    )]
+    # Four FOVs of 1024 x 1024 pixels, the last one not aligned to the chunks
+    write_roi_table(zarr_url, 'FOV_ROI_table', [[0, 0, 0, 512, 512, 1], [512, 0, 0, 512, 512, 1],
+                                                [0, 512, 0, 512, 512, 1], [1100, 1100, 0, 512, 512, 1]])
+    write_roi_table(zarr_url, 'well_ROI_table', [[0, 0, 0, 2048, 2048, 1]])
+    return zarr_url
+
+
+def _get_bytes(task_name, input_bytes):
+    factor, fixed_bytes = TASK_MEMORY[task_name]
+    return int(input_bytes * factor + fixed_bytes + WORKER_BYTES)
+
+
+def test_estimate_task_memory(image_zarr):
+    estimate = estimate_task_memory(image_zarr, 'Cellpose Segmentation', dict())
+    assert estimate['input_bytes'] == 2 * 4096 * 4096 * 2
+    assert estimate['bytes'] == _get_bytes('Cellpose Segmentation', estimate['input_bytes'])
+
+    # One channel of the largest FOV, which touches 2 x 2 chunks
+    estimate = estimate_task_memory(image_zarr, 'Cellpose Segmentation',
+                                    dict(channel=dict(label='DAPI'), input_ROI_table='FOV_ROI_table'))
+    assert (estimate['roi_table'], estimate['region_yx']) == ('FOV_ROI_table', (2048, 2048))
+    assert estimate['input_bytes'] == 2048 * 2048 * 2
+
+    estimate = estimate_task_memory(image_zarr, 'Cellpose Segmentation', dict(level=2, input_ROI_table='missing'))
+    assert (estimate['level'], estimate['roi_table'], estimate['region_yx']) == (2, None, (1024, 1024))
+
+    # A tile of 1000 pixels anywhere in the image
+    estimate = estimate_task_memory(image_zarr, 'Thresholding Label Task', dict(), region_yx=(1000, 1000))
+    assert estimate['region_yx'] == (2048, 2048)
+
+
+def test_estimate_job_memory(image_zarr):
+    job = TaskJob('Thresholding Label Task', 'task.py', 'args.json', task_args=dict(zarr_url=image_zarr),
+                  context=dict(tiling=dict(tile_size=1024, halo=64, n_parallel=3)))
+    tile_bytes = _get_bytes('Thresholding Label Task', 2 * 3072 * 3072 * 2)
+    assert estimate_job_memory(job) == 3 * tile_bytes
+
+    job = TaskJob('Dummy', None, 'args.json', task_args=dict(zarr_url=str(image_zarr) + '_missing'))
+    assert estimate_job_memory(job) is None
+
+
+def test_suggestions_and_warning(image_zarr):
+    task_args = dict(zarr_url=image_zarr, level=0, input_ROI_table='well_ROI_table')
+    budget = 2 * GIB
+    suggestions = suggest_alternatives(image_zarr, 'Cellpose Segmentation', task_args, budget)
+    assert len(suggestions) == 3
+    assert suggestions[0].startswith('run on pyramid level 1')
+    assert 'input_ROI_table FOV_ROI_table' in suggestions[1]
+    assert suggestions[2].startswith('split the image into tiles of 512')
+
+    job = TaskJob('Cellpose Segmentation', 'task.py', 'args.json', task_args=task_args)
+    job.job_id = 1
+    job.memory = estimate_job_memory(job)
+    assert get_memory_warning(job, None) is None
+    assert get_memory_warning(job, job.memory) is None
+    warning = get_memory_warning(job, budget)
+    assert 'more than the memory budget of 2.0 GiB' in warning
+    assert warning.endswith(f'or {suggestions[2]}.')
+    assert job.memory == _get_bytes('Cellpose Segmentation', 2 * 4096 * 4096 * 2)
+
+
+def test_worker_memory_limit_is_share_of_budget():
+    assert get_worker_memory_limit(None, 4) is None
+    assert get_worker_memory_limit(32 * GIB, 4) == 8 * GIB
+    assert get_worker_memory_limit(4 * GIB, 8) == MIN_WORKER_MEMORY_LIMIT
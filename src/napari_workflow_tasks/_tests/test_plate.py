@@ -0,0 +1,51 @@
+import json
+import os
+
+import pytest
+
+from napari_workflow_tasks._plate import (
+    find_image_zarr_urls,
+    get_plate_url,
+    is_plate,
+)
+
+
+def _write_zattrs(path, attrs):
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, '.zattrs'), 'w') as f:
+        json.dump(attrs, f)
+
+
+@pytest.fixture
+def plate_url(tmp_path):
+    plate_url = str(tmp_path / 'plate.zarr')
+    wells = [('B', '03'), ('B', '05'), ('C', '03')]
+    _write_zattrs(plate_url, dict(plate=dict(
+        rows=[dict(name='B'), dict(name='C')],
+        columns=[dict(name='03'), dict(name='05')],
+        wells=[dict(path=f'{row}/{col}') for row, col in wells],
+    )))
+    for row, col in wells:
+        n_images = 2 if (row, col) == ('B', '05') else 1
+        _write_zattrs(os.path.join(plate_url, row, col),
+                      dict(well=dict(images=[dict(path=str(i)) for i in range(n_images)])))
+    return plate_url
+
+
+def test_find_image_zarr_urls(plate_url):
+    image_urls = find_image_zarr_urls(plate_url)
+
+    assert [well for well, _ in image_urls] == ['B/03', 'B/05', 'B/05', 'C/03']
+    assert image_urls[2][1] == os.path.join(plate_url, 'B/05', '1')
+
+
+def test_get_plate_url(plate_url, tmp_path):
+    image_url = os.path.join(plate_url, 'B', '03', '0')
+    os.makedirs(image_url)
+
+    assert is_plate(plate_url)
+    assert get_plate_url(image_url) == plate_url
+    assert get_plate_url(plate_url) == plate_url
+    assert get_plate_url(str(tmp_path)) is None
+    with pytest.raises(ValueError):
+        find_image_zarr_urls(str(tmp_path))
@@ -0,0 +1,113 @@
+import os
+import warnings
+
+import numpy as np
+import pytest
+import zarr
+
+from napari_workflow_tasks._preview import (
+    get_level_bbox,
+    get_roi_bbox,
+    get_shapes_bbox,
+    get_viewport_bbox,
+    read_roi_table,
+    write_cropped_zarr,
+    write_roi_table,
+)
+
+pytest.importorskip('anndata')
+
+
+@pytest.fixture
+def image_zarr(tmp_path):
+    zarr_url = str(tmp_path / 'image.zarr')
+    data = np.arange(2 * 64 * 96, dtype=np.uint16).reshape(2, 64, 96)
+    root = zarr.open_group(zarr_url, mode='w')
+    root.create_dataset('0', data=data, chunks=(1, 32, 32))
+    root.create_dataset('1', data=data[:, ::2, ::2], chunks=(1, 32, 32))
+    root.attrs['multiscales'] = [dict(
+        version='0.4',
+        axes=[dict(name='c', type='channel'), dict(name='y', type='space'), dict(name='x', type='space')],
+        datasets=[dict(path=str(i), coordinateTransformations=[
+            dict(type='scale', scale=[1, 0.5 * 2 ** i, 0.5 * 2 ** i])]) for i in range(2)],
+    )]
+    root.attrs['omero'] = dict(channels=[dict(label='DAPI'), dict(label='GFP')])
+    # Two FOVs side by side
+    write_roi_table(zarr_url, 'FOV_ROI_table', [[0, 0, 0, 24, 32, 1],
+                                                [24, 0, 0, 24, 32, 1]])
+    return zarr_url, data
+
+
+def test_roi_table_round_trip_and_bbox(image_zarr):
+    zarr_url, _ = image_zarr
+
+    roi_table = read_roi_table(zarr_url, 'FOV_ROI_table')
+    assert list(roi_table['label']) == ['0', '1']
+    np.testing.assert_allclose(roi_table['x_micrometer'], [0, 24])
+
+    assert get_roi_bbox(zarr_url, 'FOV_ROI_table', 1) == (0, 64, 48, 96)
+    with pytest.raises(ValueError):
+        get_roi_bbox(zarr_url, 'FOV_ROI_table', 2)
+
+
+def test_write_cropped_zarr(image_zarr, tmp_path):
+    zarr_url, data = image_zarr
+    out_url = str(tmp_path / 'crop.zarr')
+
+    write_cropped_zarr(zarr_url, (10, 30, 40, 90), out_url=out_url)
+
+    crop = zarr.open(os.path.join(out_url, '0'), mode='r')
+    np.testing.assert_array_equal(crop[:], data[:, 10:30, 40:90])
+    attrs = zarr.open_group(out_url, mode='r').attrs
+    assert [d['path'] for d in attrs['multiscales'][0]['datasets']] == ['0']
+    assert attrs['omero']['channels'][1]['label'] == 'GFP'
+    assert get_roi_bbox(out_url, 'FOV_ROI_table', 0) == (0, 20, 0, 50)
+    assert get_roi_bbox(out_url, 'well_ROI_table', 0) == (0, 20, 0, 50)
+
+
+def test_viewport_and_shapes_bbox(image_zarr):
+    from napari.components import ViewerModel
+
+    zarr_url, data = image_zarr
+    viewer = ViewerModel()
+    layer = viewer.add_image(data[0], scale=(0.5, 0.5))
+    camera = viewer.scene.camera if hasattr(viewer, 'scene') else viewer.camera
+    camera.center = (16, 24)
+    camera.zoom = 10
+
+    # 600 x 800 canvas pixels at zoom 10 cover 60 x 80 world units, i.e.
+    # more than the image, so the box is clipped to the image
+    assert get_viewport_bbox(viewer, layer, zarr_url, canvas_size=(600, 800)) == (0, 64, 0, 96)
+
+    camera.zoom = 100
+    y_start, y_stop, x_start, x_stop = get_viewport_bbox(viewer, layer, zarr_url, canvas_size=(600, 800))
+    assert (y_start + y_stop) / 2 == pytest.approx(32, abs=1)
+    assert (x_start + x_stop) / 2 == pytest.approx(48, abs=1)
+    # 6 x 8 world units, i.e. 12 x 16 pixels of scale 0.5
+    assert (y_stop - y_start, x_stop - x_start) == (12, 16)
+
+    if getattr(viewer, 'canvas', None) is not None:
+        # By default the size of the canvas of the viewer
+        viewer.canvas.size = (600, 800)
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', DeprecationWarning)
+            assert get_viewport_bbox(viewer, layer, zarr_url) == (y_start, y_stop, x_start, x_stop)
+
+    shapes = viewer.add_shapes([[[5, 10], [5, 20], [15, 20], [15, 10]]], shape_type='rectangle')
+    assert get_shapes_bbox(shapes, layer, zarr_url) == (10, 30, 20, 40)
+
+
+def test_write_cropped_zarr_of_coarse_level(image_zarr, tmp_path):
+    zarr_url, data = image_zarr
+    out_url = str(tmp_path / 'crop.zarr')
+
+    assert get_level_bbox(zarr_url, (10, 31, 40, 90), 5) == (1, (5, 16, 20, 45))
+    write_cropped_zarr(zarr_url, (10, 31, 40, 90), out_url=out_url, level=1)
+
+    crop = zarr.open(os.path.join(out_url, '0'), mode='r')
+    np.testing.assert_array_equal(crop[:], data[:, ::2, ::2][:, 5:16, 20:45])
+    datasets = zarr.open_group(out_url, mode='r').attrs['multiscales'][0]['datasets']
+    assert datasets == [dict(path='0', coordinateTransformations=[dict(type='scale', scale=[1, 1.0, 1.0])])]
+    # The ROI covers the crop in micrometers of the coarse level
+    np.testing.assert_allclose(read_roi_table(out_url, 'FOV_ROI_table')['len_x_micrometer'], [25])
+    assert get_roi_bbox(out_url, 'FOV_ROI_table', 0) == (0, 11, 0, 25)
@@ -1,4 +1,9 @@
+import os
+
+import dask.array as da
 import numpy as np
+import pytest
+import zarr
 
 from napari_workflow_tasks import napari_get_reader
 
@@ -29,3 +34,99 @@ def test_reader(tmp_path):
 def test_get_reader_pass():
     reader = napari_get_reader("fake.file")
     assert reader is None
+
+
+def test_reader_stacks_files_lazily(tmp_path):
+    paths = []
+    for i in range(3):
+        paths.append(str(tmp_path / f"{i}.npy"))
+        np.save(paths[-1], np.full((8, 6), i, dtype=np.uint16))
+
+    data = napari_get_reader(paths)(paths)[0][0]
+    assert isinstance(data, da.Array)
+    assert data.shape == (3, 8, 6) and data.dtype == np.uint16
+    # One chunk per file
+    assert data.numblocks == (3, 1, 1)
+    np.testing.assert_array_equal(data[1].compute(), np.ones((8, 6)))
+
+
+def test_reader_rejects_mismatched_shapes(tmp_path):
+    paths = [str(tmp_path / "a.npy"), str(tmp_path / "b.npy")]
+    np.save(paths[0], np.zeros((8, 6)))
+    np.save(paths[1], np.zeros((8, 7)))
+
+    with pytest.raises(ValueError, match="b.npy has shape"):
+        napari_get_reader(paths)(paths)
+
+
+@pytest.fixture
+def ome_zarr_image(tmp_path):
+    zarr_url = str(tmp_path / "image.zarr")
+    data = np.arange(2 * 16 * 16, dtype=np.uint16).reshape(2, 16, 16)
+    root = zarr.open_group(zarr_url, mode="w")
+    for level in range(2):
+        root.create_dataset(str(level), data=data[:, ::2 ** level, ::2 ** level], chunks=(1, 8, 8))
+    root.attrs["multiscales"] = [dict(
+        version="0.4",
+        axes=[dict(name="c", type="channel"), dict(name="y", type="space"), dict(name="x", type="space")],
+        datasets=[dict(path=str(level), coordinateTransformations=[
+            dict(type="scale", scale=[1, 0.5 * 2 ** level, 0.5 * 2 ** level])]) for level in range(2)],
+    )]
+    root.attrs["omero"] = dict(channels=[
+        dict(label="DAPI", color="0000FF", window=dict(start=0, end=300)),
+        dict(label="GFP", color="00FF00"),
+    ])
+    labels = root.require_group("labels")
+    labels.attrs["labels"] = ["nuclei"]
+    nuclei = labels.require_group("nuclei")
+    nuclei.create_dataset("0", data=(data[0] > 100).astype(np.uint32), chunks=(8, 8))
+    nuclei.attrs["multiscales"] = [dict(
+        version="0.4",
+        axes=[dict(name="y", type="space"), dict(name="x", type="space")],
+        datasets=[dict(path="0", coordinateTransformations=[dict(type="scale", scale=[0.5, 0.5])])],
+    )]
+    return zarr_url, data
+
+
+def test_ome_zarr_reader(ome_zarr_image):
+    zarr_url, data = ome_zarr_image
+
+    reader = napari_get_reader(zarr_url)
+    assert callable(reader)
+    layer_data = reader(zarr_url)
+    assert [(kwargs["name"], layer_type) for _, kwargs, layer_type in layer_data] == [
+        ("DAPI", "image"), ("GFP", "image"), ("nuclei", "labels")]
+
+    gfp, gfp_kwargs, _ = layer_data[1]
+    assert gfp_kwargs["multiscale"] and len(gfp) == 2
+    np.testing.assert_array_equal(gfp[0].compute(), data[1])
+    assert gfp_kwargs["scale"] == [0.5, 0.5]
+    assert gfp_kwargs["metadata"]["zarr_url"] == zarr_url
+    assert gfp_kwargs["metadata"]["channel"]["label"] == "GFP"
+    assert gfp_kwargs["metadata"]["label_names"] == ["nuclei"]
+    # From the omero window, else estimated on the coarsest level
+    assert layer_data[0][1]["contrast_limits"] == [0, 300]
+    assert gfp_kwargs["contrast_limits"] == [float(data[1, ::2, ::2].min()), float(data[1, ::2, ::2].max())]
+
+    nuclei, nuclei_kwargs, _ = layer_data[2]
+    assert not nuclei_kwargs["multiscale"]
+    assert nuclei_kwargs["metadata"] == dict(zarr_url=zarr_url, label_name="nuclei")
+
+
+def test_ome_zarr_reader_reuses_unchanged_arrays(ome_zarr_image):
+    zarr_url, data = ome_zarr_image
+
+    first = napari_get_reader(zarr_url)(zarr_url)
+    second = napari_get_reader(zarr_url)(zarr_url)
+    assert first[2][0] is second[2][0]
+
+    # Rewriting the labels opens them again
+    zarr.open_group(zarr_url, mode="a")["labels/nuclei"].create_dataset(
+        "0", data=np.zeros((4, 4), dtype=np.uint32), overwrite=True)
+    os.utime(os.path.join(zarr_url, "labels", "nuclei", "0", ".zarray"), ns=(0, 0))
+    third = napari_get_reader(zarr_url)(zarr_url)
+    assert third[2][0].shape == (4, 4)
+
+
+def test_get_reader_ignores_plain_directories(tmp_path):
+    assert napari_get_reader(str(tmp_path)) is None
@@ -0,0 +1,175 @@
+import os
+import shutil
+import subprocess
+import sys
+import threading
+
+import numpy as np
+import pytest
+import zarr
+
+from napari_workflow_tasks._result_cache import ResultCache
+from napari_workflow_tasks._runner import TaskRunner
+from napari_workflow_tasks._scheduler import TaskJob
+
+
+@pytest.fixture
+def task(tmp_path):
+    zarr_url = str(tmp_path / 'image.zarr')
+    root = zarr.open_group(zarr_url, mode='w')
+    root.create_dataset('0', data=np.arange(64).reshape(8, 8), chunks=(4, 4))
+    root.attrs['multiscales'] = [dict(version='0.4', axes=['y', 'x'], datasets=[dict(path='0')])]
+
+    executable = tmp_path / 'threshold_task.py'
+    executable.write_text('def threshold_task(zarr_url, threshold, label_name): pass\n')
+
+    def run(threshold, label_name='nuclei'):
+        # Stand-in for running the task, returns the written paths
+        labels = root.require_group('labels')
+        labels.attrs['labels'] = sorted(set(labels.attrs.get('labels', [])) | {label_name})
+        group = labels.require_group(label_name)
+        group.attrs['multiscales'] = [dict(version='0.4', datasets=[dict(path='0')])]
+        group.create_dataset('0', data=(root['0'][:] > threshold).astype('u4'), chunks=(4, 4), overwrite=True)
+        return [os.path.join(zarr_url, 'labels', label_name, '0')]
+
+    return zarr_url, str(executable), run
+
+
+def test_result_cache_hit_restores_outputs(task, tmp_path):
+    zarr_url, executable, run = task
+    cache = ResultCache(cache_dir=str(tmp_path / 'cache'))
+    task_args = dict(zarr_url=zarr_url, threshold=10, label_name='nuclei')
+
+    assert cache.lookup(executable, task_args) is None
+    cache.store(executable, task_args, run(10))
+
+    # Unchanged outputs are not touched on a hit
+    entry = cache.lookup(executable, task_args)
+    assert entry is not None
+    assert cache.restore(entry, zarr_url) == []
+
+    # Deleted outputs are relinked from the cache
+    shutil.rmtree(os.path.join(zarr_url, 'labels'))
+    assert cache.restore(cache.lookup(executable, task_args), zarr_url) == [
+        os.path.join(zarr_url, 'labels', 'nuclei', '0')]
+    labels = zarr.open(os.path.join(zarr_url, 'labels', 'nuclei', '0'), mode='r')[:]
+    np.testing.assert_array_equal(labels, np.arange(64).reshape(8, 8) > 10)
+    assert zarr.open_group(os.path.join(zarr_url, 'labels'), mode='r').attrs['labels'] == ['nuclei']
+
+
+def test_result_cache_hit_after_another_task(task, tmp_path):
+    zarr_url, executable, run = task
+    cache = ResultCache(cache_dir=str(tmp_path / 'cache'))
+    args_a = dict(zarr_url=zarr_url, threshold=10, label_name='nuclei')
+    args_b = dict(zarr_url=zarr_url, threshold=30, label_name='cells')
+    cache.store(executable, args_a, run(10))
+    cache.store(executable, args_b, run(30, label_name='cells'))
+
+    # Outputs of other tasks are not inputs of A
+    shutil.rmtree(os.path.join(zarr_url, 'labels', 'nuclei'))
+    entry = cache.lookup(executable, args_a)
+    assert entry is not None
+    cache.restore(entry, zarr_url)
+
+    # Label images added since A was stored stay listed
+    assert zarr.open_group(os.path.join(zarr_url, 'labels'), mode='r').attrs['labels'] == ['cells', 'nuclei']
+    labels = zarr.open(os.path.join(zarr_url, 'labels', 'nuclei', '0'), mode='r')[:]
+    np.testing.assert_array_equal(labels, np.arange(64).reshape(8, 8) > 10)
+
+
+def test_result_cache_misses(task, tmp_path):
+    zarr_url, executable, run = task
+    cache = ResultCache(cache_dir=str(tmp_path / 'cache'))
+    task_args = dict(zarr_url=zarr_url, threshold=10, label_name='nuclei')
+    cache.store(executable, task_args, run(10))
+
+    assert cache.lookup(executable, dict(task_args, threshold=20)) is None
+
+    # A modified input image invalidates the entry
+    zarr.open(os.path.join(zarr_url, '0'), mode='r+')[0, 0] = 100
+    assert cache.lookup(executable, task_args) is None
+
+
+def test_result_cache_evicts_least_recently_used(task, tmp_path):
+    zarr_url, executable, run = task
+    cache = ResultCache(cache_dir=str(tmp_path / 'cache'))
+    keys = [cache.store(executable, dict(zarr_url=zarr_url, threshold=t, label_name='nuclei'), run(t))
+            for t in range(3)]
+    entry_bytes = cache._read_index()[keys[0]]['nbytes']
+
+    cache.max_bytes = 2 * entry_bytes
+    # Touch the first entry so that the second one is the oldest
+    index = cache._read_index()
+    index[keys[0]]['last_used'] = max(entry['last_used'] for entry in index.values()) + 1
+    cache._write_index(index)
+    cache.store(executable, dict(zarr_url=zarr_url, threshold=3, label_name='nuclei'), run(3))
+
+    index = cache._read_index()
+    assert keys[0] in index
+    assert keys[1] not in index and keys[2] not in index
+    assert not os.path.exists(os.path.join(cache.cache_dir, keys[1]))
+
+
+class _BarrierExecutor:
+    # Runs two jobs at the same time, each writing its labels
+    def __init__(self, run):
+        self.run_task = run
+        self.barrier = threading.Barrier(2)
+
+    def run(self, executable, path_to_task_args, **kwargs):
+        self.barrier.wait(5)
+        with open(path_to_task_args) as f:
+            threshold = int(f.read())
+        written_paths = self.run_task(threshold, label_name=f'threshold{threshold}')
+        self.barrier.wait(5)
+        return dict(status='finished', error=None, written_paths=written_paths)
+
+
+def test_runner_does_not_cache_jobs_overlapping_on_the_same_image(task, tmp_path):
+    zarr_url, executable, run = task
+    cache = ResultCache(cache_dir=str(tmp_path / 'cache'))
+    runner = TaskRunner(executor=_BarrierExecutor(run), result_cache=cache)
+    jobs = []
+    for i, threshold in enumerate([10, 30]):
+        path_to_task_args = tmp_path / f'args{i}.json'
+        path_to_task_args.write_text(str(threshold))
+        job = TaskJob('Threshold', executable, str(path_to_task_args),
+                      task_args=dict(zarr_url=zarr_url, threshold=threshold, label_name=f'threshold{threshold}'))
+        job.job_id = i
+        jobs.append(job)
+
+    threads = [threading.Thread(target=runner.run, args=(job,)) for job in jobs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(cache.lookup(executable, job.task_args) is None for job in jobs)
+
+
+STORE_ENTRIES = """
+import sys
+
+from napari_workflow_tasks._result_cache import ResultCache
+
+cache_dir, executable, zarr_url, written_path, process = sys.argv[1:]
+cache = ResultCache(cache_dir=cache_dir)
+for i in range(10):
+    cache.store(executable, dict(zarr_url=zarr_url, threshold=100 * int(process) + i, label_name='nuclei'),
+                [written_path])
+"""
+
+
+def test_result_cache_keeps_entries_of_concurrent_processes(task, tmp_path):
+    zarr_url, executable, run = task
+    written_paths = run(10)
+    cache_dir = str(tmp_path / 'cache')
+    processes = [subprocess.Popen([sys.executable, '-c', STORE_ENTRIES, cache_dir, executable, zarr_url,
+                                   written_paths[0], str(process)])
+                 for process in range(4)]
+    assert all(process.wait(60) == 0 for process in processes)
+
+    cache = ResultCache(cache_dir=cache_dir)
+    # No process wrote the index over the entries another one added
+    assert all(cache.lookup(executable, dict(zarr_url=zarr_url, threshold=100 * process + i, label_name='nuclei'))
+               for process in range(4) for i in range(10))
@@ -0,0 +1,29 @@
+import os
+
+from napari_workflow_tasks._run_records import (
+    get_default_runs_dir,
+    get_run_prefix,
+    prune_runs,
+)
+
+
+def test_run_records_go_to_the_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    prefix = get_run_prefix(str(tmp_path / 'package' / 'Threshold_job3.json'))
+
+    assert prefix == os.path.join(get_default_runs_dir(), 'Threshold_job3')
+    assert get_default_runs_dir().startswith(str(tmp_path / 'cache'))
+    assert os.path.isdir(get_default_runs_dir())
+
+
+def test_prune_runs_keeps_the_newest_files(tmp_path):
+    for i in range(5):
+        path = tmp_path / f'Threshold_job{i}_stats.json'
+        path.write_text('{}')
+        os.utime(path, (1000 + i, 1000 + i))
+
+    prune_runs(str(tmp_path), max_files=2)
+
+    assert sorted(os.listdir(tmp_path)) == ['Threshold_job3_stats.json', 'Threshold_job4_stats.json']
+    # A missing run directory is fine
+    prune_runs(str(tmp_path / 'missing'))
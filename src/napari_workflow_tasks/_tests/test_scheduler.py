@@ -0,0 +1,194 @@
+import threading
+import time
+
+from napari_workflow_tasks._scheduler import TaskJob, TaskScheduler
+
+
+def _make_job(name, priority=0):
+    return TaskJob(task_name=name,
+                   executable='task.py',
+                   path_to_task_args=f'{name}.json',
+                   priority=priority)
+
+
+def test_scheduler_respects_priority_and_concurrency():
+    release = threading.Event()
+    started = []
+    running = []
+    max_running = []
+
+    def runner(job):
+        running.append(job)
+        max_running.append(len(running))
+        started.append(job.task_name)
+        release.wait(5)
+        running.remove(job)
+        return dict(status='finished', error=None)
+
+    scheduler = TaskScheduler(runner, max_concurrency=1)
+    # The first job blocks the queue while the others are ordered by priority
+    scheduler.submit(_make_job('first'))
+    scheduler.submit(_make_job('low', priority=-1))
+    scheduler.submit(_make_job('high', priority=5))
+    release.set()
+
+    assert scheduler.wait(timeout=5)
+    assert started == ['first', 'high', 'low']
+    assert max(max_running) == 1
+    assert all(job.status == 'finished' for job in scheduler.jobs)
+
+
+def test_scheduler_cancel_queued_and_running_jobs():
+    updates = []
+
+    def runner(job):
+        while not job.cancel_event.is_set():
+            time.sleep(0.01)
+        return dict(status='cancelled', error='Cancelled by user')
+
+    scheduler = TaskScheduler(runner, max_concurrency=1,
+                              on_update=lambda job: updates.append((job.job_id, job.status)))
+    running_id = scheduler.submit(_make_job('running'))
+    queued_id = scheduler.submit(_make_job('queued'))
+
+    assert scheduler.cancel(queued_id)
+    assert scheduler.cancel(running_id)
+    assert scheduler.wait(timeout=5)
+
+    assert scheduler.get_job(queued_id).status == 'cancelled'
+    assert scheduler.get_job(running_id).status == 'cancelled'
+    # The cancelled queued job never started
+    assert (queued_id, 'running') not in updates
+
+
+def test_scheduler_reports_failures():
+    def runner(job):
+        raise RuntimeError('boom')
+
+    scheduler = TaskScheduler(runner, max_concurrency=2)
+    job_id = scheduler.submit(_make_job('failing'))
+
+    assert scheduler.wait(timeout=5)
+    job = scheduler.get_job(job_id)
+    assert job.status == 'failed'
+    assert 'boom' in job.error
+
+
+def test_scheduler_rate_limits_progress():
+    reported = []
+
+    def runner(job):
+        for i in range(100):
+            job.report_progress(dict(current=i, total=100))
+        job.report_progress(dict(current=100, total=100))
+        return dict(status='finished', error=None)
+
+    scheduler = TaskScheduler(runner,
+                              on_progress=lambda job: reported.append(job.progress['current']),
+                              progress_interval=60)
+    scheduler.submit(_make_job('rois'))
+
+    assert scheduler.wait(timeout=5)
+    # The first and the completing update get through, the rest is dropped
+    assert reported == [0, 100]
+
+
+def test_scheduler_passes_on_held_back_progress():
+    reported = []
+
+    def runner(job):
+        # ROI 2 starts right after ROI 1 and takes a while
+        job.report_progress(dict(current=1, total=3))
+        job.report_progress(dict(current=2, total=3))
+        time.sleep(0.5)
+        return dict(status='finished', error=None)
+
+    scheduler = TaskScheduler(runner,
+                              on_progress=lambda job: reported.append(job.progress['current']),
+                              progress_interval=0.1)
+    scheduler.submit(_make_job('rois'))
+
+    assert scheduler.wait(timeout=5)
+    assert reported == [1, 2]
+
+
+def test_scheduler_limits_jobs_sharing_a_key():
+    lock = threading.Lock()
+    running = dict(sweep=0, other=0)
+    max_running = dict(sweep=0, other=0)
+
+    def runner(job):
+        key = job.limit_key or 'other'
+        with lock:
+            running[key] += 1
+            max_running[key] = max(max_running[key], running[key])
+        time.sleep(0.05)
+        with lock:
+            running[key] -= 1
+        return dict(status='finished', error=None)
+
+    scheduler = TaskScheduler(runner, max_concurrency=3)
+    scheduler.set_limit('sweep', 1)
+    for i in range(4):
+        job = _make_job(f'variant{i}')
+        job.limit_key = 'sweep'
+        scheduler.submit(job)
+    # Queued behind the held back variants, but not blocked by them
+    scheduler.submit(_make_job('other'))
+    scheduler.submit(_make_job('other'))
+
+    assert scheduler.wait(timeout=5)
+    assert max_running == dict(sweep=1, other=2)
+    assert all(job.status == 'finished' for job in scheduler.jobs)
+
+
+def test_scheduler_admits_jobs_within_memory_budget():
+    lock = threading.Lock()
+    running = []
+    peak_memory = []
+
+    def runner(job):
+        with lock:
+            running.append(job)
+            peak_memory.append(sum(job.memory for job in running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(job)
+        return dict(status='finished', error=None)
+
+    scheduler = TaskScheduler(runner, max_concurrency=4, memory_budget=100)
+    for name, memory in [('a', 60), ('b', 60), ('c', 30), ('huge', 500)]:
+        job = _make_job(name)
+        job.memory = memory
+        scheduler.submit(job)
+
+    assert scheduler.wait(timeout=5)
+    # The job exceeding the budget on its own ran alone
+    assert max(peak_memory) == 500
+    assert all(memory <= 100 for memory in peak_memory if memory != 500)
+    assert all(job.status == 'finished' for job in scheduler.jobs)
+
+
+def test_scheduler_does_not_starve_large_job_behind_small_ones():
+    started = []
+
+    def runner(job):
+        started.append(job.task_name)
+        time.sleep(0.05)
+        return dict(status='finished', error=None)
+
+    scheduler = TaskScheduler(runner, max_concurrency=4, memory_budget=100)
+    for name, memory in [('small0', 40), ('small1', 40), ('large', 80)]:
+        job = _make_job(name)
+        job.memory = memory
+        scheduler.submit(job)
+    # A steady stream of small jobs that would always fit next to the others
+    for i in range(2, 12):
+        job = _make_job(f'small{i}')
+        job.memory = 40
+        scheduler.submit(job)
+        time.sleep(0.02)
+
+    assert scheduler.wait(timeout=5)
+    assert started[:3] == ['small0', 'small1', 'large']
+    assert all(job.status == 'finished' for job in scheduler.jobs)
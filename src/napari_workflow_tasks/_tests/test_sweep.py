@@ -0,0 +1,98 @@
+import json
+
+import numpy as np
+import pytest
+
+from napari_workflow_tasks._manifest import ManifestIndex
+from napari_workflow_tasks._sweep import (
+    MAX_SWEEP_VARIANTS,
+    SweepStack,
+    get_sweep_names,
+    get_sweep_schema,
+    get_sweep_variants,
+    parse_sweep_values,
+    set_sweep_values,
+)
+from napari_workflow_tasks._task_manager import FractalTaskManager
+
+SCHEMA = dict(
+    title='CellposeSegmentation',
+    type='object',
+    required=['zarr_url'],
+    properties=dict(
+        zarr_url=dict(title='Zarr Url', type='string'),
+        level=dict(title='Level', type='integer', default=0),
+        diameter=dict(title='Diameter', type='number', default=30.0),
+        advanced=dict(title='Advanced', **{'$ref': '#/$defs/AdvancedModel'}),
+    ),
+    **{'$defs': dict(AdvancedModel=dict(
+        title='AdvancedModel',
+        type='object',
+        properties=dict(flow_threshold=dict(title='Flow Threshold', type='number', default=0.4),
+                        cellprob_threshold=dict(title='Cellprob Threshold', type='number', default=0.0),
+                        normalize=dict(title='Normalize', type='boolean', default=True)),
+    ))},
+)
+
+
+@pytest.fixture
+def task_manager(tmp_path):
+    path_to_manifest = str(tmp_path / '__FRACTAL_MANIFEST__.json')
+    with open(path_to_manifest, 'w') as f:
+        json.dump(dict(task_list=[dict(name='Cellpose Segmentation',
+                                       category='Segmentation',
+                                       executable_parallel='cellpose_segmentation.py',
+                                       args_schema_parallel=SCHEMA)]), f)
+    task_manager = FractalTaskManager(manifest_index=ManifestIndex(index_dir=str(tmp_path / 'index')))
+    task_manager.load_package(path_to_manifest)
+    return task_manager
+
+
+def test_get_sweep_names(task_manager):
+    names = get_sweep_names(task_manager, 'Cellpose Segmentation', ignore=['level'])
+    assert names == ['diameter', 'advanced.flow_threshold', 'advanced.cellprob_threshold']
+    assert get_sweep_schema(task_manager, 'Cellpose Segmentation', 'advanced.flow_threshold')['default'] == 0.4
+
+
+def test_parse_sweep_values():
+    assert parse_sweep_values('100:400:100', dict(type='integer')) == [100, 200, 300, 400]
+    assert parse_sweep_values('0.1:0.3:0.1', dict(type='number')) == [0.1, 0.2, 0.3]
+    assert parse_sweep_values('1, 2,5, 2', dict(type='number')) == [1.0, 2.0, 5.0]
+    for text, schema in [('', dict(type='number')), ('1:2', dict(type='number')), ('3:1:1', dict(type='number')),
+                         ('a, b', dict(type='number')), ('1.5, 2', dict(type='integer'))]:
+        with pytest.raises(ValueError):
+            parse_sweep_values(text, schema)
+
+
+def test_get_sweep_variants():
+    variants = get_sweep_variants([('diameter', [20, 30]), ('advanced.flow_threshold', [0.2, 0.4, 0.6])])
+    assert len(variants) == 6
+    assert variants[4] == ((1, 1), {'diameter': 30, 'advanced.flow_threshold': 0.4})
+    with pytest.raises(ValueError):
+        get_sweep_variants([('diameter', list(range(MAX_SWEEP_VARIANTS + 1)))])
+
+
+def test_set_sweep_values_keeps_earlier_args(task_manager):
+    task_name = 'Cellpose Segmentation'
+    set_sweep_values(task_manager, task_name, {'diameter': 20.0, 'advanced.flow_threshold': 0.2})
+    earlier_args = task_manager.get_args_dict(task_name)
+    set_sweep_values(task_manager, task_name, {'advanced.cellprob_threshold': -1.0})
+
+    assert earlier_args['advanced'] == dict(type='AdvancedModel',
+                                            args=dict(flow_threshold=0.2, cellprob_threshold=0.0, normalize=True))
+    args = task_manager.get_args_dict(task_name)
+    assert args['diameter'] == 20.0
+    assert args['advanced']['args'] == dict(flow_threshold=0.2, cellprob_threshold=-1.0, normalize=True)
+
+
+def test_sweep_stack():
+    stack = SweepStack((2, 3))
+    stack.add((0, 1), np.ones((1, 4, 5), dtype=np.uint16))
+    data = stack.add((1, 2), np.full((1, 4, 5), 70000, dtype=np.uint32))
+
+    assert data.shape == (2, 3, 1, 4, 5)
+    assert data.dtype == np.uint32
+    assert data[0, 1].sum() == 20 and data[1, 2].max() == 70000
+    assert data[0, 0].sum() == 0
+    with pytest.raises(ValueError):
+        stack.add((1, 1), np.ones((4, 5), dtype=np.uint16))
@@ -0,0 +1,91 @@
+import json
+import os
+
+import pytest
+
+from napari_workflow_tasks._manifest import ManifestIndex
+from napari_workflow_tasks._task_manager import (
+    FractalTaskManager,
+    TaskArgsError,
+    parse_value,
+)
+
+SCHEMA = dict(
+    title='CellposeSegmentation',
+    type='object',
+    required=['zarr_url', 'level'],
+    properties=dict(
+        zarr_url=dict(title='Zarr Url', type='string'),
+        level=dict(title='Level', type='integer'),
+        diameter=dict(title='Diameter', type='number', default=30.0),
+        channel=dict(title='Channel', **{'$ref': '#/$defs/ChannelInputModel'}),
+    ),
+    **{'$defs': dict(ChannelInputModel=dict(
+        title='ChannelInputModel',
+        type='object',
+        properties=dict(label=dict(title='Label', type='string'),
+                        wavelength_id=dict(title='Wavelength Id', type='string'),
+                        normalize=dict(title='Normalize', type='boolean', default=True)),
+    ))},
+)
+
+
+@pytest.fixture
+def task_manager(tmp_path):
+    path_to_manifest = str(tmp_path / 'pkg' / '__FRACTAL_MANIFEST__.json')
+    os.makedirs(os.path.dirname(path_to_manifest))
+    with open(path_to_manifest, 'w') as f:
+        json.dump(dict(task_list=[dict(name='Cellpose Segmentation',
+                                       category='Segmentation',
+                                       executable_parallel='cellpose_segmentation.py',
+                                       args_schema_parallel=SCHEMA),
+                                  dict(name='Convert', category='Conversion',
+                                       executable_parallel='convert.py',
+                                       args_schema_parallel=dict(title='Convert', type='object', properties=dict()))]),
+                  f)
+    task_manager = FractalTaskManager(manifest_index=ManifestIndex(index_dir=str(tmp_path / 'index')),
+                                      args_dir=str(tmp_path))
+    registered = task_manager.load_package(path_to_manifest)
+    assert [task['name'] for task in registered] == ['Cellpose Segmentation']
+    return task_manager
+
+
+def test_parse_value():
+    assert parse_value('', dict(type='integer')) is None
+    assert parse_value('3', dict(type='integer')) == 3
+    assert parse_value('2.5', dict(type='number')) == 2.5
+    assert parse_value('[1, 2]', dict(type='array')) == [1, 2]
+    # Left for the validation to report
+    assert parse_value('high', dict(type='integer')) == 'high'
+
+
+def test_set_args_and_write_to_json(task_manager, tmp_path):
+    name = 'Cellpose Segmentation'
+    task_manager.set_args(name, dict(zarr_url='/data/image.zarr', level=2, channel=dict(label='DAPI')))
+    task_manager.validate_args(name)
+
+    path_to_json = task_manager.write_to_json(name, job_id=7)
+    assert path_to_json == str(tmp_path / 'CellposeSegmentation_job7.json')
+    with open(path_to_json) as f:
+        args = json.load(f)
+    # Parameter groups are passed to the task wrapper with the name of their model
+    assert args['channel'] == dict(args=dict(label='DAPI', normalize=True), type='ChannelInputModel')
+
+    with pytest.raises(TaskArgsError, match='no argument tile'):
+        task_manager.set_args(name, dict(tile=1))
+
+
+def test_validate_args_reports_every_error(task_manager):
+    name = 'Cellpose Segmentation'
+    task_manager.set_args(name, dict(zarr_url='/data/image.zarr', diameter='large',
+                                     channel=dict(normalize='yes')))
+    with pytest.raises(TaskArgsError) as excinfo:
+        task_manager.validate_args(name)
+    message = str(excinfo.value)
+    assert "'level' is a required property" in message
+    assert "diameter: 'large' is not of type 'number'" in message
+    assert "channel/normalize: 'yes' is not of type 'boolean'" in message
+
+    # Unset arguments are left to the defaults of the task
+    task_manager.set_args(name, dict(level=0, diameter=None, channel=dict(normalize=False)))
+    task_manager.validate_args(name)
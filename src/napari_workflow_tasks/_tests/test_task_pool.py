@@ -0,0 +1,200 @@
+import json
+import os
+import threading
+
+import pytest
+
+from napari_workflow_tasks._task_pool import TaskProcessPool
+
+DUMMY_TASK = '''
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+def dummy_task(zarr_url, mode="ok"):
+    if mode == "sleep":
+        time.sleep(60)
+    if mode == "rois":
+        for i_ROI in range(3):
+            logger.info(f"Now processing ROI {i_ROI + 1}/3")
+            time.sleep(0.15)
+    if mode == "crash":
+        os._exit(3)
+    if mode == "raise":
+        raise ValueError("bad input")
+    with open(zarr_url, "w") as f:
+        f.write(str(os.getpid()))
+'''
+
+
+@pytest.fixture
+def dummy_task(tmp_path):
+    executable = tmp_path / 'dummy_task.py'
+    executable.write_text(DUMMY_TASK)
+
+    def _write_args(name, **task_args):
+        path_to_task_args = tmp_path / f'{name}.json'
+        task_args.setdefault('zarr_url', str(tmp_path / f'{name}.out'))
+        path_to_task_args.write_text(json.dumps(task_args))
+        return str(path_to_task_args)
+
+    return str(executable), _write_args
+
+
+def test_pool_reuses_warm_worker(tmp_path, dummy_task):
+    executable, write_args = dummy_task
+    pool = TaskProcessPool(n_workers=1)
+    try:
+        first = pool.run(executable, write_args('a'))
+        second = pool.run(executable, write_args('b'))
+    finally:
+        pool.shutdown()
+
+    assert first['status'] == second['status'] == 'finished'
+    assert first['pid'] == second['pid']
+    assert (tmp_path / 'a.out').read_text() == (tmp_path / 'b.out').read_text()
+    # Only the first job paid for starting the worker
+    assert {'spawn', 'preload', 'task'} <= set(first['stats']['phases'])
+    assert 'spawn' not in second['stats']['phases']
+
+
+def test_pool_survives_failing_and_crashing_tasks(dummy_task):
+    executable, write_args = dummy_task
+    pool = TaskProcessPool(n_workers=1)
+    try:
+        raised = pool.run(executable, write_args('raise', mode='raise'))
+        crashed = pool.run(executable, write_args('crash', mode='crash'))
+        recovered = pool.run(executable, write_args('ok'))
+    finally:
+        pool.shutdown()
+
+    assert raised['status'] == 'failed'
+    assert 'bad input' in raised['error']
+    assert crashed['status'] == 'failed'
+    assert 'exited with code 3' in crashed['error']
+    assert recovered['status'] == 'finished'
+    assert recovered['pid'] != crashed['pid']
+
+
+def test_pool_recycles_after_max_jobs(dummy_task):
+    executable, write_args = dummy_task
+    pool = TaskProcessPool(n_workers=1, max_jobs_per_worker=1)
+    try:
+        pids = [pool.run(executable, write_args(str(i)))['pid'] for i in range(2)]
+    finally:
+        pool.shutdown()
+
+    assert pids[0] != pids[1]
+    assert os.getpid() not in pids
+
+
+def test_pool_timeout_and_cancel(dummy_task):
+    executable, write_args = dummy_task
+    pool = TaskProcessPool(n_workers=1)
+    cancel_event = threading.Event()
+    cancel_event.set()
+    try:
+        timed_out = pool.run(executable, write_args('slow', mode='sleep'), timeout=0.5)
+        cancelled = pool.run(executable, write_args('slow', mode='sleep'), cancel_event=cancel_event)
+        recovered = pool.run(executable, write_args('ok'))
+    finally:
+        pool.shutdown()
+
+    assert timed_out['status'] == 'failed'
+    assert 'Timed out' in timed_out['error']
+    assert cancelled['status'] == 'cancelled'
+    assert recovered['status'] == 'finished'
+
+
+def test_pool_streams_progress(dummy_task):
+    executable, write_args = dummy_task
+    pool = TaskProcessPool(n_workers=1)
+    events = []
+    try:
+        result = pool.run(executable, write_args('rois', mode='rois'), on_progress=events.append)
+    finally:
+        pool.shutdown()
+
+    assert result['status'] == 'finished'
+    assert [(event['current'], event['total']) for event in events] == [(0, 3), (1, 3), (2, 3), (3, 3)]
+    assert events[1]['stage'] == 'Now processing ROI 2/3'
+    assert events[1]['rate'] > 0 and events[1]['eta'] > 0
+
+
+
+def test_pool_shutdown_with_busy_and_waiting_jobs(dummy_task):
+    executable, write_args = dummy_task
+    pool = TaskProcessPool(n_workers=1)
+    workers = list(pool._workers)
+    started = threading.Event()
+    results = dict()
+    errors = dict()
+
+    def _run(name, **kwargs):
+        try:
+            results[name] = pool.run(executable, write_args(name, **kwargs), on_progress=lambda event: started.set())
+        except RuntimeError as e:
+            errors[name] = e
+
+    busy = threading.Thread(target=_run, args=('rois',), kwargs=dict(mode='rois'), daemon=True)
+    busy.start()
+    assert started.wait(30)
+    # Waits for the only worker, which is busy
+    waiting = threading.Thread(target=_run, args=('ok',), daemon=True)
+    waiting.start()
+    pool.shutdown()
+    busy.join(10)
+    waiting.join(10)
+
+    assert not busy.is_alive() and not waiting.is_alive()
+    assert 'shut down' in str(errors['ok'])
+    # The busy worker is not idled, nor replaced, once its job is done
+    assert not any(worker.is_alive() for worker in workers)
+    assert pool._idle.empty() and pool._workers == []
+    pool.resize(2)
+    assert pool._workers == []
+
+
+TABLE_TASK = '''
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+def table_task(zarr_url, name):
+    logger.info("Now processing ROI 1/1")
+    os.makedirs(os.path.join(zarr_url, "tables", name))
+    with open(os.path.join(zarr_url, "tables", name, "X"), "w") as f:
+        f.write(str(os.getpid()))
+'''
+
+
+def test_pool_runs_pipeline_in_one_worker(tmp_path):
+    executable = tmp_path / 'table_task.py'
+    executable.write_text(TABLE_TASK)
+    zarr_url = tmp_path / 'image.zarr'
+    zarr_url.mkdir()
+
+    steps = []
+    for name, save in [('intermediate', False), ('features', True)]:
+        path_to_task_args = tmp_path / f'{name}.json'
+        path_to_task_args.write_text(json.dumps(dict(zarr_url=str(zarr_url), name=name)))
+        steps.append(dict(task_name=name, executable=str(executable),
+                          path_to_task_args=str(path_to_task_args), save=save))
+
+    events = []
+    pool = TaskProcessPool(n_workers=1)
+    try:
+        result = pool.run_pipeline(steps, str(zarr_url), on_progress=events.append,
+                                   scratch_dir=str(tmp_path))
+    finally:
+        pool.shutdown()
+
+    assert result['status'] == 'finished', result['error']
+    assert os.listdir(zarr_url / 'tables') == ['features']
+    assert (zarr_url / 'tables' / 'features' / 'X').read_text() == str(result['pid'])
+    stages = [event['stage'] for event in events]
+    assert 'Step 1/2: intermediate' in stages
+    assert 'Step 2/2: features' in stages
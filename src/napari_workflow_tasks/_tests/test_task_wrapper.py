@@ -0,0 +1,150 @@
+import json
+import os
+import time
+
+import numpy as np
+import zarr
+
+from napari_workflow_tasks.task_wrapper import (
+    ProgressReporter,
+    RunStats,
+    find_written_paths,
+    run_job,
+    run_pipeline,
+    run_task,
+)
+
+
+def test_find_written_paths(tmp_path):
+    zarr_url = str(tmp_path / 'image.zarr')
+    root = zarr.open_group(zarr_url, mode='w')
+    root.create_dataset('0', data=np.zeros((8, 8)), chunks=(4, 4))
+    labels = root.require_group('labels').create_dataset('nuclei/0', shape=(8, 8), chunks=(4, 4), dtype='u4')
+    labels[:] = 1
+
+    # Pretend everything above was written well before the task started
+    old = time.time() - 60
+    for dirpath, _, filenames in os.walk(zarr_url):
+        os.utime(dirpath, (old, old))
+        for filename in filenames:
+            os.utime(os.path.join(dirpath, filename), (old, old))
+
+    started = time.time()
+    labels[:4, :4] = 2
+
+    assert find_written_paths(zarr_url, started) == [os.path.join(zarr_url, 'labels', 'nuclei', '0')]
+    assert find_written_paths(None, started) == []
+
+
+def test_run_job_reports_only_arrays_the_task_wrote(tmp_path):
+    zarr_url = str(tmp_path / 'image.zarr')
+    root = zarr.open_group(zarr_url, mode='w')
+    root.create_dataset('0', data=np.ones((1, 8, 8), dtype='uint16'), chunks=(1, 4, 4))
+    executable = tmp_path / 'segment_task.py'
+    executable.write_text(SEGMENT_TASK)
+    path_to_task_args = tmp_path / 'args.json'
+    path_to_task_args.write_text(json.dumps(dict(zarr_url=zarr_url, label_name='nuclei')))
+
+    # Written by another job on the same image just before, which a scan of
+    # the modification times could not tell apart
+    other = root.require_group('labels').create_dataset('cells/0', shape=(8, 8), chunks=(4, 4), dtype='u4')
+    other[:] = 1
+
+    result = run_job(dict(executable=str(executable), path_to_task_args=str(path_to_task_args),
+                          zarr_url=zarr_url), lambda event: None)
+
+    assert result['status'] == 'finished', result['error']
+    assert result['written_paths'] == [os.path.join(zarr_url, 'labels', 'nuclei', '0')]
+
+
+def test_progress_reporter_sends_held_back_progress():
+    events = []
+    reporter = ProgressReporter(events.append, interval=0.1)
+    # ROI 2 starts right after ROI 1
+    reporter.report(0, 3, stage='ROI 1/3')
+    reporter.report(1, 3, stage='ROI 2/3')
+    assert [event['current'] for event in events] == [0]
+    time.sleep(0.3)
+    assert [event['current'] for event in events] == [0, 1]
+    assert events[-1]['stage'] == 'ROI 2/3'
+
+    # Nothing held back is sent once the reporter is closed
+    reporter.report(2, 3, stage='ROI 3/3')
+    reporter.report(2, 3, stage='Saving')
+    reporter.close()
+    time.sleep(0.2)
+    assert [event['stage'] for event in events] == ['ROI 1/3', 'ROI 2/3', 'ROI 3/3']
+
+
+def test_run_task_records_stats_and_profile(tmp_path):
+    executable = tmp_path / 'busy_task.py'
+    executable.write_text('def busy_task(zarr_url, n):\n'
+                          '    with open(zarr_url, "wb") as f:\n'
+                          '        f.write(bytes(n))\n'
+                          '    return sum(range(n))\n')
+    path_to_task_args = tmp_path / 'args.json'
+    path_to_task_args.write_text(json.dumps(dict(zarr_url=str(tmp_path / 'out.bin'), n=100000)))
+
+    stats = RunStats()
+    profile_path = str(tmp_path / 'args')
+    assert run_task(str(executable), str(path_to_task_args), stats=stats, profile_path=profile_path) == sum(range(100000))
+
+    record = stats.as_dict()
+    assert set(record['phases']) == {'decode', 'import', 'task'}
+    assert all(phase['wall'] >= 0 and phase['cpu'] >= 0 for phase in record['phases'].values())
+    assert record['wall'] >= record['phases']['task']['wall']
+    assert record['peak_rss'] is None or record['peak_rss'] > 0
+    assert record['profile_path'].startswith(profile_path)
+    assert os.path.exists(record['profile_path'])
+    # The record is what the widget writes to disk
+    json.dumps(record)
+
+
+SEGMENT_TASK = '''
+import zarr
+
+def segment_task(zarr_url, label_name, source=None, offset=0):
+    root = zarr.open_group(zarr_url, mode='a')
+    data = root['0'][0] if source is None else root['labels'][source]['0'][:]
+    labels = root.require_group('labels')
+    labels.attrs['labels'] = labels.attrs.get('labels', []) + [label_name]
+    group = labels.create_group(label_name, overwrite=True)
+    group.create_dataset('0', data=(data > 0).astype('uint32') + offset, chunks=(4, 4))
+    group.attrs['multiscales'] = [dict(version='0.4', axes=['y', 'x'], datasets=[dict(path='0')])]
+'''
+
+
+def test_run_pipeline_saves_only_marked_outputs(tmp_path):
+    zarr_url = str(tmp_path / 'image.zarr')
+    root = zarr.open_group(zarr_url, mode='w')
+    image = np.zeros((1, 8, 8), dtype='uint16')
+    image[0, 2:6, 2:6] = 7
+    root.create_dataset('0', data=image, chunks=(1, 4, 4))
+    executable = tmp_path / 'segment_task.py'
+    executable.write_text(SEGMENT_TASK)
+
+    steps = []
+    for i, (task_args, save) in enumerate([(dict(label_name='raw'), False),
+                                           (dict(label_name='nuclei', source='raw', offset=1), True)]):
+        path_to_task_args = tmp_path / f'step{i}.json'
+        # The pipeline runs the tasks on a scratch copy instead
+        path_to_task_args.write_text(json.dumps(dict(task_args, zarr_url='/does/not/exist')))
+        steps.append(dict(executable=str(executable), path_to_task_args=str(path_to_task_args), save=save))
+
+    scratch_dir = tmp_path / 'scratch'
+    scratch_dir.mkdir()
+    stats = RunStats()
+    started_steps = []
+    run_pipeline(steps, zarr_url, stats=stats, scratch_dir=str(scratch_dir),
+                 on_step=lambda i, step: started_steps.append(i))
+
+    assert started_steps == [0, 1]
+    root = zarr.open_group(zarr_url, mode='r')
+    np.testing.assert_array_equal(root['0'][:], image)
+    # The intermediate labels were never written to the image
+    assert sorted(root['labels'].group_keys()) == ['nuclei']
+    assert root['labels'].attrs['labels'] == ['nuclei']
+    np.testing.assert_array_equal(root['labels/nuclei/0'][:], (image[0] > 0) + 1)
+    assert os.listdir(scratch_dir) == []
+    assert {'link', 'step 1 task', 'step 2 task', 'step 2 save'} <= set(stats.phases)
+    assert 'step 1 save' not in stats.phases
@@ -0,0 +1,216 @@
+import os
+import shutil
+import threading
+
+import numpy as np
+import pytest
+import zarr
+
+from napari_workflow_tasks._checkpoint import CHECKPOINT_DIR, TileCheckpoint
+from napari_workflow_tasks._executors import LocalExecutor
+from napari_workflow_tasks._preview import write_roi_table
+from napari_workflow_tasks._tiling import (
+    match_labels,
+    plan_roi_tiles,
+    plan_tiles,
+    run_tiled,
+)
+from napari_workflow_tasks._zarr_utils import (
+    get_multiscale_metadata,
+    read_zattrs,
+)
+
+pytest.importorskip('anndata')
+ndimage = pytest.importorskip('scipy.ndimage')
+
+LABEL_TASK = '''
+import os
+
+import numpy as np
+import zarr
+from scipy import ndimage
+
+def label_task(zarr_url, label_name="blobs", input_ROI_table="FOV_ROI_table"):
+    assert os.path.exists(os.path.join(zarr_url, "tables", input_ROI_table))
+    image = zarr.open(os.path.join(zarr_url, "0"), mode="r")[0]
+    labels, _ = ndimage.label(image > 0)
+    group = zarr.open_group(os.path.join(zarr_url, "labels", label_name), mode="w")
+    group.create_dataset("0", data=labels.astype("uint16"), chunks=(1, 32, 32))
+    group.attrs["multiscales"] = [dict(
+        version="0.4",
+        axes=[dict(name="z", type="space"), dict(name="y", type="space"), dict(name="x", type="space")],
+        datasets=[dict(path="0", coordinateTransformations=[dict(type="scale", scale=[1.0, 0.5, 0.5])])],
+    )]
+    group.attrs["image-label"] = dict(version="0.4", source=dict(image="../../"))
+'''
+
+
+@pytest.fixture
+def blob_zarr(tmp_path):
+    image = np.zeros((1, 1, 96, 80), dtype=np.uint16)
+    # Objects crossing tile borders along y, x and at a corner
+    image[0, 0, 20:44, 5:12] = 1
+    image[0, 0, 5:10, 25:40] = 1
+    image[0, 0, 58:70, 58:70] = 1
+    # Two objects close to each other on both sides of a border
+    image[0, 0, 80:90, 10:31] = 1
+    image[0, 0, 80:90, 33:40] = 1
+    image[0, 0, 50:54, 45:50] = 1
+
+    zarr_url = str(tmp_path / 'image.zarr')
+    root = zarr.open_group(zarr_url, mode='w')
+    root.create_dataset('0', data=image, chunks=(1, 1, 32, 32))
+    root.create_dataset('1', data=image[..., ::2, ::2], chunks=(1, 1, 32, 32))
+    root.attrs['multiscales'] = [dict(
+        version='0.4',
+        axes=[dict(name=axis) for axis in 'czyx'],
+        datasets=[dict(path=str(i), coordinateTransformations=[
+            dict(type='scale', scale=[1, 1, 0.5 * 2 ** i, 0.5 * 2 ** i])]) for i in range(2)],
+    )]
+
+    executable = tmp_path / 'label_task.py'
+    executable.write_text(LABEL_TASK)
+    path_to_task_args = tmp_path / 'args.json'
+    path_to_task_args.write_text('{"label_name": "blobs", "input_ROI_table": "FOV_ROI_table"}')
+    return zarr_url, image, str(executable), str(path_to_task_args)
+
+
+def test_plan_tiles_is_chunk_aligned():
+    tiles = plan_tiles((100, 70), tile_size=40, halo=5, chunks_yx=(32, 32))
+    assert [tile['core'] for tile in tiles] == [(0, 64, 0, 64), (0, 64, 64, 70),
+                                                (64, 100, 0, 64), (64, 100, 64, 70)]
+    assert tiles[3]['padded'] == (59, 100, 59, 70)
+    assert (tiles[3]['row'], tiles[3]['column']) == (1, 1)
+
+
+def test_match_labels():
+    before = np.array([[1, 1, 1, 0, 0, 2, 2]])
+    after = np.array([[5, 5, 6, 6, 6, 7, 7]])
+    assert match_labels(before, after) == [(1, 5), (2, 7)]
+    assert match_labels(before, after, min_overlap=0) == [(1, 5), (1, 6), (2, 7)]
+
+
+@pytest.mark.parametrize('halo', [0, 8])
+def test_run_tiled_stitches_labels(blob_zarr, halo):
+    zarr_url, image, executable, path_to_task_args = blob_zarr
+    events = []
+    executor = LocalExecutor(n_workers=2)
+    try:
+        result = run_tiled(executor, executable, path_to_task_args, zarr_url, tile_size=32, halo=halo,
+                           n_parallel=2, on_progress=events.append, roi_tables=['FOV_ROI_table'])
+    finally:
+        executor.shutdown()
+
+    assert result['status'] == 'finished', result['error']
+    assert result['n_tiles'] == 9
+    assert events[-1]['current'] == events[-1]['total'] == 9
+    assert 'stitch' in result['stats']['phases']
+
+    label_url = os.path.join(zarr_url, 'labels', 'blobs')
+    assert sorted(result['written_paths']) == [os.path.join(label_url, path) for path in ['0', '1']]
+    assert read_zattrs(os.path.join(zarr_url, 'labels'))['labels'] == ['blobs']
+    assert read_zattrs(label_url)['image-label']['version'] == '0.4'
+    assert get_multiscale_metadata(label_url)['scale'] == [1.0, 0.5, 0.5]
+
+    # The same objects as labelling the image in one piece, numbered 1..n
+    expected, n_objects = ndimage.label(image[0] > 0)
+    stitched = zarr.open(os.path.join(label_url, '0'), mode='r')[...]
+    assert stitched.shape == expected.shape
+    assert set(np.unique(stitched)) == set(range(n_objects + 1))
+    pairs = np.unique(np.stack([expected.ravel(), stitched.ravel()]), axis=1)
+    assert pairs.shape[1] == n_objects + 1
+
+
+def _run_tiled(executable, path_to_task_args, zarr_url, n_parallel=1, **kwargs):
+    executor = LocalExecutor(n_workers=n_parallel)
+    try:
+        return run_tiled(executor, executable, path_to_task_args, zarr_url, tile_size=32, halo=8,
+                         n_parallel=n_parallel, roi_tables=['FOV_ROI_table'], **kwargs)
+    finally:
+        executor.shutdown()
+
+
+def test_run_roi_wise(blob_zarr):
+    zarr_url, image, executable, path_to_task_args = blob_zarr
+    # Two FOVs side by side, not aligned to the chunks, and a gap at the bottom
+    write_roi_table(zarr_url, 'FOV_ROI_table', [[0, 0, 0, 20, 40, 1], [20, 0, 0, 20, 40, 1]])
+    tiles = plan_roi_tiles(zarr_url, 'FOV_ROI_table')
+    assert [(tile['roi'], tile['core']) for tile in tiles] == [('0', (0, 80, 0, 40)), ('1', (0, 80, 40, 80))]
+
+    result = _run_tiled(executable, path_to_task_args, zarr_url, n_parallel=2, roi_table='FOV_ROI_table')
+    assert result['status'] == 'finished', result['error']
+    assert result['n_tiles'] == 2
+
+    # Objects are labelled ROI by ROI and numbered in the order of the ROIs
+    left, n_left = ndimage.label(image[0, :, :80, :40] > 0)
+    right, _ = ndimage.label(image[0, :, :80, 40:] > 0)
+    expected = np.zeros(image.shape[1:], dtype=np.uint32)
+    expected[:, :80, :40] = left
+    expected[:, :80, 40:] = np.where(right > 0, right + n_left, 0)
+    stitched = zarr.open(os.path.join(zarr_url, 'labels', 'blobs', '0'), mode='r')[...]
+    np.testing.assert_array_equal(stitched, expected)
+
+
+def test_run_tiled_resumes_from_checkpoint(blob_zarr, tmp_path):
+    zarr_url, image, executable, path_to_task_args = blob_zarr
+    uninterrupted_url = str(tmp_path / 'uninterrupted.zarr')
+    shutil.copytree(zarr_url, uninterrupted_url)
+    result = _run_tiled(executable, path_to_task_args, uninterrupted_url, n_parallel=2)
+    assert result['status'] == 'finished', result['error']
+
+    # The task dies on the fifth tile it runs
+    runs_path = tmp_path / 'runs.txt'
+    with open(executable, 'a') as f:
+        f.write(f"""
+_label_task = label_task
+
+def label_task(**kwargs):
+    with open({str(runs_path)!r}, "a") as f:
+        f.write("run\\n")
+    if os.path.exists({str(tmp_path / 'fail')!r}) and len(open({str(runs_path)!r}).readlines()) == 5:
+        raise MemoryError("Out of memory")
+    _label_task(**kwargs)
+""")
+    (tmp_path / 'fail').touch()
+    result = _run_tiled(executable, path_to_task_args, zarr_url, checkpoint=True)
+    assert result['status'] == 'failed'
+    assert 'MemoryError' in result['error']
+    assert not os.path.exists(os.path.join(zarr_url, 'labels'))
+    assert len(os.listdir(os.path.join(zarr_url, CHECKPOINT_DIR))) == 1
+
+    (tmp_path / 'fail').unlink()
+    result = _run_tiled(executable, path_to_task_args, zarr_url, checkpoint=True)
+    assert result['status'] == 'finished', result['error']
+    assert (result['n_tiles'], result['n_resumed']) == (9, 4)
+    # Only the tiles left ran again
+    assert len(runs_path.read_text().splitlines()) == 5 + 5
+    assert not os.path.exists(os.path.join(zarr_url, CHECKPOINT_DIR))
+
+    for path in ['0', '1']:
+        np.testing.assert_array_equal(zarr.open(os.path.join(zarr_url, 'labels', 'blobs', path), mode='r')[...],
+                                      zarr.open(os.path.join(uninterrupted_url, 'labels', 'blobs', path),
+                                                mode='r')[...])
+
+
+
+def test_checkpoint_keeps_newest_label_count(tmp_path):
+    checkpoint_dir = str(tmp_path / CHECKPOINT_DIR / 'key')
+    checkpoint = TileCheckpoint(checkpoint_dir)
+    barrier = threading.Barrier(8)
+
+    def _mark_done(i):
+        barrier.wait()
+        # Tiles record the state they saw, later tiles saw more labels
+        checkpoint.mark_done(i, dict(blobs=10 * i), dict(blobs=dict(dtype='<u4', n_labels=10 * (i + 1))))
+
+    # Tiles done last record first, i.e. the oldest states are written last
+    threads = [threading.Thread(target=_mark_done, args=(i,)) for i in reversed(range(8))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    resumed = TileCheckpoint(checkpoint_dir)
+    assert resumed.done_tiles == list(range(8))
+    # A resumed tile gets an offset past the labels of all tiles done
+    assert resumed.label_images['blobs']['n_labels'] == 80
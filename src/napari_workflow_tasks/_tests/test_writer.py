@@ -1,7 +1,81 @@
-# from napari_workflow_tasks import write_single_image, write_multiple
+import os
 
-# add your tests here...
+import dask.array as da
+import numpy as np
+import pytest
+import zarr
 
+from napari_workflow_tasks import (
+    napari_get_reader,
+    write_multiple,
+    write_single_image,
+    write_single_labels,
+)
+from napari_workflow_tasks._writer import mode_downsample
 
-def test_something():
-    pass
+
+def test_write_single_image_builds_pyramid(tmp_path):
+    path = str(tmp_path / 'image.zarr')
+    data = da.from_array(np.arange(600 * 500, dtype=np.uint16).reshape(600, 500), chunks=(100, 100))
+
+    assert write_single_image(path, data, dict(name='DAPI', scale=(0.5, 0.5), contrast_limits=(0, 100))) == [path]
+
+    root = zarr.open_group(path, mode='r')
+    multiscale = root.attrs['multiscales'][0]
+    assert [axis['name'] for axis in multiscale['axes']] == ['c', 'y', 'x']
+    assert [dataset['path'] for dataset in multiscale['datasets']] == ['0', '1', '2']
+    assert multiscale['datasets'][1]['coordinateTransformations'][0]['scale'] == [1, 1.0, 1.0]
+    assert root['0'].chunks == (1, 600, 500)
+    assert root['2'].shape == (1, 150, 125)
+    np.testing.assert_array_equal(root['0'][0], data)
+    assert root.attrs['omero']['channels'] == [dict(label='DAPI', active=True, window=dict(start=0, end=100))]
+
+    # What we write, our reader opens
+    layer_data = napari_get_reader(path)(path)
+    assert layer_data[0][1]['name'] == 'DAPI'
+    assert len(layer_data[0][0]) == 3
+
+
+def test_write_multiple_channels_and_labels(tmp_path):
+    path = str(tmp_path / 'image.zarr')
+    rng = np.random.default_rng(0)
+    channels = [rng.integers(0, 100, (64, 64), dtype=np.uint8) for _ in range(2)]
+    labels = np.repeat(np.repeat(np.arange(16, dtype=np.uint32).reshape(4, 4), 16, 0), 16, 1)
+
+    write_multiple(path, [(channels[0], dict(name='DAPI'), 'image'),
+                          (channels[1], dict(name='GFP', visible=False), 'image'),
+                          (labels, dict(name='nuclei'), 'labels')],
+                   chunk_size=32, min_size=16, max_workers=2)
+
+    root = zarr.open_group(path, mode='r')
+    np.testing.assert_array_equal(root['0'][:], np.stack(channels))
+    assert root['0'].chunks == (1, 32, 32)
+    assert [c['label'] for c in root.attrs['omero']['channels']] == ['DAPI', 'GFP']
+    assert root['labels'].attrs['labels'] == ['nuclei']
+    # Label pyramids keep label values intact
+    np.testing.assert_array_equal(root['labels/nuclei/2'][:], labels[::4, ::4])
+
+    with pytest.raises(ValueError):
+        write_multiple(path, [(channels[0], dict(name='a'), 'image'),
+                              (channels[0][:32], dict(name='b'), 'image')])
+
+
+def test_write_single_labels(tmp_path):
+    path = str(tmp_path / 'labels.zarr')
+    labels = np.zeros((32, 32), dtype=np.uint16)
+    labels[8:24, 8:24] = 3
+
+    write_single_labels(path, labels, dict(name='cells'))
+
+    root = zarr.open_group(path, mode='r')
+    assert 'image-label' in root.attrs
+    assert len(root.attrs['multiscales'][0]['datasets']) == 1
+    np.testing.assert_array_equal(root['0'][:], labels)
+    assert os.path.exists(os.path.join(path, '0', '0', '0'))
+
+
+def test_mode_downsample():
+    blocks = np.array([[1, 1, 2, 0],
+                       [0, 1, 2, 2]])
+    # A 2 x 2 block per output pixel
+    np.testing.assert_array_equal(mode_downsample(blocks.reshape(1, 2, 2, 2), axis=(1, 3)), [[1, 2]])
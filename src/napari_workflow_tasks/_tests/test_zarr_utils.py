@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+import pytest
+import zarr
+
+from napari_workflow_tasks._zarr_utils import (
+    get_multiscale_metadata,
+    get_source_paths,
+    load_labels,
+    mark_written,
+    open_array,
+)
+
+
+def _write_labels(zarr_url, label_name, levels):
+    root = zarr.open_group(zarr_url, mode='a')
+    group = root.require_group('labels').require_group(label_name)
+    datasets = []
+    for i, level in enumerate(levels):
+        group.create_dataset(str(i), data=level, chunks=(4, 4), overwrite=True)
+        datasets.append(dict(path=str(i), coordinateTransformations=[
+            dict(type='scale', scale=[0.5 * 2 ** i, 0.5 * 2 ** i]),
+        ]))
+    group.attrs['multiscales'] = [dict(
+        version='0.4',
+        axes=[dict(name='y', type='space'), dict(name='x', type='space')],
+        datasets=datasets,
+    )]
+
+
+def test_load_labels_single_and_multiscale(tmp_path):
+    zarr_url = str(tmp_path / 'image.zarr')
+    labels = np.arange(64, dtype=np.uint32).reshape(8, 8)
+    _write_labels(zarr_url, 'nuclei', [labels])
+    _write_labels(zarr_url, 'cells', [labels, labels[::2, ::2]])
+
+    data, metadata = load_labels(zarr_url, 'nuclei')
+    np.testing.assert_array_equal(np.asarray(data), labels)
+    assert metadata['axes'] == ['y', 'x']
+    assert metadata['scale'] == [0.5, 0.5]
+
+    data, metadata = load_labels(zarr_url, 'cells')
+    assert isinstance(data, list) and len(data) == 2
+    assert data[1].shape == (4, 4)
+    assert get_multiscale_metadata(f'{zarr_url}/labels/cells')['paths'] == ['0', '1']
+
+
+def test_get_source_paths(tmp_path):
+    zarr_url = str(tmp_path / 'image.zarr')
+    _write_labels(zarr_url, 'nuclei', [np.ones((8, 8), dtype=np.uint32)])
+
+    data, _ = load_labels(zarr_url, 'nuclei')
+    derived = (data + 1)[2:6]
+
+    expected = {str(tmp_path / 'image.zarr' / 'labels' / 'nuclei' / '0')}
+    assert get_source_paths(data) == expected
+    assert get_source_paths(derived) == expected
+
+
+def test_reopened_array_gets_a_new_dask_name_after_a_write(tmp_path):
+    napari_utils = pytest.importorskip('napari.utils')
+    zarr_url = str(tmp_path / 'image.zarr')
+    _write_labels(zarr_url, 'nuclei', [np.ones((8, 8), dtype=np.uint32)])
+    array_url = f'{zarr_url}/labels/nuclei/0'
+    assert open_array(array_url) is open_array(array_url)
+
+    cache = napari_utils.resize_dask_cache(nbytes=2 ** 20)
+    try:
+        with cache:
+            # napari caches the chunks of the slices it shows
+            data, _ = load_labels(zarr_url, 'nuclei')
+            assert data[:4, :4].compute().max() == 1
+            assert len(cache.cache.data) > 0
+
+            # A task rewrites a chunk, e.g. of nested chunk directories, so
+            # that the array directory looks untouched
+            stat = os.stat(array_url)
+            zarr.open(array_url, mode='r+')[:4, :4] = 7
+            os.utime(array_url, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            assert load_labels(zarr_url, 'nuclei')[0].name == data.name
+
+            # Keys of the slices of the reloaded layer differ from the cached ones
+            mark_written([f'{zarr_url}/labels/nuclei'])
+            reloaded, _ = load_labels(zarr_url, 'nuclei')
+            assert reloaded.name != data.name
+            assert reloaded[:4, :4].compute().max() == 7
+    finally:
+        cache.cache.resize(0)
@@ -0,0 +1,526 @@
+"""
+Run a task on one large image as tiles in parallel.
+
+A task works through a whole-slide image or a large volume in a single
+process, i.e. on one core. Here the image is split along y and x into tiles
+whose borders fall on chunk borders of the image. Every tile is cropped with
+a halo of context pixels around it and the task runs on all crops in
+parallel, each in a worker of the executor. The label images written by the
+tasks are stitched into one label image of the full image: labels are made
+unique across tiles, and objects cut by a tile border are merged where the
+labels of the two tiles overlap in the halo. Tables the tasks write are not
+stitched.
+
+Alternatively every ROI of a ROI table, e.g. every field of view, is a tile
+of its own. A run can keep the tiles done in a checkpoint next to the image,
+see ``_checkpoint``, so that running it again after it was interrupted only
+processes the tiles that are left. Objects are numbered in the order of the
+tiles, whatever order the tiles finished in, so a resumed run writes the same
+labels as an uninterrupted one.
+"""
+import concurrent.futures
+import contextlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import traceback
+
+import dask.array as da
+import numpy as np
+import zarr
+
+from ._checkpoint import TileCheckpoint, get_checkpoint_dir
+from ._preview import _clip_bbox, read_roi_table, write_cropped_zarr
+from ._writer import DEFAULT_COMPRESSOR, write_multiscale
+from ._zarr_utils import get_label_url, get_multiscale_metadata, read_zattrs
+
+# Pixels of context around every tile
+DEFAULT_HALO = 64
+# Fraction of the smaller of two labels in the halo both have to cover to be merged
+MIN_OVERLAP = 0.5
+# Seconds between two checks for cancellation and timeout
+POLL_INTERVAL = 0.1
+
+
+def plan_tiles(shape_yx, tile_size, halo=DEFAULT_HALO, chunks_yx=None):
+    """Split the y/x plane of an image into tiles.
+
+    Parameters
+    ----------
+    shape_yx : tuple of int
+        Size of the image along y and x.
+    tile_size : int
+        Size of the tiles along y and x, rounded up to a multiple of the
+        chunk size.
+    halo : int
+        Pixels of context added on every side of a tile.
+    chunks_yx : tuple of int, optional
+        Chunk size of the image along y and x.
+
+    Returns
+    -------
+    list of dict
+        ``row`` and ``column`` of every tile in the grid, its ``core``
+        ``(y_start, y_stop, x_start, x_stop)`` and the ``padded`` bounding
+        box including the halo, clipped to the image.
+    """
+    if tile_size < 1:
+        raise ValueError(f'The tile size has to be positive, got {tile_size}')
+    chunks_yx = (1, 1) if chunks_yx is None else chunks_yx
+    sizes = [-(-tile_size // c) * c for c in chunks_yx]
+
+    tiles = []
+    for row, y_start in enumerate(range(0, shape_yx[0], sizes[0])):
+        for column, x_start in enumerate(range(0, shape_yx[1], sizes[1])):
+            y_stop = min(y_start + sizes[0], shape_yx[0])
+            x_stop = min(x_start + sizes[1], shape_yx[1])
+            tiles.append(dict(row=row,
+                              column=column,
+                              core=(y_start, y_stop, x_start, x_stop),
+                              padded=(max(0, y_start - halo), min(shape_yx[0], y_stop + halo),
+                                      max(0, x_start - halo), min(shape_yx[1], x_stop + halo))))
+    return tiles
+
+
+def plan_roi_tiles(zarr_url, table_name):
+    """Make every ROI of a ROI table a tile of its own, without halo.
+
+    Returns
+    -------
+    list of dict
+        The ``roi`` name, and the ``core`` and ``padded`` bounding box of the
+        ROI in level 0 pixels, see ``plan_tiles``.
+    """
+    if not os.path.isdir(os.path.join(zarr_url, 'tables', table_name)):
+        raise ValueError(f'{zarr_url} has no ROI table {table_name}')
+    roi_table = read_roi_table(zarr_url, table_name)
+    metadata = get_multiscale_metadata(zarr_url)
+    pixel_size_y, pixel_size_x = metadata['scale'][-2:]
+    shape_yx = zarr.open(os.path.join(zarr_url, metadata['paths'][0]), mode='r').shape[-2:]
+    tiles = []
+    for i, roi in enumerate(roi_table['label']):
+        y_start = roi_table['y_micrometer'][i] / pixel_size_y
+        x_start = roi_table['x_micrometer'][i] / pixel_size_x
+        bbox = _clip_bbox(y_start, y_start + roi_table['len_y_micrometer'][i] / pixel_size_y,
+                          x_start, x_start + roi_table['len_x_micrometer'][i] / pixel_size_x,
+                          shape_yx, max_size=None)
+        tiles.append(dict(roi=str(roi), core=bbox, padded=bbox))
+    return tiles
+
+
+def _get_borders(tiles, halo):
+    # (tile before, tile after, bands) of every pair of neighbouring tiles.
+    # The bands are the y/x regions of both tiles compared to match their
+    # labels: the overlap of the two padded tiles, or without halo the two
+    # rows or columns facing each other
+    by_position = {(tile['row'], tile['column']): i for i, tile in enumerate(tiles)}
+    borders = []
+    for i, tile in enumerate(tiles):
+        y_start, y_stop, x_start, x_stop = tile['core']
+        below = by_position.get((tile['row'] + 1, tile['column']))
+        if below is not None:
+            if halo:
+                before = after = (tiles[below]['padded'][0], tile['padded'][1])
+            else:
+                before, after = (y_stop - 1, y_stop), (y_stop, y_stop + 1)
+            borders.append((i, below, (before + (x_start, x_stop), after + (x_start, x_stop))))
+        right = by_position.get((tile['row'], tile['column'] + 1))
+        if right is not None:
+            if halo:
+                before = after = (tiles[right]['padded'][2], tile['padded'][3])
+            else:
+                before, after = (x_stop - 1, x_stop), (x_stop, x_stop + 1)
+            borders.append((i, right, ((y_start, y_stop) + before, (y_start, y_stop) + after)))
+    return borders
+
+
+def _crop(data, bbox, origin=(0, 0)):
+    y_start, y_stop, x_start, x_stop = bbox
+    return data[..., y_start - origin[0]:y_stop - origin[0], x_start - origin[1]:x_stop - origin[1]]
+
+
+class _UnionFind:
+    def __init__(self):
+        self.parent = dict()
+
+    def find(self, label):
+        root = label
+        while self.parent.get(root, root) != root:
+            root = self.parent[root]
+        # Path compression
+        while label != root:
+            self.parent[label], label = root, self.parent.get(label, label)
+        return root
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+
+def match_labels(before, after, min_overlap=MIN_OVERLAP):
+    """Return the pairs of labels of two tiles that belong to one object.
+
+    Parameters
+    ----------
+    before, after : numpy.ndarray
+        Labels of the two tiles in the same band along their border.
+    min_overlap : float
+        Fraction of the smaller label of a pair, within the band, the pair
+        has to overlap in. 0 merges labels that touch at all.
+    """
+    both = (before > 0) & (after > 0)
+    pairs, counts = np.unique(np.stack([before[both], after[both]]), axis=1, return_counts=True)
+    if not min_overlap:
+        return [tuple(pair) for pair in pairs.T.tolist()]
+
+    labels_before, sizes_before = np.unique(before[before > 0], return_counts=True)
+    labels_after, sizes_after = np.unique(after[after > 0], return_counts=True)
+    sizes_before = dict(zip(labels_before.tolist(), sizes_before.tolist()))
+    sizes_after = dict(zip(labels_after.tolist(), sizes_after.tolist()))
+    return [(a, b) for (a, b), count in zip(pairs.T.tolist(), counts.tolist())
+            if count >= min_overlap * min(sizes_before[a], sizes_after[b])]
+
+
+class _StitchedLabels:
+    # Collects the labels of all tiles of one label image. The core of every
+    # tile is written with labels shifted past the labels of the tiles before
+    # it into a scratch array, the bands along its borders are kept in memory
+
+    def __init__(self, scratch_url, state, mode='w', lock_writes=False):
+        self.metadata = state['metadata']
+        self.attrs = state['attrs']
+        self.raw = zarr.open(scratch_url, mode=mode, shape=tuple(state['shape']),
+                             chunks=(1,) * (len(state['shape']) - 2) + tuple(state['chunks_yx']),
+                             dtype=state['dtype'], compressor=DEFAULT_COMPRESSOR)
+        self.n_labels = state.get('n_labels', 0)
+        # (offset, labels in the core) of every tile
+        self.tile_labels = dict()
+        self.bands = dict()
+        self._lock = threading.Lock()
+        # Tiles whose cores do not start on chunk borders may write to the same chunk
+        self._write_lock = threading.Lock() if lock_writes else contextlib.nullcontext()
+
+    @staticmethod
+    def get_initial_state(label_url, data, shape_yx, chunks_yx):
+        attrs = read_zattrs(label_url)
+        attrs.pop('multiscales', None)
+        return dict(metadata=get_multiscale_metadata(label_url),
+                    attrs=attrs,
+                    shape=list(data.shape[:-2]) + list(shape_yx),
+                    chunks_yx=list(chunks_yx),
+                    dtype=np.promote_types(data.dtype, np.uint32).str)
+
+    def get_state(self):
+        return dict(metadata=self.metadata,
+                    attrs=self.attrs,
+                    shape=list(self.raw.shape),
+                    chunks_yx=list(self.raw.chunks[-2:]),
+                    dtype=self.raw.dtype.str,
+                    n_labels=self.n_labels)
+
+    def add_tile(self, i, tile, data, bands):
+        # Returns the offset of the tile and the arrays to resume from
+        with self._lock:
+            offset = self.n_labels
+            self.n_labels += int(data.max(initial=0))
+        origin = (tile['padded'][0], tile['padded'][2])
+        y_start, y_stop, x_start, x_stop = tile['core']
+        labels = np.unique(_crop(data, tile['core'], origin))
+        labels = labels[labels > 0].astype(self.raw.dtype)
+        data = np.where(data > 0, data.astype(self.raw.dtype) + offset, 0).astype(self.raw.dtype)
+
+        # Grid cores start on chunk borders, so tiles never write to the same chunk
+        with self._write_lock:
+            self.raw[..., y_start:y_stop, x_start:x_stop] = _crop(data, tile['core'], origin)
+        arrays = dict(labels=labels)
+        for key, bbox in bands:
+            arrays['band_{}_{}_{}'.format(*key)] = _crop(data, bbox, origin)
+        self.restore_tile(i, offset, arrays)
+        return offset, arrays
+
+    def restore_tile(self, i, offset, arrays):
+        with self._lock:
+            self.tile_labels[i] = (offset, arrays['labels'])
+            for name, band in arrays.items():
+                if name.startswith('band_'):
+                    self.bands[tuple(int(n) for n in name.split('_')[1:])] = band
+
+    def relabel(self, borders, halo):
+        # Merge the labels of objects across tile borders and number the
+        # objects consecutively, in the order of the tiles and of their
+        # labels within a tile, whatever order the tiles finished in
+        union_find = _UnionFind()
+        min_overlap = MIN_OVERLAP if halo else 0
+        for before, after, _ in borders:
+            for a, b in match_labels(self.bands[(before, after, 0)], self.bands[(before, after, 1)], min_overlap):
+                union_find.union(a, b)
+
+        new_labels = dict()
+        for i in sorted(self.tile_labels):
+            offset, labels = self.tile_labels[i]
+            for label in (labels.astype(np.int64) + offset).tolist():
+                new_labels.setdefault(union_find.find(label), len(new_labels) + 1)
+        lut = np.zeros(self.n_labels + 1, dtype=self.raw.dtype)
+        for offset, labels in self.tile_labels.values():
+            for label in (labels.astype(np.int64) + offset).tolist():
+                lut[label] = new_labels[union_find.find(label)]
+        return lut
+
+    def save(self, out_url, lut, max_levels):
+        label_data = da.from_zarr(self.raw).map_blocks(lambda block: lut[block], dtype=lut.dtype)
+        group = zarr.open_group(out_url, mode='w')
+        paths = write_multiscale(group,
+                                 label_data,
+                                 self.metadata['axes'],
+                                 scale=self.metadata['scale'],
+                                 translate=self.metadata['translate'],
+                                 is_label=True,
+                                 chunk_size=self.raw.chunks[-1],
+                                 # As many levels as the image has
+                                 min_size=1,
+                                 max_levels=max_levels)
+        group.attrs.update(self.attrs)
+        return [os.path.join(out_url, path) for path in paths]
+
+
+def _add_label_image(zarr_url, label_name):
+    labels = zarr.open_group(os.path.join(zarr_url, 'labels'), mode='a')
+    labels.attrs['labels'] = sorted(set(labels.attrs.get('labels', [])) | {label_name})
+
+
+def _get_label_names(zarr_url):
+    labels_url = os.path.join(zarr_url, 'labels')
+    if not os.path.isdir(labels_url):
+        return []
+    return [name for name in sorted(os.listdir(labels_url))
+            if os.path.exists(os.path.join(labels_url, name, '.zattrs'))]
+
+
+def run_tiled(executor, executable, path_to_task_args, zarr_url, tile_size, halo=DEFAULT_HALO, n_parallel=1,
+              timeout=None, cancel_event=None, on_progress=None, roi_tables=None, scratch_dir=None,
+              roi_table=None, checkpoint=False):
+    """Run a task on the tiles of an image in parallel and stitch its labels.
+
+    Parameters
+    ----------
+    executor : TaskExecutor
+        Runs the task on every tile, see ``_executors``.
+    executable : str
+        Path to the task executable.
+    path_to_task_args : str
+        Path to the JSON file with the task arguments.
+    zarr_url : str
+        The OME-Zarr image to process, the stitched label images are
+        written into it.
+    tile_size, halo : int
+        See ``plan_tiles``.
+    n_parallel : int
+        Number of tiles processed at once.
+    timeout : float, optional
+        Cancel the tiles after this many seconds in total.
+    cancel_event : threading.Event, optional
+        Cancel the tiles once this event is set.
+    on_progress : callable, optional
+        ``on_progress(event)`` called whenever a tile is done, with the
+        tiles done as ``current`` and the number of tiles as ``total``.
+    roi_tables : list of str, optional
+        ROI tables written into every tile, each with a single ROI spanning
+        the tile.
+    scratch_dir : str, optional
+        Directory for the tiles, shared with the executor.
+    roi_table : str, optional
+        Process every ROI of this ROI table as a tile instead of a grid of
+        ``tile_size``, see ``plan_roi_tiles``. Objects are not merged
+        across ROIs but numbered ROI after ROI, as a task processing the
+        ROIs in one run does.
+    checkpoint : bool
+        Keep the tiles done in a checkpoint next to the image, and resume
+        from the checkpoint an interrupted run of the same task left, see
+        ``_checkpoint``. The checkpoint is kept if the run fails or is
+        cancelled.
+
+    Returns
+    -------
+    dict
+        ``status``, ``error``, ``written_paths`` and ``stats``, see
+        ``TaskProcessPool.run``, the number of tiles ``n_tiles`` and of
+        tiles taken from the checkpoint ``n_resumed``.
+    """
+    started = time.perf_counter()
+    metadata = get_multiscale_metadata(zarr_url)
+    source = zarr.open(os.path.join(zarr_url, metadata['paths'][0]), mode='r')
+    chunks_yx = source.chunks[-2:]
+    if roi_table is not None:
+        halo = 0
+        tiles = plan_roi_tiles(zarr_url, roi_table)
+        borders = []
+    else:
+        tiles = plan_tiles(source.shape[-2:], tile_size, halo, chunks_yx)
+        borders = _get_borders(tiles, halo)
+    # (key, bbox) of the bands every tile keeps for matching its labels
+    tile_bands = {i: [] for i in range(len(tiles))}
+    for before, after, bboxes in borders:
+        tile_bands[before].append(((before, after, 0), bboxes[0]))
+        tile_bands[after].append(((before, after, 1), bboxes[1]))
+
+    with open(path_to_task_args) as f:
+        task_args = json.load(f)
+
+    scratch = tempfile.mkdtemp(prefix='napari-workflow-tasks-tiles-', dir=scratch_dir)
+    stitched = dict()
+    stitched_lock = threading.Lock()
+    tile_checkpoint = None
+    if checkpoint:
+        tile_checkpoint = TileCheckpoint(get_checkpoint_dir(
+            zarr_url, executable, dict(task_args, zarr_url=zarr_url),
+            dict(tile_size=None if roi_table is not None else tile_size, halo=halo, roi_table=roi_table,
+                 roi_tables=roi_tables)))
+        for label_name, state in tile_checkpoint.label_images.items():
+            stitched[label_name] = _StitchedLabels(tile_checkpoint.get_scratch_url(label_name), state,
+                                                   mode='r+', lock_writes=roi_table is not None)
+        for i in tile_checkpoint.done_tiles:
+            for label_name, offset in tile_checkpoint.get_tile(i).items():
+                stitched[label_name].restore_tile(i, offset, tile_checkpoint.load_arrays(i, label_name))
+    done_tiles = set() if tile_checkpoint is None else set(tile_checkpoint.done_tiles)
+    # Set when the tiles have to stop early, the running ones are killed
+    stop_event = threading.Event()
+    tile_stats = []
+    n_done = len(done_tiles)
+    progress_lock = threading.Lock()
+
+    def _run_tile(i):
+        nonlocal n_done
+        if stop_event.is_set():
+            return dict(status='cancelled', error='Cancelled')
+        tile = tiles[i]
+        tile_url = write_cropped_zarr(zarr_url, tile['padded'], out_url=os.path.join(scratch, f'tile{i}.zarr'),
+                                      roi_tables=roi_tables)
+        try:
+            path_to_tile_args = os.path.join(scratch, f'tile{i}.json')
+            with open(path_to_tile_args, 'w') as f:
+                json.dump(dict(task_args, zarr_url=tile_url), f)
+            result = executor.run(executable, path_to_tile_args, cancel_event=stop_event, zarr_url=tile_url)
+            if result['status'] != 'finished':
+                return result
+
+            padded_shape = (tile['padded'][1] - tile['padded'][0], tile['padded'][3] - tile['padded'][2])
+            tile_state = dict()
+            for label_name in _get_label_names(tile_url):
+                label_url = get_label_url(tile_url, label_name)
+                data = zarr.open(os.path.join(label_url, get_multiscale_metadata(label_url)['paths'][0]), mode='r')[...]
+                if data.shape[-2:] != padded_shape:
+                    raise ValueError(f'{label_name} of tile {i + 1} has shape {data.shape}, tiles need labels at '
+                                     f'the resolution of the image')
+                with stitched_lock:
+                    if label_name not in stitched:
+                        scratch_url = (os.path.join(scratch, f'{label_name}.zarr') if tile_checkpoint is None
+                                       else tile_checkpoint.get_scratch_url(label_name))
+                        state = _StitchedLabels.get_initial_state(label_url, data, source.shape[-2:], chunks_yx)
+                        stitched[label_name] = _StitchedLabels(scratch_url, state,
+                                                               lock_writes=roi_table is not None)
+                offset, arrays = stitched[label_name].add_tile(i, tile, data, tile_bands[i])
+                if tile_checkpoint is not None:
+                    tile_checkpoint.save_arrays(i, label_name, arrays)
+                    tile_state[label_name] = offset
+            if tile_checkpoint is not None:
+                # Written under the same lock, so a tile never records an
+                # older state over that of a tile done meanwhile
+                with stitched_lock:
+                    label_images = {label_name: labels.get_state() for label_name, labels in stitched.items()}
+                    tile_checkpoint.mark_done(i, tile_state, label_images)
+        finally:
+            shutil.rmtree(tile_url, ignore_errors=True)
+
+        with progress_lock:
+            n_done += 1
+            tile_stats.append(result.get('stats') or dict())
+            if on_progress is not None:
+                elapsed = time.perf_counter() - started
+                rate = len(tile_stats) / elapsed
+                on_progress(dict(current=n_done, total=len(tiles), stage=f'Tile {n_done}/{len(tiles)} done',
+                                 rate=rate, eta=(len(tiles) - n_done) / rate))
+        return result
+
+    def _run_tile_safely(i):
+        try:
+            result = _run_tile(i)
+        except Exception:  # noqa: BLE001
+            # A tile that fails in any way must become a failed result,
+            # not end the thread pool
+            result = dict(status='failed', error=traceback.format_exc())
+        if result['status'] != 'finished':
+            # Tiles waiting for a worker do not start anymore
+            stop_event.set()
+        return result
+
+    if done_tiles:
+        print(f'Resuming from {tile_checkpoint.checkpoint_dir}: {len(done_tiles)}/{len(tiles)} tiles are done')
+    print(f'Running {os.path.basename(executable)} on {len(tiles)} tiles, {n_parallel} at once')
+    result = dict(status='finished', error=None)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, n_parallel)) as pool:
+            futures = {pool.submit(_run_tile_safely, i): i for i in range(len(tiles)) if i not in done_tiles}
+            pending = set(futures)
+            while pending:
+                done, pending = concurrent.futures.wait(pending, timeout=POLL_INTERVAL,
+                                                        return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    tile_result = future.result()
+                    # A failed tile, not the tiles cancelled because of it, is reported
+                    if (tile_result['status'] == 'failed' and result['status'] != 'failed'
+                            or tile_result['status'] != 'finished' and result['status'] == 'finished'):
+                        result = dict(status=tile_result['status'],
+                                      error=f'Tile {futures[future] + 1}/{len(tiles)}: {tile_result["error"]}')
+                        stop_event.set()
+                if result['status'] == 'finished' and cancel_event is not None and cancel_event.is_set():
+                    result = dict(status='cancelled', error='Cancelled by user')
+                    stop_event.set()
+                if (result['status'] == 'finished' and timeout is not None
+                        and time.perf_counter() - started > timeout):
+                    result = dict(status='failed', error=f'Timed out after {timeout} s')
+                    stop_event.set()
+        tiles_seconds = time.perf_counter() - started
+
+        written_paths = []
+        if result['status'] == 'finished':
+            for label_name, labels in stitched.items():
+                lut = labels.relabel(borders, halo)
+                print(f'Stitched {labels.n_labels} labels of {len(tiles)} tiles into '
+                      f'{int(lut.max(initial=0))} {label_name}')
+                written_paths.extend(labels.save(get_label_url(zarr_url, label_name), lut,
+                                                 max_levels=len(metadata['paths'])))
+                _add_label_image(zarr_url, label_name)
+            if tile_checkpoint is not None:
+                tile_checkpoint.remove()
+    except Exception:  # noqa: BLE001
+        # Any error of the stitching fails the job, like a failed tile
+        result = dict(status='failed', error=traceback.format_exc())
+        written_paths = []
+        tiles_seconds = time.perf_counter() - started
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    if tile_checkpoint is not None and result['status'] != 'finished':
+        print(f'Kept {len(tile_checkpoint.done_tiles)}/{len(tiles)} tiles done in {tile_checkpoint.checkpoint_dir}, '
+              f'run the task again to resume')
+
+    wall = time.perf_counter() - started
+    cpu = [stats['cpu'] for stats in tile_stats if stats.get('cpu') is not None]
+    peak_rss = [stats['peak_rss'] for stats in tile_stats if stats.get('peak_rss') is not None]
+    result.update(rss=None,
+                  pid=None,
+                  n_tiles=len(tiles),
+                  n_resumed=len(done_tiles),
+                  written_paths=written_paths,
+                  stats=dict(phases=dict(tiles=dict(wall=tiles_seconds, cpu=sum(cpu) if cpu else None),
+                                         stitch=dict(wall=wall - tiles_seconds, cpu=None)),
+                             wall=wall,
+                             cpu=sum(cpu) if cpu else None,
+                             peak_rss=max(peak_rss) if peak_rss else None,
+                             read_bytes=None,
+                             write_bytes=None,
+                             profile_path=None))
+    return result
@@ -1,36 +1,151 @@
 
-from typing import TYPE_CHECKING
-from qtpy.QtWidgets import (QHBoxLayout, QPushButton, QWidget, QTabWidget,
-                            QTableWidget, QVBoxLayout, QAbstractItemView, QLabel,
-                            QLineEdit, QTabBar, QFileDialog, QCheckBox, QComboBox,
-                            QScrollArea)
-from qtpy.QtGui import QPixmap, QFont
-from qtpy.QtCore import Qt, QSize
-
-from PyQt5.QtCore import QObject, QThread, pyqtSignal, pyqtSlot
-# from superqt import QCollapsible
-
+import copy
+import functools
+import itertools
 import json
-import subprocess
 import os
-import napari
-import dask.array as da
-
-from ome_zarr.reader import Reader
-from ome_zarr.io import parse_url
-from ome_zarr.types import LayerData
-
-from napari_ome_zarr._reader import napari_get_reader
-from napari.qt.threading import thread_worker
-
+import shutil
+import tempfile
+import time
 from pathlib import Path
+from typing import TYPE_CHECKING
+
+import dask.array as da
+import napari
+import numpy as np
+from PyQt5.QtCore import QObject, pyqtSignal
+from qtpy.QtCore import QLocale, QSize, Qt, QTimer
+from qtpy.QtGui import QDoubleValidator, QFont, QPixmap
+from qtpy.QtWidgets import (
+    QAbstractItemView,
+    QCheckBox,
+    QComboBox,
+    QDoubleSpinBox,
+    QFileDialog,
+    QHBoxLayout,
+    QLabel,
+    QLineEdit,
+    QListWidget,
+    QListWidgetItem,
+    QProgressBar,
+    QPushButton,
+    QSpinBox,
+    QTableWidget,
+    QTableWidgetItem,
+    QTabWidget,
+    QVBoxLayout,
+    QWidget,
+)
+from superqt import QCollapsible
+
+from ._executors import EXECUTORS, create_executor
+from ._features import FeatureTable, find_feature_tables, merge_features
+from ._in_memory import (
+    read_in_memory_labels,
+    remove_in_memory_zarr,
+    write_in_memory_zarr,
+)
+from ._label_edits import EditableLabels
+from ._manifest import ManifestIndex
+from ._memory import (
+    GIB,
+    estimate_job_memory,
+    get_default_memory_budget,
+    get_memory_warning,
+    get_worker_memory_limit,
+)
+from ._plate import find_image_zarr_urls, get_plate_url
+from ._preview import (
+    DEFAULT_ROI_TABLES,
+    get_level_bbox,
+    get_roi_bbox,
+    get_shapes_bbox,
+    get_viewport_bbox,
+    write_cropped_zarr,
+)
+from ._result_cache import ResultCache
+from ._run_records import get_run_prefix, prune_runs
+from ._runner import TaskRunner, create_task_job
+from ._scheduler import TaskJob, TaskScheduler
+from ._sweep import (
+    SweepStack,
+    get_sweep_names,
+    get_sweep_schema,
+    get_sweep_variants,
+    parse_sweep_values,
+    set_sweep_values,
+)
+from ._task_manager import (
+    INCLUDE_CATEGORIES,
+    FractalTaskManager,
+    TaskArgsError,
+    parse_value,
+)
+from ._tiling import DEFAULT_HALO
+from ._zarr_utils import (
+    get_source_paths,
+    load_labels,
+    mark_written,
+    open_array,
+)
 
 if TYPE_CHECKING:
     import napari
 
 # TODO: Automatically decide what properties to ignore based on MANIFEST
 IGNORE_PROPERTIES = ['zarr_url', 'channels_to_include', 'channels_to_exclude', 'measure_texture'] #, 'channel'
-INCLUDE_CATEGORIES = ["Segmentation", "Measurement"]
+JOB_TABLE_COLUMNS = ['Job', 'Task', 'Image', 'Priority', 'Status', 'Progress', 'Message']
+STATS_TABLE_COLUMNS = ['Metric', 'Value']
+PREVIEW_REGIONS = ['Current view', 'Shapes layer', 'ROI']
+# Previews jump the queue, the user is waiting for them
+PREVIEW_PRIORITY = 1000
+# Milliseconds without edits before a live preview runs
+LIVE_PREVIEW_DELAY_MS = 400
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f'{hours}h{minutes:02d}m'
+    return f'{minutes}m{seconds:02d}s' if minutes else f'{seconds}s'
+
+def format_bytes(n_bytes):
+    for unit in ['B', 'KiB', 'MiB', 'GiB']:
+        if abs(n_bytes) < 1024:
+            return f'{n_bytes:.0f} {unit}' if unit == 'B' else f'{n_bytes:.1f} {unit}'
+        n_bytes /= 1024
+    return f'{n_bytes:.1f} TiB'
+
+def parse_timeout(text):
+    # Seconds a job may run, None if the field is empty
+    text = text.strip()
+    if text == '':
+        return None
+    try:
+        timeout = float(text)
+    except ValueError:
+        raise ValueError(f'The timeout must be a number of seconds, not {text!r}') from None
+    if not timeout > 0:
+        raise ValueError(f'The timeout must be a positive number of seconds, not {text!r}')
+    return timeout
+
+def get_run_stats_rows(record):
+    # (metric, value) rows of a run stats record, phases in the order they ran
+    rows = [('Status', record['status'])]
+    if record.get('queued') is not None:
+        rows.append(('Queued', f'{record["queued"]:.2f} s'))
+    for phase in ['spawn', 'preload', 'decode', 'import', 'task', 'scan_outputs', 'tiles', 'stitch', 'reload']:
+        timing = record['phases'].get(phase)
+        if timing is not None:
+            cpu = '' if timing['cpu'] is None else f' (CPU {timing["cpu"]:.2f} s)'
+            rows.append((phase, f'{timing["wall"]:.2f} s{cpu}'))
+    for key, label in [('memory_estimate', 'Estimated memory'), ('peak_rss', 'Peak RSS'),
+                       ('read_bytes', 'Read'), ('write_bytes', 'Written')]:
+        if record.get(key) is not None:
+            rows.append((label, format_bytes(record[key])))
+    if record.get('profile_path') is not None:
+        rows.append(('Profile', record['profile_path']))
+    return rows
 
 def wipe_cache():
     from napari.utils import resize_dask_cache
@@ -39,6 +154,42 @@ def wipe_cache():
     cache = resize_dask_cache(nbytes=0)
     cache = resize_dask_cache(nbytes=cache_bytes)
 
+def invalidate_cache(written_paths):
+    # Arrays opened from the written paths from now on get new dask names, so
+    # napari does not read the chunks it cached under the old ones. These
+    # age out of the cache, everything else stays warm
+    mark_written(written_paths)
+    print(f'Invalidated the cached chunks of {len(written_paths)} written arrays')
+
+def get_layer_zarr_url(layer):
+    # Set by our reader, layers opened with other OME-Zarr readers only know
+    # the path they were opened from
+    zarr_url = layer.metadata.get('zarr_url')
+    if zarr_url is None:
+        zarr_url = layer.source.path
+    # Computed layers, or layers read from other file formats
+    if zarr_url is None or not os.path.isfile(os.path.join(zarr_url, '.zattrs')):
+        return None
+    return zarr_url
+
+def get_layer_channel(layer):
+    channel = layer.metadata.get('channel')
+    if channel is None:
+        # Other readers name channel layers after the channel label
+        return dict(label=layer.name)
+    return channel
+
+def fill_channel_value(value, channel):
+    # A channel left empty in the form is the channel of the selected layer
+    if isinstance(value, dict):
+        args = dict(value['args'])
+        if 'label' in args and all(args.get(key) in (None, '') for key in ['label', 'wavelength_id']):
+            args['label'] = channel['label']
+        return dict(value, args=args)
+    if value in (None, ''):
+        return channel['label']
+    return value
+
 def abspath(root, relpath):
     root = Path(root)
     if root.is_dir():
@@ -47,203 +198,54 @@ def abspath(root, relpath):
         path = root.parent/relpath
     return str(path.absolute())
 
-class FractalTaskManager:
-    # Manage tasks by keeping track of what each tab contains and what executable it links to
-    def __init__(self):
-        self.tasks = dict()
-
-    def add_task(self,
-                 name,
-                 parent_dir,
-                 executable_parallel,
-                 properties,
-                 defs,
-                 required,
-                 type,
-                 title):
-
-        task_dict = dict(
-            title=title,
-            parent_dir=parent_dir,
-            executable_parallel=executable_parallel,
-            properties=properties,
-            defs=defs,
-            required=required,
-            type=type,
-            widget_dict=dict()
-        )
-        self.tasks[name] = task_dict
-
-    def get_executable_path(self,
-                            name):
-        parent_dir = self.tasks[name]['parent_dir']
-        exec_fname = self.tasks[name]['executable_parallel']
-
-        return os.path.join(parent_dir, exec_fname)
-
-    def get_path_to_json(self,
-                         name):
-
-        parent_dir = self.tasks[name]['parent_dir']
-        title = self.tasks[name]['title']
-        return os.path.join(parent_dir, f'{title}.json')
-
-    def get_task(self,
-                 name):
-        return self.tasks[name]
-
-    def get_properties(self,
-                       name):
-        return self.tasks[name]['properties']
-
-    def get_defs(self,
-                 name):
-        return self.tasks[name]['defs']
-
-    def write_to_json(self,
-                      name):
-
-        parent_dir = self.tasks[name]['parent_dir']
-        title = self.tasks[name]['title']
-        path_to_json = os.path.join(parent_dir, f'{title}.json')
-
-        args_dict = dict()
-        for prop_key in self.tasks[name]['properties'].keys():
-            if 'value' in self.tasks[name]['properties'][prop_key]:
-                args_dict[prop_key] = self.tasks[name]['properties'][prop_key]['value']
-
-        with open(path_to_json, 'w') as f:
-            json.dump(args_dict, f)
-
-    def get_title(self,
-                  name):
-        return self.tasks[name]['title']
-
-    def update_task_property(self,
-                             name,
-                             property,
-                             value):
-
-        print('Property dict updated', name, property, value)
-        try:
-            self.tasks[name]['properties'][property]['value'] = value
-        except KeyError:
-            print(f'Property {property} not defined in MANIFEST')
+class WidgetTaskManager(FractalTaskManager):
+    # Reads the task arguments from the forms of the task tabs
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.widget_dicts = dict()
 
     def add_widget_dict(self,
                         name,
                         widget_dict):
-        self.tasks[name]['widget_dict'] = widget_dict
+        self.widget_dicts[name] = widget_dict
 
     def remove_widget_dict(self,
                            name):
-        self.tasks[name]['widge_dict'] = dict()
+        self.widget_dicts[name] = dict()
 
     def get_widget_value(self,
                          name,
                          property):
-        widget = self.tasks[name]['widget_dict'][property]
+        widget = self.widget_dicts[name][property]
 
         if isinstance(widget, QLineEdit):
-            value = widget.text()
-            if value == "":
-                return None
-            else:
-                try:
-                    type = self.tasks[name]['properties'][property]['type']
-
-                    if type == 'integer':
-                        return int(value)
-                    elif type == 'float':
-                        return float(value)
-                    else:
-                        return value
-                except KeyError:
-                    return value
+            return parse_value(widget.text(), self.get_properties(name)[property])
 
         elif isinstance(widget, QCheckBox):
-            if widget.isChecked():
-                return True
-            else:
-                return False
+            return widget.isChecked()
+
+        elif widget is None:
+            # The tab of this parameter group was never opened, use the defaults
+            return self.get_ref_default(name, property)
 
         elif isinstance(widget, dict):
+            ref_schema = self.get_ref_schema(name, property)
             args_dict = dict()
-            ref = os.path.split(self.tasks[name]['properties'][property]['$ref'])[-1]
             for key in widget.keys():
                 if isinstance(widget[key], QLineEdit):
-                    value = widget[key].text()
-                    if value == "":
-                        args_dict[key] = None
-                    else:
-                        try:
-                            type = self.tasks[name]['defs'][ref][key]['type']
-                            print(name, property, key, type)
-
-                            if type == 'integer':
-                                args_dict[key] = int(value)
-                            elif type == 'float':
-                                args_dict[key] = float(value)
-                            else:
-                                args_dict[key] = value
-                        except KeyError:
-                            args_dict[key] = value
-
+                    args_dict[key] = parse_value(widget[key].text(), ref_schema['properties'].get(key, dict()))
                 elif isinstance(widget[key], QCheckBox):
-                    if widget[key].isChecked():
-                        args_dict[key] = True
-                    else:
-                        args_dict[key] = False
+                    args_dict[key] = widget[key].isChecked()
 
-            return_dict = dict(args=args_dict,
-                               type=self.tasks[name]['defs'][ref]['title'])
-
-            return return_dict
+            return dict(args=args_dict,
+                        type=ref_schema['title'])
 
 
 class TaskWorker(QObject):
-    finished = pyqtSignal(str)
-    progress = pyqtSignal(int)
-
-    @property
-    def task_name(self):
-        return self._task_name
-
-    @task_name.setter
-    def task_name(self, name):
-        # Add checks for validity
-        print(f'Set task_name as {name}')
-        self._task_name = name
-
-    @property
-    def task_manager(self):
-        return self._task_manager
-
-    @task_manager.setter
-    def task_manager(self, task_manager):
-        # Add checks for validity
-        print(f'Set task_manager')
-        self._task_manager = task_manager
-
-    @pyqtSlot()
-    def run(self):
-        print('Thread running')
-        task_name = self._launch_task_subprocess(self.task_name)
-        self.finished.emit(task_name)
-
-    def _launch_task_subprocess(self, task_name):
-        print('Launching subprocess...')
-        path_to_executable = self.task_manager.get_executable_path(task_name)
-        print(path_to_executable)
+    # Emitted from the scheduler threads, delivered in the GUI thread
+    job_updated = pyqtSignal(object)
+    progress = pyqtSignal(object)
 
-        path_to_task_args = self.task_manager.get_path_to_json(task_name)
-
-        p = subprocess.Popen(['python', os.path.join(os.path.dirname(__file__), 'task_wrapper.py'), '--executable', path_to_executable, '--path_to_task_args', path_to_task_args]) #Pass wrapper_args: path to executable
-        p.wait()
-
-        print('Finished running subprocess')
-
-        return task_name
 
 class TasksQWidget(QWidget):
     def __init__(self, napari_viewer):
@@ -251,9 +253,50 @@ class TasksQWidget(QWidget):
         self._viewer = napari_viewer
 
         self.exec_btn_dict = dict()
+        self.priority_spin_box_dict = dict()
+        self.timeout_edit_dict = dict()
+        self.preview_region_dict = dict()
+        self.preview_roi_dict = dict()
+        self.preview_level_dict = dict()
+        self.live_preview_dict = dict()
+        self.live_preview_timers = dict()
+        self.live_preview_jobs = dict()
+        self.force_rerun_dict = dict()
+        self.profile_dict = dict()
+        self.tile_size_dict = dict()
+        self.tile_halo_dict = dict()
+        self.roi_wise_dict = dict()
+        self.checkpoint_dict = dict()
+        self.sweep_dict = dict()
+        self.sweep_workers_dict = dict()
+        self.sweeps = dict()
+        self._sweep_ids = itertools.count(1)
+
+        ### Cached index of the tasks of all loaded task packages
+        self.manifest_index = ManifestIndex()
 
         ### Dictionary of TaskManager
-        self.task_manager = FractalTaskManager()
+        self.task_manager = WidgetTaskManager(manifest_index=self.manifest_index)
+
+        ### Runs the tasks, by default in warm worker processes on this machine
+        self.executor = create_executor(EXECUTORS[0])
+
+        ### Job queue, jobs run in scheduler threads and report back via Qt signals
+        self.runner = TaskRunner(executor=self.executor, result_cache=ResultCache())
+        self.worker = TaskWorker()
+        self.worker.job_updated.connect(self._on_job_updated)
+        self.worker.progress.connect(self._on_job_progress)
+        self.scheduler = TaskScheduler(runner=self.runner.run,
+                                       max_concurrency=1,
+                                       on_update=self.worker.job_updated.emit,
+                                       on_progress=self.worker.progress.emit,
+                                       memory_budget=get_default_memory_budget())
+        self._update_worker_memory_limit()
+        self.job_rows = dict()
+        self.run_stats = dict()
+        self.done_job_ids = set()
+        self.feature_tables = dict()
+        self._label_colormaps = dict()
 
         ### Core widget components
         self.main_container = QWidget()
@@ -269,6 +312,10 @@ class TasksQWidget(QWidget):
         image_input_container.layout().addWidget(self._image_layers)
         image_input_container.layout().setSpacing(0)
 
+        ### Fan tasks out over every image of the plate of the input layer
+        self.plate_mode_checkbox = QCheckBox("Run on every image of the plate")
+        self.plate_mode_checkbox.setToolTip("Jobs run in parallel, up to the max. concurrent jobs set in the Jobs tab")
+
         ### Select workflow with tasks
         self.workflow_adder_container = QWidget()
         self.workflow_adder_container.setLayout(QVBoxLayout())
@@ -277,6 +324,11 @@ class TasksQWidget(QWidget):
         self.workflow_adder_btn.clicked.connect(self._select_workflow_file)
         self.workflow_adder_container.layout().addWidget(self.workflow_adder_btn)
 
+        self.task_search_edit = QLineEdit()
+        self.task_search_edit.setPlaceholderText("Search tasks by name, category or tag")
+        self.task_search_edit.textChanged.connect(self._filter_tasks)
+        self.workflow_adder_container.layout().addWidget(self.task_search_edit)
+
         select_workflow_container = QWidget()
         select_workflow_container.setLayout(QHBoxLayout())
         workflow_label = QLabel("Select task:")
@@ -296,6 +348,37 @@ class TasksQWidget(QWidget):
         self.task_adder_btn.clicked.connect(self._add_task)
         task_adder_container.layout().addWidget(self.task_adder_btn)
 
+        ### Paint on Zarr labels, only painted chunks are written back
+        label_edits_container = QWidget()
+        label_edits_container.setLayout(QHBoxLayout())
+
+        self.edit_labels_btn = QPushButton("Edit labels")
+        self.edit_labels_btn.setToolTip("Make the selected labels layer paintable")
+        self.edit_labels_btn.clicked.connect(self._edit_selected_labels)
+        label_edits_container.layout().addWidget(self.edit_labels_btn)
+
+        self.save_label_edits_btn = QPushButton("Save label edits")
+        self.save_label_edits_btn.setToolTip("Edits are also saved before a task runs")
+        self.save_label_edits_btn.clicked.connect(self._flush_label_edits)
+        label_edits_container.layout().addWidget(self.save_label_edits_btn)
+
+        ### Measurements of the selected labels layer, shown on hover
+        features_container = QWidget()
+        features_container.setLayout(QHBoxLayout())
+        self.feature_columns_edit = QLineEdit()
+        self.feature_columns_edit.setPlaceholderText("Feature columns, e.g. area, mean_intensity (empty: all)")
+        features_container.layout().addWidget(self.feature_columns_edit)
+        self.load_features_btn = QPushButton("Load features")
+        self.load_features_btn.setToolTip("Attach the feature tables of the selected labels layer, they are "
+                                          "also reloaded when a task writes them")
+        self.load_features_btn.clicked.connect(self._load_selected_features)
+        features_container.layout().addWidget(self.load_features_btn)
+        features_container.layout().addWidget(QLabel('Colour by'))
+        self.colour_by_combo_box = QComboBox()
+        self.colour_by_combo_box.addItem('')
+        self.colour_by_combo_box.currentTextChanged.connect(self._colour_selected_labels_by)
+        features_container.layout().addWidget(self.colour_by_combo_box)
+
         ### Beautification...
         icon_img_container = QWidget()
         icon_img_container.setLayout(QHBoxLayout())
@@ -317,16 +400,118 @@ class TasksQWidget(QWidget):
         self.main_container.layout().addWidget(main_title)
         self.main_container.layout().addWidget(icon_img_container)
         self.main_container.layout().addWidget(image_input_container)
+        self.main_container.layout().addWidget(self.plate_mode_checkbox)
         self.main_container.layout().addWidget(self.workflow_adder_container)
         self.main_container.layout().addWidget(task_adder_container)
+        self.main_container.layout().addWidget(label_edits_container)
+        self.main_container.layout().addWidget(features_container)
+
+        ### Jobs container
+        self.jobs_container = QWidget()
+        self.jobs_container.setLayout(QVBoxLayout())
+
+        concurrency_container = QWidget()
+        concurrency_container.setLayout(QHBoxLayout())
+        concurrency_container.layout().addWidget(QLabel('Max. concurrent jobs:'))
+        self.concurrency_spin_box = QSpinBox()
+        self.concurrency_spin_box.setRange(1, max(1, os.cpu_count() or 1))
+        self.concurrency_spin_box.setValue(self.scheduler.max_concurrency)
+        self.concurrency_spin_box.valueChanged.connect(self._set_max_concurrency)
+        concurrency_container.layout().addWidget(self.concurrency_spin_box)
+        self.jobs_container.layout().addWidget(concurrency_container)
+
+        ### Jobs only start if their estimated peak memory fits next to the running ones
+        memory_container = QWidget()
+        memory_container.setLayout(QHBoxLayout())
+        memory_container.layout().addWidget(QLabel('Memory budget (GiB):'))
+        self.memory_budget_spin_box = QDoubleSpinBox()
+        self.memory_budget_spin_box.setRange(0, 1024 ** 2)
+        self.memory_budget_spin_box.setDecimals(1)
+        self.memory_budget_spin_box.setSpecialValueText('No limit')
+        self.memory_budget_spin_box.setValue((self.scheduler.memory_budget or 0) / GIB)
+        self.memory_budget_spin_box.setToolTip('Estimated peak memory the running jobs may add up to, '
+                                               'by default 80% of the memory available at start')
+        self.memory_budget_spin_box.valueChanged.connect(self._set_memory_budget)
+        memory_container.layout().addWidget(self.memory_budget_spin_box)
+        self.jobs_container.layout().addWidget(memory_container)
+
+        ### Where jobs run, the job table looks the same for every backend
+        executor_container = QWidget()
+        executor_container.setLayout(QHBoxLayout())
+        executor_container.layout().addWidget(QLabel('Run jobs on:'))
+        self.executor_combo_box = QComboBox()
+        self.executor_combo_box.addItems(EXECUTORS)
+        executor_container.layout().addWidget(self.executor_combo_box)
+        self.executor_options_edit = QLineEdit()
+        executor_container.layout().addWidget(self.executor_options_edit)
+        self.executor_combo_box.currentTextChanged.connect(self._set_executor)
+        self.executor_options_edit.editingFinished.connect(self._set_executor)
+        self.jobs_container.layout().addWidget(executor_container)
+        self._executor_name = EXECUTORS[0]
+        self._executor_options = ''
+        self._update_executor_options_edit()
+
+        self.job_table = QTableWidget(0, len(JOB_TABLE_COLUMNS))
+        self.job_table.setHorizontalHeaderLabels(JOB_TABLE_COLUMNS)
+        self.job_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.job_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.job_table.verticalHeader().setVisible(False)
+        self.jobs_container.layout().addWidget(self.job_table)
+
+        self.cancel_job_btn = QPushButton("Cancel selected jobs")
+        self.cancel_job_btn.clicked.connect(self._cancel_selected_jobs)
+        self.jobs_container.layout().addWidget(self.cancel_job_btn)
+
+        ### Timings, memory and I/O of the selected (or last finished) job
+        self.stats_collapsible = QCollapsible('Run statistics')
+        self.stats_table = QTableWidget(0, len(STATS_TABLE_COLUMNS))
+        self.stats_table.setHorizontalHeaderLabels(STATS_TABLE_COLUMNS)
+        self.stats_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.stats_table.verticalHeader().setVisible(False)
+        self.stats_collapsible.addWidget(self.stats_table)
+        self.jobs_container.layout().addWidget(self.stats_collapsible)
+        self.job_table.itemSelectionChanged.connect(self._show_selected_run_stats)
+
+        ### Pipeline container, steps run one after the other in one worker
+        self.pipeline_container = QWidget()
+        self.pipeline_container.setLayout(QVBoxLayout())
+        pipeline_label = QLabel("Add tasks with 'Add to pipeline' in their tab. Intermediates are kept in "
+                                "memory, only the outputs of checked steps are saved.")
+        pipeline_label.setWordWrap(True)
+        self.pipeline_container.layout().addWidget(pipeline_label)
+
+        self.pipeline_list = QListWidget()
+        self.pipeline_container.layout().addWidget(self.pipeline_list)
+
+        pipeline_edit_container = QWidget()
+        pipeline_edit_container.setLayout(QHBoxLayout())
+        for text, offset in [("Move up", -1), ("Move down", 1)]:
+            move_btn = QPushButton(text)
+            move_btn.clicked.connect(functools.partial(self._move_pipeline_step, offset))
+            pipeline_edit_container.layout().addWidget(move_btn)
+        remove_step_btn = QPushButton("Remove step")
+        remove_step_btn.clicked.connect(self._remove_pipeline_step)
+        pipeline_edit_container.layout().addWidget(remove_step_btn)
+        self.pipeline_container.layout().addWidget(pipeline_edit_container)
+
+        self.run_pipeline_btn = QPushButton("Run pipeline")
+        self.run_pipeline_btn.clicked.connect(self._execute_pipeline)
+        self.pipeline_container.layout().addWidget(self.run_pipeline_btn)
 
         ### Tasks container
         self.tab_container.addTab(self.main_container, "Main")
+        self.tab_container.addTab(self.jobs_container, "Jobs")
+        self.tab_container.addTab(self.pipeline_container, "Pipeline")
 
         self.setLayout(QHBoxLayout())
         self.layout().addWidget(self.tab_container)
 
         self._update_combo_boxes()
+        self._viewer.layers.selection.events.active.connect(lambda event: self._update_colour_by_combo_box())
+
+        # Bring back the task packages of the last session
+        for path_to_workflow in self.manifest_index.get_recent_packages():
+            self._load_task_package(path_to_workflow)
 
     def _update_combo_boxes(self):
         for layer_name in [self._image_layers.itemText(i) for i in range(self._image_layers.count())]:
@@ -340,96 +525,899 @@ class TasksQWidget(QWidget):
     def _select_workflow_file(self):
         path_to_workflow = QFileDialog().getOpenFileName(self, "Select workflow file", ".",
                                                          "workflow specs (*.json)")[0]
+        if path_to_workflow == "":
+            return
 
-        workflow_args = self._get_json_params(path_to_workflow)
+        self._load_task_package(path_to_workflow)
+        self.manifest_index.save_recent_packages()
 
-        for task in workflow_args["task_list"]:
-            if task.get("category") in INCLUDE_CATEGORIES:
-                self.workflow_combo_box.addItem(task["name"])
-                self.task_manager.add_task(name=task["name"],
-                                           parent_dir=os.path.split(path_to_workflow)[0],
-                                           executable_parallel=task["executable_parallel"],
-                                           properties=task["args_schema_parallel"]["properties"],
-                                           defs=task["args_schema_parallel"].get("$defs", None),
-                                           required=task["args_schema_parallel"]["required"],
-                                           type=task["args_schema_parallel"]["type"],
-                                           title=task["args_schema_parallel"]["title"])
-
-    def _fetch_subprocess_output(self, task_name):
-        print(f'Received task_name={task_name}')
-        if task_name in ['Thresholding Label Task', 'Cellpose Segmentation']:
-            wipe_cache()
-            # Remove and reload zarr
-            props = self.task_manager.get_properties(task_name)
-            path_to_zarr = props['zarr_url']['value']
+    def _load_task_package(self, path_to_workflow):
+        self.task_manager.load_package(path_to_workflow, categories=INCLUDE_CATEGORIES)
+        self._filter_tasks(self.task_search_edit.text())
 
-            # Maybe we can allow the user to select this from a drop-down menu of all possible fields?
-            if task_name == 'Thresholding Label Task':
-                out_layer_name = props['label_name']['value']
-            elif task_name == 'Cellpose Segmentation':
-                out_layer_name = props['output_label_name']['value']
-
-            print(f'out_layer_name={out_layer_name}')
-
-            for layer in self._viewer.layers:
-                if isinstance(layer, napari.layers.Labels):
-                    self._viewer.layers.remove(layer.name)
-
-            zarr_layer_data = napari_get_reader(path_to_zarr)()
-            for layer_data in zarr_layer_data:
-                if layer_data[-1] == 'labels':
-                    layer = napari.layers.Layer.create(*layer_data)
-                    print(out_layer_name, layer.name)
-                    if layer.name == out_layer_name:
-                        layer.visible = True
-                        self._viewer.add_layer(layer)
+    def _filter_tasks(self, query):
+        self.workflow_combo_box.clear()
+        for _, task in self.manifest_index.search(query, categories=INCLUDE_CATEGORIES):
+            if self.workflow_combo_box.findText(task["name"]) == -1:
+                self.workflow_combo_box.addItem(task["name"])
 
-        self.thread.quit()
-        self.worker.deleteLater()
-        self.thread.deleteLater()
+    def _set_max_concurrency(self, value):
+        self.executor.resize(value)
+        self.scheduler.max_concurrency = value
+        self._update_worker_memory_limit()
+
+    def _set_memory_budget(self, value):
+        self.scheduler.memory_budget = int(value * GIB) if value > 0 else None
+        self._update_worker_memory_limit()
+
+    def _update_worker_memory_limit(self):
+        # Workers keeping more than their share of the budget are recycled
+        self.executor.set_worker_memory_limit(get_worker_memory_limit(self.scheduler.memory_budget,
+                                                                      self.scheduler.max_concurrency))
+
+    def _warn_memory(self, job):
+        warning = get_memory_warning(job, self.scheduler.memory_budget)
+        if warning is not None:
+            print(warning)
+
+    def _update_executor_options_edit(self):
+        name = self.executor_combo_box.currentText()
+        placeholders = {'Local processes': '',
+                        'Dask cluster': 'Scheduler address, empty for a local cluster',
+                        'Batch scheduler': 'sbatch options, e.g. --mem=16G --time=01:00:00'}
+        self.executor_options_edit.setPlaceholderText(placeholders[name])
+        self.executor_options_edit.setEnabled(name != 'Local processes')
+
+    def _set_executor(self):
+        name = self.executor_combo_box.currentText()
+        options = self.executor_options_edit.text().strip()
+        if (name, options) == (self._executor_name, self._executor_options):
+            return
+
+        error = None
+        if any(job.status == 'running' for job in self.scheduler.jobs):
+            error = 'Wait for the running jobs to finish before switching where jobs run'
+        else:
+            try:
+                executor = create_executor(name, options, n_workers=self.scheduler.max_concurrency)
+            except (ImportError, OSError, ValueError) as e:
+                error = f'Cannot run jobs on {name}: {e}'
+        if error is not None:
+            print(error)
+            self.executor_combo_box.blockSignals(True)
+            self.executor_combo_box.setCurrentText(self._executor_name)
+            self.executor_combo_box.blockSignals(False)
+            self.executor_options_edit.setText(self._executor_options)
+            self._update_executor_options_edit()
+            return
+
+        print(f'Running jobs on {name} {options}'.strip())
+        previous_executor = self.executor
+        self.executor = self.runner.executor = executor
+        self._update_worker_memory_limit()
+        self._executor_name, self._executor_options = name, options
+        self._update_executor_options_edit()
+        previous_executor.shutdown()
+
+    def _cancel_selected_jobs(self):
+        rows = {index.row() for index in self.job_table.selectedIndexes()}
+        for job_id, row in self.job_rows.items():
+            if row in rows:
+                self.scheduler.cancel(job_id)
+
+    def _on_job_updated(self, job):
+        if job.job_id not in self.job_rows:
+            self.job_rows[job.job_id] = self.job_table.rowCount()
+            self.job_table.insertRow(self.job_table.rowCount())
+
+        row = self.job_rows[job.job_id]
+        message = '' if job.error is None else job.error.strip().splitlines()[-1]
+        if job.result is not None and job.result.get('cached', False):
+            message = 'Reused cached result'
+        elif job.status == 'queued' and job.memory is not None:
+            message = f'Needs about {format_bytes(job.memory)}'
+        zarr_url = job.task_args.get('zarr_url', '')
+        if job.group is not None:
+            image = os.path.relpath(zarr_url, job.group)
+        else:
+            image = os.path.basename(os.path.normpath(zarr_url))
+        for column, value in enumerate([job.job_id, job.task_name, image, job.priority, job.status, '', message]):
+            item = QTableWidgetItem(str(value))
+            if column == len(JOB_TABLE_COLUMNS) - 1 and job.error is not None:
+                item.setToolTip(job.error)
+            self.job_table.setItem(row, column, item)
+        self._update_progress_bar(job)
+
+        # Signals are queued, the update of a job starting may only arrive
+        # once it is done, so a done job is only handled once
+        if job.is_done and job.job_id not in self.done_job_ids:
+            self.done_job_ids.add(job.job_id)
+            for step in job.context.get('pipeline', []):
+                if os.path.exists(step['path_to_task_args']):
+                    os.remove(step['path_to_task_args'])
+            if os.path.exists(job.path_to_task_args):
+                os.remove(job.path_to_task_args)
+            reload_started = time.perf_counter()
+            if job.status == 'finished':
+                self._fetch_subprocess_output(job)
+            self._record_run_stats(job, reload_seconds=time.perf_counter() - reload_started)
+            if 'preview' in job.context:
+                shutil.rmtree(os.path.dirname(job.task_args['zarr_url']), ignore_errors=True)
+            if 'in_memory' in job.context:
+                remove_in_memory_zarr(job.task_args['zarr_url'])
+            if 'sweep' in job.context:
+                self._on_sweep_variant_done(job)
+
+    def _record_run_stats(self, job, reload_seconds):
+        result = job.result or dict()
+        stats = copy.deepcopy(result.get('stats') or dict(phases=dict()))
+        stats['phases']['reload'] = dict(wall=reload_seconds, cpu=None)
+        queued = None
+        if job.started_at is not None and job.submitted_at is not None:
+            queued = job.started_at - job.submitted_at
+        record = dict(stats,
+                      job_id=job.job_id,
+                      task_name=job.task_name,
+                      zarr_url=job.task_args.get('zarr_url'),
+                      status=job.status,
+                      cached=result.get('cached', False),
+                      pid=result.get('pid'),
+                      queued=queued,
+                      memory_estimate=job.memory,
+                      submitted_at=job.submitted_at,
+                      finished_at=job.finished_at)
+        self.run_stats[job.job_id] = record
+
+        # One JSON record per run, in the run directory next to the result cache
+        try:
+            with open(get_run_prefix(job.path_to_task_args) + '_stats.json', 'w') as f:
+                json.dump(record, f, indent=2)
+        except OSError as e:
+            print(f'Could not write run statistics of job {job.job_id}: {e}')
+        prune_runs()
+
+        if not self.job_table.selectedIndexes():
+            self._show_run_stats(record)
+
+    def _show_selected_run_stats(self):
+        rows = {index.row() for index in self.job_table.selectedIndexes()}
+        for job_id, row in self.job_rows.items():
+            if row in rows and job_id in self.run_stats:
+                self._show_run_stats(self.run_stats[job_id])
+                return
+
+    def _show_run_stats(self, record):
+        rows = get_run_stats_rows(record)
+        self.stats_collapsible.setText(f'Run statistics: job {record["job_id"]} ({record["task_name"]})')
+        self.stats_table.setRowCount(len(rows))
+        for row, values in enumerate(rows):
+            for column, value in enumerate(values):
+                self.stats_table.setItem(row, column, QTableWidgetItem(str(value)))
+
+    def _on_job_progress(self, job):
+        # Progress of a job whose final state already arrived is stale
+        if job.job_id not in self.job_rows or job.is_done:
+            return
+        self._update_progress_bar(job)
+
+        progress = job.progress
+        message = progress.get('stage') or ''
+        if progress.get('rate'):
+            message = f'{progress["rate"]:.2f} ROI/s, {message}'
+        if progress.get('eta') is not None:
+            message = f'ETA {format_duration(progress["eta"])}, {message}'
+        self.job_table.setItem(self.job_rows[job.job_id], JOB_TABLE_COLUMNS.index('Message'),
+                               QTableWidgetItem(message))
+
+    def _update_progress_bar(self, job):
+        row = self.job_rows[job.job_id]
+        column = JOB_TABLE_COLUMNS.index('Progress')
+        progress_bar = self.job_table.cellWidget(row, column)
+        if progress_bar is None:
+            progress_bar = QProgressBar()
+            progress_bar.setTextVisible(True)
+            self.job_table.setCellWidget(row, column, progress_bar)
+
+        progress = job.progress or dict()
+        progress_bar.setFormat('%p%')
+        if job.status == 'finished':
+            progress_bar.setRange(0, 1)
+            progress_bar.setValue(1)
+        elif job.status == 'running' and progress.get('total'):
+            progress_bar.setRange(0, progress['total'])
+            progress_bar.setValue(progress['current'] or 0)
+            progress_bar.setFormat(f'{progress["current"] or 0}/{progress["total"]} ROIs')
+        elif job.status == 'running':
+            # Busy indicator until the task reports how much there is to do
+            progress_bar.setRange(0, 0)
+        else:
+            progress_bar.setRange(0, 1)
+            progress_bar.setValue(0)
+
+    def _get_output_label_name(self, job):
+        return self._get_task_output_label_name(job.task_name, job.task_args)
+
+    def _get_task_output_label_name(self, task_name, task_args):
+        # Maybe we can allow the user to select this from a drop-down menu of all possible fields?
+        if task_name == 'Thresholding Label Task':
+            return task_args['label_name']
+        elif task_name == 'Cellpose Segmentation':
+            return task_args['output_label_name']
+        return None
+
+    def _fetch_subprocess_output(self, job):
+        task_name = job.task_name
+        print(f'Received task_name={task_name}')
 
-        self._update_execute_buttons(is_enabled=True)
+        # Of a plate run, only the image shown in the viewer is reloaded
+        if job.group is not None:
+            selected_layer = self._viewer.layers[self._image_layers.currentText()]
+            zarr_url = get_layer_zarr_url(selected_layer)
+            if zarr_url is None or os.path.normpath(zarr_url) != os.path.normpath(job.task_args['zarr_url']):
+                return
+
+        if 'sweep' in job.context:
+            self._show_sweep_variant(job)
+            return
+
+        if 'preview' in job.context:
+            self._show_preview(job)
+            return
+
+        if 'in_memory' in job.context:
+            self._show_in_memory_output(job)
+            return
+
+        if 'pipeline' in job.context:
+            self._invalidate_cache(job)
+            for step in job.context['pipeline']:
+                out_layer_name = self._get_task_output_label_name(step['task_name'], step['task_args'])
+                if step['save'] and out_layer_name is not None:
+                    self._reload_labels(job.task_args['zarr_url'], out_layer_name)
+            self._update_features(job.task_args['zarr_url'])
+            return
 
-    def _update_execute_buttons(self, is_enabled=True):
-        for name in self.exec_btn_dict.keys():
-            self.exec_btn_dict[name].setEnabled(is_enabled)
+        if task_name in ['Thresholding Label Task', 'Cellpose Segmentation']:
+            self._invalidate_cache(job)
+            path_to_zarr = job.task_args['zarr_url']
+            out_layer_name = self._get_output_label_name(job)
 
-    def _execute_task(self, task_name):
-        selected_layer = self._viewer.layers[self._image_layers.currentText()]
-        path_to_zarr = selected_layer.source.path
+            print(f'out_layer_name={out_layer_name}')
+            self._reload_labels(path_to_zarr, out_layer_name)
+
+        written_paths = (job.result or dict()).get('written_paths')
+        tables_url = os.path.join(os.path.normpath(job.task_args['zarr_url']), 'tables')
+        if written_paths is None or any(os.path.normpath(p).startswith(tables_url + os.sep) for p in written_paths):
+            self._update_features(job.task_args['zarr_url'])
+
+    def _get_feature_columns(self):
+        # None loads every column
+        columns = [c.strip() for c in self.feature_columns_edit.text().split(',') if c.strip()]
+        return columns or None
+
+    def _attach_features(self, layer):
+        table_urls = find_feature_tables(layer.metadata['zarr_url'], layer.metadata['label_name'])
+        if not table_urls:
+            return False
+        try:
+            tables = [FeatureTable(table_url) for table_url in table_urls]
+            layer.features = merge_features(tables, self._get_feature_columns())
+        except (ValueError, KeyError, OSError) as e:
+            print(f'Cannot load the features of {layer.name}: {e}')
+            return False
+        self.feature_tables[layer.name] = tables
+        print(f'Attached {layer.features.shape[1] - 1} features of {len(layer.features)} objects '
+              f'from {", ".join(table.name for table in tables)} to {layer.name}')
+        if layer.name in self._label_colormaps:
+            # Colour by the same column of the new tables
+            self._colour_labels_by(layer, self._label_colormaps[layer.name][1])
+        self._update_colour_by_combo_box()
+        return True
+
+    def _update_features(self, zarr_url):
+        # Labels layers of the image get the features of its current tables
+        for layer in self._viewer.layers:
+            if (isinstance(layer, napari.layers.Labels) and 'label_name' in layer.metadata
+                    and os.path.normpath(layer.metadata['zarr_url']) == os.path.normpath(zarr_url)):
+                self._attach_features(layer)
+
+    def _load_selected_features(self):
+        layer = self._viewer.layers.selection.active
+        if not isinstance(layer, napari.layers.Labels) or 'label_name' not in layer.metadata:
+            print('Select a labels layer read from an OME-Zarr image to load its features')
+            return
+        if not self._attach_features(layer):
+            print(f'{layer.name} has no feature tables')
+
+    def _update_colour_by_combo_box(self):
+        layer = self._viewer.layers.selection.active
+        columns = []
+        for table in self.feature_tables.get(getattr(layer, 'name', None), []):
+            columns.extend(column for column in table.columns if column not in columns)
+        current = self._label_colormaps.get(getattr(layer, 'name', None), (None, ''))[1]
+        self.colour_by_combo_box.blockSignals(True)
+        self.colour_by_combo_box.clear()
+        self.colour_by_combo_box.addItems([''] + columns)
+        self.colour_by_combo_box.setCurrentText(current)
+        self.colour_by_combo_box.blockSignals(False)
+
+    def _colour_selected_labels_by(self, column):
+        layer = self._viewer.layers.selection.active
+        if not isinstance(layer, napari.layers.Labels) or layer.name not in self.feature_tables:
+            return
+        self._colour_labels_by(layer, column)
+
+    def _colour_labels_by(self, layer, column):
+        from napari.utils.colormaps import DirectLabelColormap, ensure_colormap
+
+        if column == '':
+            if layer.name in self._label_colormaps:
+                layer.colormap = self._label_colormaps.pop(layer.name)[0]
+            return
+        table = next((t for t in self.feature_tables[layer.name] if column in t.columns), None)
+        if table is None:
+            print(f'{layer.name} has no feature {column}')
+            return
+
+        # Only the column to colour by is read
+        values = np.asarray(table.read_column(column), dtype=float)
+        finite = np.isfinite(values)
+        low, high = (np.min(values[finite]), np.max(values[finite])) if finite.any() else (0, 1)
+        normalized = np.clip((values - low) / ((high - low) or 1), 0, 1)
+        colors = ensure_colormap('viridis').map(np.where(finite, normalized, 0))
+        colors[~finite] = (0.5, 0.5, 0.5, 1)
+        color_dict = dict(zip(table.label_ids.tolist(), colors))
+        # Objects without a row are grey, the background stays transparent
+        color_dict.update({None: (0.5, 0.5, 0.5, 1), 0: (0, 0, 0, 0)})
+
+        previous = self._label_colormaps.get(layer.name, (layer.colormap, column))[0]
+        layer.colormap = DirectLabelColormap(color_dict=color_dict)
+        self._label_colormaps[layer.name] = (previous, column)
+        print(f'Colouring {layer.name} by {column} from {low:g} to {high:g}')
+
+    def _reload_labels(self, path_to_zarr, label_name):
+        # Only open the output label group, other layers are left untouched
+        data, metadata = load_labels(path_to_zarr, label_name)
+        self._update_labels_layer(label_name, data, metadata,
+                                  layer_metadata=dict(zarr_url=path_to_zarr, label_name=label_name))
+
+    def _load_preview_labels(self, job, label_name):
+        # The crop is deleted once the job is done, so load it into memory
+        data, metadata = load_labels(job.task_args['zarr_url'], label_name)
+        data = np.asarray(data[0] if isinstance(data, list) else data)
+
+        # Place the crop where it was taken from in the full image
+        y_start, _, x_start, _ = job.context['preview']['bbox']
+        scale = metadata['scale'] or [1] * data.ndim
+        translate = list(metadata['translate'] or [0] * data.ndim)
+        translate[-2] += y_start * scale[-2]
+        translate[-1] += x_start * scale[-1]
+        return data, dict(metadata, scale=scale, translate=translate)
+
+    def _show_preview(self, job):
+        out_layer_name = self._get_output_label_name(job)
+        if out_layer_name is None:
+            print(f'No preview available for {job.task_name}')
+            return
+        if job.context['preview'].get('live') and self.live_preview_jobs.get(job.task_name) is not job:
+            # Finished before it could be cancelled, a newer preview is on its way
+            return
+
+        data, metadata = self._load_preview_labels(job, out_layer_name)
+        self._update_labels_layer(f'{out_layer_name} preview', data, metadata)
+
+    def _show_sweep_variant(self, job):
+        sweep = self.sweeps.get(job.context['sweep']['sweep_id'])
+        if sweep is None:
+            return
+        data, metadata = self._load_preview_labels(job, sweep['label_name'])
+        try:
+            stack = sweep['stack'].add(job.context['sweep']['index'], data)
+        except ValueError as e:
+            print(f'Cannot show variant {job.context["sweep"]["values"]}: {e}')
+            return
+
+        # One slider per swept argument, in front of the axes of the labels
+        n_axes = len(sweep['stack'].shape)
+        metadata = dict(scale=[1] * n_axes + list(metadata['scale']),
+                        translate=[0] * n_axes + list(metadata['translate']))
+        self._update_labels_layer(f'{sweep["label_name"]} sweep', stack, metadata,
+                                  layer_metadata=dict(sweep=sweep['sweep']))
+        print(f'Sweep {job.context["sweep"]["sweep_id"]}: showing {job.context["sweep"]["values"]} '
+              f'at {job.context["sweep"]["index"]}')
+
+    def _on_sweep_variant_done(self, job):
+        sweep_id = job.context['sweep']['sweep_id']
+        sweep = self.sweeps.get(sweep_id)
+        if sweep is None:
+            return
+        sweep['n_done'] += 1
+        if job.status != 'finished':
+            print(f'Variant {job.context["sweep"]["values"]} of sweep {sweep_id} {job.status}')
+        if sweep['n_done'] == sweep['n_variants']:
+            self.scheduler.set_limit(f'sweep{sweep_id}', None)
+            del self.sweeps[sweep_id]
+            print(f'Sweep {sweep_id} of {job.task_name} done')
+
+    def _show_in_memory_output(self, job):
+        out_layer_name = self._get_output_label_name(job)
+        if out_layer_name is None:
+            print(f'{job.task_name} has no output labels to show')
+            return
+
+        # Read straight from shared memory, the layer never had a file
+        context = job.context['in_memory']
+        data, _ = read_in_memory_labels(job.task_args['zarr_url'], out_layer_name)
+        ndim = len(context['scale'])
+        if data.ndim > ndim and all(n == 1 for n in data.shape[:data.ndim - ndim]):
+            data = data[(0,) * (data.ndim - ndim)]
+        self._update_labels_layer(f'{context["layer_name"]} {out_layer_name}', data,
+                                  dict(scale=context['scale'], translate=context['translate']))
+
+    def _invalidate_cache(self, job):
+        written_paths = (job.result or dict()).get('written_paths')
+        if written_paths is None:
+            # The executor could not tell what the task wrote
+            wipe_cache()
+            return
+        self._invalidate_written_paths(written_paths)
+
+    def _invalidate_written_paths(self, written_paths):
+        invalidate_cache(written_paths)
+        # Layers showing a written array as it is read from disk are reopened,
+        # output labels are reloaded by the caller
+        written_paths = [os.path.normpath(p) for p in written_paths]
+        for layer in self._viewer.layers:
+            multiscale = getattr(layer, 'multiscale', False)
+            arrays = layer.data if multiscale else [layer.data]
+            if not all(isinstance(array, da.Array) and array.name.startswith('from-zarr-') for array in arrays):
+                continue
+            source_paths = [get_source_paths(array) for array in arrays]
+            if not any(source_path == p or source_path.startswith(p + os.sep)
+                       for paths in source_paths for source_path in paths for p in written_paths):
+                continue
+            reopened = [open_array(next(iter(paths))) for paths in source_paths if len(paths) == 1]
+            if len(reopened) == len(arrays):
+                layer.data = reopened if multiscale else reopened[0]
+
+    def _edit_selected_labels(self):
+        layer = self._viewer.layers.selection.active
+        if not isinstance(layer, napari.layers.Labels) or 'label_name' not in layer.metadata:
+            print('Select a labels layer read from an OME-Zarr image to edit it')
+            return
+        if isinstance(layer.data, EditableLabels):
+            return
+
+        # napari only paints single resolution labels, so the layer shows the
+        # highest resolution level from now on
+        data = EditableLabels(layer.metadata['zarr_url'], layer.metadata['label_name'])
+        new_layer = self._update_labels_layer(layer.name, data,
+                                              dict(scale=list(layer.scale), translate=list(layer.translate)))
+        self._viewer.layers.selection.active = new_layer
+        new_layer.mode = 'paint'
+
+    def _flush_label_edits(self):
+        written_paths = []
+        for layer in self._viewer.layers:
+            if isinstance(layer, napari.layers.Labels) and isinstance(layer.data, EditableLabels):
+                paths = layer.data.flush()
+                if paths:
+                    print(f'Saved edits of {layer.name} to {layer.data.label_url}')
+                written_paths.extend(paths)
+        if written_paths:
+            self._invalidate_written_paths(written_paths)
+        return written_paths
+
+    def _update_labels_layer(self, name, data, metadata, layer_metadata=None):
+        kwargs = dict()
+        if layer_metadata is not None:
+            kwargs['metadata'] = layer_metadata
+        if metadata.get('scale') is not None:
+            kwargs['scale'] = metadata['scale']
+        if metadata.get('translate') is not None:
+            kwargs['translate'] = metadata['translate']
+
+        multiscale = isinstance(data, list)
+        for layer in self._viewer.layers:
+            if isinstance(layer, napari.layers.Labels) and layer.name == name:
+                if layer.multiscale == multiscale:
+                    # Swapping the data in place keeps colormap, opacity,
+                    # visibility and the position of the layer in the list
+                    layer.data = data
+                    if 'translate' in kwargs:
+                        layer.translate = kwargs['translate']
+                    if layer_metadata is not None:
+                        layer.metadata.update(layer_metadata)
+                    layer.refresh()
+                    return layer
+
+                # napari cannot switch a layer between single and multiscale
+                # data, so carry the display settings over to a new layer
+                index = self._viewer.layers.index(layer)
+                kwargs.update(colormap=layer.colormap,
+                              opacity=layer.opacity,
+                              blending=layer.blending,
+                              visible=layer.visible,
+                              metadata=dict(layer.metadata, **(layer_metadata or dict())))
+                self._viewer.layers.remove(layer)
+                new_layer = napari.layers.Labels(data, name=name, multiscale=multiscale, **kwargs)
+                self._viewer.layers.insert(index, new_layer)
+                return new_layer
+
+        return self._viewer.add_labels(data, name=name, multiscale=multiscale, **kwargs)
+
+    def _update_task_properties(self, task_name, path_to_zarr):
         self.task_manager.update_task_property(task_name, 'zarr_url', path_to_zarr)
 
-        # TODO: This should be set from Zarr metadata file
-        self.task_manager.update_task_property(task_name, 'channel', self._image_layers.currentText())
+        selected_layer = self._viewer.layers[self._image_layers.currentText()]
+        channel = get_layer_channel(selected_layer)
+        self.task_manager.update_task_property(task_name, 'channel', channel['label'])
 
         task_properties = self.task_manager.get_properties(task_name)
         for property in [k for k in task_properties.keys() if k not in IGNORE_PROPERTIES]:
             value = self.task_manager.get_widget_value(task_name, property)
+            if property == 'channel':
+                value = fill_channel_value(value, channel)
             self.task_manager.update_task_property(task_name, property, value)
 
-        self.task_manager.write_to_json(task_name)
+    def _preview_task(self, task_name, live=False):
+        self._flush_label_edits()
+        selected_layer = self._viewer.layers[self._image_layers.currentText()]
+        path_to_zarr = get_layer_zarr_url(selected_layer)
+        if path_to_zarr is None:
+            print(f'Previews need an OME-Zarr image, run {task_name} on {selected_layer.name} instead')
+            return
+        self._update_task_properties(task_name, path_to_zarr)
+
+        crop = self._write_preview_crop(task_name, selected_layer, path_to_zarr)
+        if crop is None:
+            return
+        bbox, crop_url = crop
+
+        self.task_manager.update_task_property(task_name, 'zarr_url', crop_url)
+        job = self._submit_job(task_name,
+                               priority=PREVIEW_PRIORITY,
+                               context=dict(preview=dict(bbox=bbox, source_url=path_to_zarr, live=live)))
+        self.task_manager.update_task_property(task_name, 'zarr_url', path_to_zarr)
+        if job is None:
+            shutil.rmtree(os.path.dirname(crop_url), ignore_errors=True)
+        return job
 
-        # Launch subprocess in separate thread to avoid GUI freezing
-        # TODO: Only launch new thread once existing thread deleted
-        # while not thread_exists:
-        #   create new thread
-        self._update_execute_buttons(is_enabled=False)
+    def _connect_live_preview(self, task_name, widget):
+        # Every edit restarts the countdown to the next live preview
+        if isinstance(widget, QLineEdit):
+            widget.textChanged.connect(lambda: self._schedule_live_preview(task_name))
+        elif isinstance(widget, QCheckBox):
+            widget.stateChanged.connect(lambda: self._schedule_live_preview(task_name))
+        elif isinstance(widget, QComboBox):
+            widget.currentTextChanged.connect(lambda: self._schedule_live_preview(task_name))
+        elif isinstance(widget, QSpinBox):
+            widget.valueChanged.connect(lambda: self._schedule_live_preview(task_name))
+
+    def _schedule_live_preview(self, task_name):
+        if task_name in self.live_preview_dict and self.live_preview_dict[task_name].isChecked():
+            self.live_preview_timers[task_name].start()
+
+    def _toggle_live_preview(self, task_name, checked):
+        if checked:
+            self._schedule_live_preview(task_name)
+            return
+        self.live_preview_timers[task_name].stop()
+        job = self.live_preview_jobs.pop(task_name, None)
+        if job is not None:
+            self.scheduler.cancel(job.job_id)
+
+    def _run_live_preview(self, task_name):
+        # Results of older parameters are no longer of interest
+        previous_job = self.live_preview_jobs.pop(task_name, None)
+        if previous_job is not None:
+            self.scheduler.cancel(previous_job.job_id)
+        job = self._preview_task(task_name, live=True)
+        if job is not None:
+            self.live_preview_jobs[task_name] = job
+        return job
+
+    def _write_preview_crop(self, task_name, selected_layer, path_to_zarr):
+        # (bbox, crop_url) of the region chosen in the tab, None if there is none
+        region = self.preview_region_dict[task_name].currentText()
+        roi_table = self.task_manager.get_args_dict(task_name).get('input_ROI_table')
+        roi_table = roi_table if isinstance(roi_table, str) else 'FOV_ROI_table'
+        try:
+            if region == 'Current view':
+                bbox = get_viewport_bbox(self._viewer, selected_layer, path_to_zarr)
+            elif region == 'Shapes layer':
+                shapes_layers = [l for l in self._viewer.layers if isinstance(l, napari.layers.Shapes)]
+                if not shapes_layers:
+                    print('Draw a rectangle in a Shapes layer to preview on')
+                    return None
+                active = self._viewer.layers.selection.active
+                shapes_layer = active if active in shapes_layers else shapes_layers[-1]
+                bbox = get_shapes_bbox(shapes_layer, selected_layer, path_to_zarr)
+            else:
+                bbox = get_roi_bbox(path_to_zarr, roi_table, self.preview_roi_dict[task_name].value())
+        except (ValueError, KeyError) as e:
+            print(f'Cannot preview {task_name}: {e}')
+            return None
+
+        level, level_bbox = get_level_bbox(path_to_zarr, bbox, self.preview_level_dict[task_name].value())
+        print(f'Previewing {task_name} on {region} {bbox}, level {level}')
+        roi_tables = sorted(set(DEFAULT_ROI_TABLES) | {roi_table})
+        return level_bbox, write_cropped_zarr(path_to_zarr, bbox, roi_tables=roi_tables, level=level)
+
+    def _get_sweep(self, task_name):
+        # [(name, values)] of the arguments chosen in the tab, None if invalid
+        sweep = []
+        for name_combo_box, values_edit in self.sweep_dict[task_name]:
+            name = name_combo_box.currentText()
+            if name == '':
+                continue
+            if name in [name_ for name_, _ in sweep]:
+                print(f'{name} is swept twice')
+                return None
+            try:
+                values = parse_sweep_values(values_edit.text(),
+                                            get_sweep_schema(self.task_manager, task_name, name))
+            except ValueError as e:
+                print(f'Cannot sweep {name}: {e}')
+                return None
+            sweep.append((name, values))
+        if not sweep:
+            print(f'Choose an argument of {task_name} to sweep and its values')
+            return None
+        return sweep
+
+    def _sweep_task(self, task_name):
+        sweep = self._get_sweep(task_name)
+        if sweep is None:
+            return None
+        try:
+            variants = get_sweep_variants(sweep)
+        except ValueError as e:
+            print(e)
+            return None
 
-        self.thread = QThread(parent=self)
-        self.worker = TaskWorker()
-        self.worker.task_name = task_name
-        self.worker.task_manager = self.task_manager
-        self.worker.moveToThread(self.thread)
+        self._flush_label_edits()
+        selected_layer = self._viewer.layers[self._image_layers.currentText()]
+        path_to_zarr = get_layer_zarr_url(selected_layer)
+        if path_to_zarr is None:
+            print(f'Sweeps need an OME-Zarr image, {selected_layer.name} has none')
+            return None
+        self._update_task_properties(task_name, path_to_zarr)
+        original_args = self.task_manager.get_args_dict(task_name)
+        label_name = self._get_task_output_label_name(task_name, original_args)
+        if label_name is None:
+            print(f'{task_name} has no output labels to compare')
+            return None
+
+        crop = self._write_preview_crop(task_name, selected_layer, path_to_zarr)
+        if crop is None:
+            return None
+        bbox, crop_url = crop
+
+        sweep_id = next(self._sweep_ids)
+        limit_key = f'sweep{sweep_id}'
+        self.scheduler.set_limit(limit_key, self.sweep_workers_dict[task_name].value())
+        self.sweeps[sweep_id] = dict(sweep=sweep,
+                                     label_name=label_name,
+                                     stack=SweepStack([len(values) for _, values in sweep]),
+                                     n_variants=len(variants),
+                                     n_done=0)
+        print(f'Sweeping {task_name} over {len(variants)} variants: '
+              + ', '.join(f'{name}={values}' for name, values in sweep))
+
+        # Every variant writes its labels into its own copy of the crop, all
+        # copied before the first variant starts writing
+        crop_urls = [crop_url]
+        for _ in variants[1:]:
+            crop_urls.append(os.path.join(tempfile.mkdtemp(prefix='napari-workflow-tasks-'), 'preview.zarr'))
+            shutil.copytree(crop_url, crop_urls[-1])
+        jobs = []
+        for (index, values), variant_url in zip(variants, crop_urls):
+            set_sweep_values(self.task_manager, task_name, values)
+            self.task_manager.update_task_property(task_name, 'zarr_url', variant_url)
+            job = self._submit_job(task_name,
+                                   priority=PREVIEW_PRIORITY,
+                                   context=dict(preview=dict(bbox=bbox, source_url=path_to_zarr),
+                                                sweep=dict(sweep_id=sweep_id, index=index, values=values)),
+                                   limit_key=limit_key)
+            if job is None:
+                shutil.rmtree(os.path.dirname(variant_url), ignore_errors=True)
+                self.sweeps[sweep_id]['n_variants'] -= 1
+            else:
+                jobs.append(job)
 
-        self.thread.started.connect(self.worker.run)
-        self.worker.finished.connect(self._fetch_subprocess_output)
+        for key, value in original_args.items():
+            self.task_manager.update_task_property(task_name, key, value)
+        if not jobs:
+            self.scheduler.set_limit(limit_key, None)
+            del self.sweeps[sweep_id]
+        return jobs
 
-        self.thread.start()
-        # QLabel describing state of progress
-        # self.thread.finished.connect(
-        #     lambda: self.stepLabel.setText("Long-Running Step: 0")
-        # )
-        #
+    def _execute_task(self, task_name):
+        # Tasks read the labels from disk
+        self._flush_label_edits()
+        selected_layer = self._viewer.layers[self._image_layers.currentText()]
+        path_to_zarr = get_layer_zarr_url(selected_layer)
+        if path_to_zarr is None:
+            self._execute_task_in_memory(task_name, selected_layer)
+            return
+        self._update_task_properties(task_name, path_to_zarr)
+
+        targets = self._get_target_zarr_urls(path_to_zarr)
+        if targets is None:
+            return
+        if len(targets) > 1:
+            print(f'Submitting {task_name} for {len(targets)} images of {targets[0][1]}')
+        context = dict()
+        roi_wise = self.roi_wise_dict[task_name].isChecked()
+        if self.tile_size_dict[task_name].value() > 0 or roi_wise:
+            roi_table = self.task_manager.get_args_dict(task_name).get('input_ROI_table')
+            roi_table = roi_table if isinstance(roi_table, str) else None
+            if roi_wise and roi_table is None:
+                print(f'{task_name} has no input_ROI_table to run ROI by ROI on')
+                return
+            roi_tables = set(DEFAULT_ROI_TABLES) | ({roi_table} if roi_table is not None else set())
+            context['tiling'] = dict(tile_size=0 if roi_wise else self.tile_size_dict[task_name].value(),
+                                     halo=self.tile_halo_dict[task_name].value(),
+                                     n_parallel=self.scheduler.max_concurrency,
+                                     roi_tables=sorted(roi_tables),
+                                     roi_table=roi_table if roi_wise else None,
+                                     checkpoint=self.checkpoint_dict[task_name].isChecked())
+        for zarr_url, group in targets:
+            self.task_manager.update_task_property(task_name, 'zarr_url', zarr_url)
+            self._submit_job(task_name, group=group, context=copy.deepcopy(context))
+
+    def _get_target_zarr_urls(self, path_to_zarr):
+        # (zarr_url, group) of the images to run on, None if there are none
+        if not self.plate_mode_checkbox.isChecked():
+            return [(path_to_zarr, None)]
+
+        plate_url = get_plate_url(path_to_zarr)
+        if plate_url is None:
+            print(f'{path_to_zarr} is not part of an OME-Zarr plate')
+            return None
+
+        # One job per image, so that a failing well does not affect the others
+        return [(zarr_url, plate_url) for _, zarr_url in find_image_zarr_urls(plate_url)]
+
+    def _add_pipeline_step(self, task_name):
+        item = QListWidgetItem(task_name)
+        item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+        item.setCheckState(Qt.Checked)
+        item.setToolTip('Checked steps save their outputs to the image')
+        self.pipeline_list.addItem(item)
+
+    def _move_pipeline_step(self, offset):
+        row = self.pipeline_list.currentRow()
+        if row < 0 or not 0 <= row + offset < self.pipeline_list.count():
+            return
+        item = self.pipeline_list.takeItem(row)
+        self.pipeline_list.insertItem(row + offset, item)
+        self.pipeline_list.setCurrentRow(row + offset)
+
+    def _remove_pipeline_step(self):
+        row = self.pipeline_list.currentRow()
+        if row >= 0:
+            self.pipeline_list.takeItem(row)
+
+    def _execute_pipeline(self):
+        steps = [(self.pipeline_list.item(row).text(), self.pipeline_list.item(row).checkState() == Qt.Checked)
+                 for row in range(self.pipeline_list.count())]
+        if not steps:
+            print('Add tasks to the pipeline first')
+            return
+        missing = [task_name for task_name, _ in steps if not self._task_tab_exists(task_name)]
+        if missing:
+            print(f'Open the tabs of {", ".join(missing)} to set their parameters')
+            return
+
+        # Tasks read the labels from disk
+        self._flush_label_edits()
+        selected_layer = self._viewer.layers[self._image_layers.currentText()]
+        path_to_zarr = get_layer_zarr_url(selected_layer)
+        if path_to_zarr is None:
+            print(f'Pipelines need an OME-Zarr image, {selected_layer.name} has none')
+            return
+        for task_name, _ in steps:
+            self._update_task_properties(task_name, path_to_zarr)
+
+        targets = self._get_target_zarr_urls(path_to_zarr)
+        if targets is None:
+            return
+        for zarr_url, group in targets:
+            self._submit_pipeline(steps, zarr_url, group=group)
+
+    def _submit_pipeline(self, steps, zarr_url, group=None):
+        try:
+            timeouts = [parse_timeout(self.timeout_edit_dict[task_name].text()) for task_name, _ in steps]
+        except ValueError as e:
+            print(e)
+            return None
+        job_id = self.scheduler.new_job_id()
+        pipeline = []
+        for i, (task_name, save) in enumerate(steps):
+            self.task_manager.update_task_property(task_name, 'zarr_url', zarr_url)
+            try:
+                self.task_manager.validate_args(task_name)
+            except TaskArgsError as e:
+                print(e)
+                for step in pipeline:
+                    os.remove(step['path_to_task_args'])
+                return None
+            pipeline.append(dict(task_name=task_name,
+                                 executable=self.task_manager.get_executable_path(task_name),
+                                 path_to_task_args=self.task_manager.write_to_json(task_name,
+                                                                                   job_id=f'{job_id}_step{i + 1}'),
+                                 task_args=self.task_manager.get_args_dict(task_name),
+                                 save=save))
+
+        # The pipeline itself is recorded next to the arguments of its first task
+        path_to_pipeline = os.path.join(os.path.dirname(pipeline[0]['path_to_task_args']),
+                                        f'Pipeline_job{job_id}.json')
+        with open(path_to_pipeline, 'w') as f:
+            json.dump(pipeline, f)
+
+        job = TaskJob(task_name=' > '.join(task_name for task_name, _ in steps),
+                      executable=None,
+                      path_to_task_args=path_to_pipeline,
+                      task_args=dict(zarr_url=zarr_url),
+                      priority=max(self.priority_spin_box_dict[task_name].value() for task_name, _ in steps),
+                      # The pipeline may take as long as all of its steps
+                      timeout=sum(timeouts) if None not in timeouts else None,
+                      group=group,
+                      context=dict(pipeline=pipeline,
+                                   profile=any(self.profile_dict[task_name].isChecked() for task_name, _ in steps)))
+        job.job_id = job_id
+        job.memory = estimate_job_memory(job)
+        self._warn_memory(job)
+
+        self.scheduler.submit(job)
+        return job
+
+    def _execute_task_in_memory(self, task_name, layer):
+        if self.plate_mode_checkbox.isChecked():
+            print(f'{layer.name} is not part of an OME-Zarr plate')
+            return
+        if not self.executor.shares_memory:
+            print(f'{layer.name} has no OME-Zarr on disk, it can only be processed by local jobs')
+            return
+
+        data, meta, _ = layer.as_layer_data_tuple()
+        zarr_url = write_in_memory_zarr(data, meta)
+        print(f'Running {task_name} on {layer.name} in memory at {zarr_url}')
+        self._update_task_properties(task_name, zarr_url)
+        job = self._submit_job(task_name, context=dict(in_memory=dict(layer_name=layer.name,
+                                                                      scale=list(layer.scale),
+                                                                      translate=list(layer.translate))))
+        if job is None:
+            remove_in_memory_zarr(zarr_url)
+        return job
+
+    def _submit_job(self, task_name, group=None, priority=None, context=None, limit_key=None):
+        try:
+            timeout = parse_timeout(self.timeout_edit_dict[task_name].text())
+        except ValueError as e:
+            print(e)
+            return None
+        try:
+            job = create_task_job(self.task_manager,
+                                  task_name,
+                                  self.scheduler.new_job_id(),
+                                  priority=self.priority_spin_box_dict[task_name].value() if priority is None else priority,
+                                  timeout=timeout,
+                                  group=group,
+                                  context=context)
+        except TaskArgsError as e:
+            print(e)
+            return None
+        job.context.setdefault('force_rerun', self.force_rerun_dict[task_name].isChecked())
+        job.context.setdefault('profile', self.profile_dict[task_name].isChecked())
+        job.limit_key = limit_key
+        self._warn_memory(job)
+
+        # Jobs run in scheduler threads to avoid GUI freezing
+        self.scheduler.submit(job)
+        return job
 
     def _task_tab_exists(self, task_name):
         for child_widget in self.tab_container.findChildren(QWidget):
@@ -485,65 +1473,20 @@ class TasksQWidget(QWidget):
                     pass
 
             elif '$ref' in task_properties[prop_key].keys() and prop_key not in IGNORE_PROPERTIES:
-                defs = self.task_manager.get_defs(task_name)
-                ref = os.path.split(task_properties[prop_key]['$ref'])[-1]
-                defs_props = defs[ref]['properties']
-
-                widget_dict_ = dict()
-                for def_prop_key in defs_props.keys():
-                    object_name_ = object_name + f'+{def_prop_key}'
-
-                    with_default_value = True
-                    try:
-                        default_value = defs_props[def_prop_key]['default']
-                    except KeyError:
-                        with_default_value = False
-
-                    if 'type' in defs_props[def_prop_key].keys():
-                        if defs_props[def_prop_key]['type'] in ["integer", "float", "number", "string"]:
-                            widget_dict_[def_prop_key] = QLineEdit(objectName=object_name_)
-                            if with_default_value:
-                                widget_dict_[def_prop_key].setText(str(default_value))
-
-                        elif defs_props[def_prop_key]['type'] == "boolean":
-                            widget_dict_[def_prop_key] = QCheckBox(objectName=object_name_)
-                            if with_default_value:
-                                if default_value:
-                                    widget_dict_[def_prop_key].setChecked(True)
-                                else:
-                                    widget_dict_[def_prop_key].setChecked(False)
-
-                widget_dict[prop_key] = widget_dict_
-
+                # Built once its tab is opened, see _build_ref_tab
+                widget_dict[prop_key] = None
             elif prop_key not in IGNORE_PROPERTIES:
                     widget_dict[prop_key] = QLineEdit(objectName=object_name)
                     if with_default_value:
                         widget_dict[prop_key].setText(str(default_value))
 
+        lazy_tabs = dict()
         for prop_key in widget_dict.keys():
-            if isinstance(widget_dict[prop_key], dict):
-                defs = self.task_manager.get_defs(task_name)
-                ref = os.path.split(task_properties[prop_key]['$ref'])[-1]
-                defs_props = defs[ref]['properties']
-
-                outer_container = QWidget()
+            if widget_dict[prop_key] is None:
+                outer_container = QWidget(objectName=f'{task_name}+{prop_key}+tab')
                 outer_container.setLayout(QVBoxLayout())
-                for prop_key_ in widget_dict[prop_key].keys():
-                    container = QWidget()
-                    container.setLayout(QHBoxLayout())
-                    qlabel_ = QLabel(defs_props[prop_key_]['title'])
-                    try:
-                        qlabel_.setToolTip(defs_props[prop_key_]['description'])
-                        qlabel_.setToolTipDuration(3000)
-                    except KeyError:
-                        pass
-                    container.layout().addWidget(qlabel_)
-
-                    container.layout().addWidget(widget_dict[prop_key][prop_key_])
-                    outer_container.layout().addWidget(container)
-
+                lazy_tabs[prop_key] = outer_container
                 task_container.addTab(outer_container, task_properties[prop_key]['title'])
-
             else:
                 container = QWidget()
                 container.setLayout(QHBoxLayout())
@@ -557,24 +1500,210 @@ class TasksQWidget(QWidget):
 
                 container.layout().addWidget(widget_dict[prop_key])
                 main_container.layout().addWidget(container)
+                self._connect_live_preview(task_name, widget_dict[prop_key])
 
         self.task_manager.add_widget_dict(task_name, widget_dict)
 
+        job_container = QWidget()
+        job_container.setLayout(QHBoxLayout())
+        job_container.layout().addWidget(QLabel('Priority'))
+        self.priority_spin_box_dict[task_name] = QSpinBox()
+        self.priority_spin_box_dict[task_name].setRange(-100, 100)
+        job_container.layout().addWidget(self.priority_spin_box_dict[task_name])
+        job_container.layout().addWidget(QLabel('Timeout (s)'))
+        self.timeout_edit_dict[task_name] = QLineEdit()
+        # Seconds with a dot as decimal separator, whatever the locale, as parse_timeout expects
+        timeout_validator = QDoubleValidator(0.0, 1e9, 3, self.timeout_edit_dict[task_name])
+        timeout_validator.setNotation(QDoubleValidator.StandardNotation)
+        timeout_validator.setLocale(QLocale.c())
+        self.timeout_edit_dict[task_name].setValidator(timeout_validator)
+        self.timeout_edit_dict[task_name].setPlaceholderText('No limit')
+        job_container.layout().addWidget(self.timeout_edit_dict[task_name])
+        self.force_rerun_dict[task_name] = QCheckBox('Force rerun')
+        self.force_rerun_dict[task_name].setToolTip('Run the task even if a cached result for the same input and parameters exists')
+        job_container.layout().addWidget(self.force_rerun_dict[task_name])
+        self.profile_dict[task_name] = QCheckBox('Profile')
+        self.profile_dict[task_name].setToolTip('Profile the task and save the profile with its run statistics')
+        job_container.layout().addWidget(self.profile_dict[task_name])
+        main_container.layout().addWidget(job_container)
+
+        # Split a large image into tiles processed by several workers at once
+        tile_container = QWidget()
+        tile_container.setLayout(QHBoxLayout())
+        tile_container.layout().addWidget(QLabel('Tile size'))
+        self.tile_size_dict[task_name] = QSpinBox()
+        self.tile_size_dict[task_name].setRange(0, 1000000)
+        self.tile_size_dict[task_name].setSingleStep(1024)
+        self.tile_size_dict[task_name].setSpecialValueText('Whole image')
+        self.tile_size_dict[task_name].setToolTip('Run the task on tiles of this size in parallel and stitch '
+                                                  'the labels, rounded up to whole chunks')
+        tile_container.layout().addWidget(self.tile_size_dict[task_name])
+        tile_container.layout().addWidget(QLabel('Halo'))
+        self.tile_halo_dict[task_name] = QSpinBox()
+        self.tile_halo_dict[task_name].setRange(0, 10000)
+        self.tile_halo_dict[task_name].setValue(DEFAULT_HALO)
+        self.tile_halo_dict[task_name].setToolTip('Pixels of context around every tile, should exceed the '
+                                                  'size of an object')
+        tile_container.layout().addWidget(self.tile_halo_dict[task_name])
+        self.roi_wise_dict[task_name] = QCheckBox('ROI-wise')
+        self.roi_wise_dict[task_name].setToolTip('Run the task on every ROI of its input ROI table in parallel '
+                                                 'instead of on tiles')
+        tile_container.layout().addWidget(self.roi_wise_dict[task_name])
+        self.checkpoint_dict[task_name] = QCheckBox('Resumable')
+        self.checkpoint_dict[task_name].setToolTip('Keep the tiles or ROIs done next to the image, running the '
+                                                   'task again after a crash or cancel only processes those left')
+        tile_container.layout().addWidget(self.checkpoint_dict[task_name])
+        main_container.layout().addWidget(tile_container)
+
+        # Run the task on a small crop to tune its parameters
+        preview_container = QWidget()
+        preview_container.setLayout(QHBoxLayout())
+        preview_container.layout().addWidget(QLabel('Preview on'))
+        self.preview_region_dict[task_name] = QComboBox()
+        self.preview_region_dict[task_name].addItems(PREVIEW_REGIONS)
+        preview_container.layout().addWidget(self.preview_region_dict[task_name])
+        preview_container.layout().addWidget(QLabel('ROI'))
+        self.preview_roi_dict[task_name] = QSpinBox()
+        self.preview_roi_dict[task_name].setRange(0, 100000)
+        self.preview_roi_dict[task_name].setToolTip('Index of the ROI in the input ROI table')
+        preview_container.layout().addWidget(self.preview_roi_dict[task_name])
+        preview_container.layout().addWidget(QLabel('Level'))
+        self.preview_level_dict[task_name] = QSpinBox()
+        self.preview_level_dict[task_name].setRange(0, 20)
+        self.preview_level_dict[task_name].setToolTip('Pyramid level to preview on, higher levels are coarser '
+                                                      'and faster')
+        preview_container.layout().addWidget(self.preview_level_dict[task_name])
+        preview_btn = QPushButton("Preview")
+        preview_btn.clicked.connect(lambda: self._preview_task(task_name))
+        preview_container.layout().addWidget(preview_btn)
+        self.live_preview_dict[task_name] = QCheckBox('Live')
+        self.live_preview_dict[task_name].setToolTip('Preview again whenever a parameter is edited')
+        preview_container.layout().addWidget(self.live_preview_dict[task_name])
+        main_container.layout().addWidget(preview_container)
+
+        # Bursts of edits, e.g. typing a number, only start one preview
+        self.live_preview_timers[task_name] = QTimer(self)
+        self.live_preview_timers[task_name].setSingleShot(True)
+        self.live_preview_timers[task_name].setInterval(LIVE_PREVIEW_DELAY_MS)
+        self.live_preview_timers[task_name].timeout.connect(lambda: self._run_live_preview(task_name))
+        self.live_preview_dict[task_name].toggled.connect(
+            lambda checked: self._toggle_live_preview(task_name, checked))
+        for widget in [self.preview_region_dict[task_name], self.preview_roi_dict[task_name],
+                       self.preview_level_dict[task_name]]:
+            self._connect_live_preview(task_name, widget)
+
+        # Run every combination of values of up to two arguments on the preview region
+        sweep_collapsible = QCollapsible('Parameter sweep')
+        sweep_names = [''] + get_sweep_names(self.task_manager, task_name, ignore=IGNORE_PROPERTIES)
+        self.sweep_dict[task_name] = []
+        for _ in range(2):
+            sweep_container = QWidget()
+            sweep_container.setLayout(QHBoxLayout())
+            sweep_name_combo_box = QComboBox()
+            sweep_name_combo_box.addItems(sweep_names)
+            sweep_container.layout().addWidget(sweep_name_combo_box)
+            sweep_values_edit = QLineEdit()
+            sweep_values_edit.setPlaceholderText('start:stop:step or 1, 2, 5')
+            sweep_container.layout().addWidget(sweep_values_edit)
+            sweep_collapsible.addWidget(sweep_container)
+            self.sweep_dict[task_name].append((sweep_name_combo_box, sweep_values_edit))
+        sweep_run_container = QWidget()
+        sweep_run_container.setLayout(QHBoxLayout())
+        sweep_run_container.layout().addWidget(QLabel('Parallel variants'))
+        self.sweep_workers_dict[task_name] = QSpinBox()
+        self.sweep_workers_dict[task_name].setRange(1, max(1, os.cpu_count() or 1))
+        self.sweep_workers_dict[task_name].setValue(self.sweep_workers_dict[task_name].maximum())
+        self.sweep_workers_dict[task_name].setToolTip('Variants running at once, '
+                                                      'also limited by the max. concurrent jobs')
+        sweep_run_container.layout().addWidget(self.sweep_workers_dict[task_name])
+        sweep_btn = QPushButton("Run sweep")
+        sweep_btn.setToolTip('Variants show up in one labels layer with a slider per argument as they finish')
+        sweep_btn.clicked.connect(lambda: self._sweep_task(task_name))
+        sweep_run_container.layout().addWidget(sweep_btn)
+        sweep_collapsible.addWidget(sweep_run_container)
+        main_container.layout().addWidget(sweep_collapsible)
+
         self.exec_btn_dict[task_name] = QPushButton("Execute task")
         self.exec_btn_dict[task_name].clicked.connect(lambda: self._execute_task(task_name))
         main_container.layout().addWidget(self.exec_btn_dict[task_name])
 
+        add_to_pipeline_btn = QPushButton("Add to pipeline")
+        add_to_pipeline_btn.clicked.connect(lambda: self._add_pipeline_step(task_name))
+        main_container.layout().addWidget(add_to_pipeline_btn)
+
         task_close_button = QPushButton("Remove task")
         task_close_button.clicked.connect(lambda: self._close_tab(task_name))
         main_container.layout().addWidget(task_close_button)
 
         task_container.addTab(main_container, "Main")
+        task_container.setCurrentWidget(main_container)
+
+        # Forms of nested parameter groups are only built when first shown
+        def _on_tab_changed(index):
+            for prop_key, outer_container in list(lazy_tabs.items()):
+                if task_container.widget(index) is outer_container:
+                    self._build_ref_tab(task_name, prop_key, outer_container)
+                    del lazy_tabs[prop_key]
+        task_container.currentChanged.connect(_on_tab_changed)
 
         self.tab_container.addTab(task_container, task_name)
 
+    def _build_ref_tab(self, task_name, prop_key, outer_container):
+        task_properties = self.task_manager.get_properties(task_name)
+        object_name = f'{task_name}+{prop_key}'
+
+        defs = self.task_manager.get_defs(task_name)
+        ref = os.path.split(task_properties[prop_key]['$ref'])[-1]
+        defs_props = defs[ref]['properties']
+
+        widget_dict_ = dict()
+        for def_prop_key in defs_props.keys():
+            object_name_ = object_name + f'+{def_prop_key}'
+
+            with_default_value = True
+            try:
+                default_value = defs_props[def_prop_key]['default']
+            except KeyError:
+                with_default_value = False
+
+            if 'type' in defs_props[def_prop_key].keys():
+                if defs_props[def_prop_key]['type'] in ["integer", "float", "number", "string"]:
+                    widget_dict_[def_prop_key] = QLineEdit(objectName=object_name_)
+                    if with_default_value:
+                        widget_dict_[def_prop_key].setText(str(default_value))
+
+                elif defs_props[def_prop_key]['type'] == "boolean":
+                    widget_dict_[def_prop_key] = QCheckBox(objectName=object_name_)
+                    if with_default_value:
+                        if default_value:
+                            widget_dict_[def_prop_key].setChecked(True)
+                        else:
+                            widget_dict_[def_prop_key].setChecked(False)
+
+        for prop_key_ in widget_dict_.keys():
+            container = QWidget()
+            container.setLayout(QHBoxLayout())
+            qlabel_ = QLabel(defs_props[prop_key_]['title'])
+            try:
+                qlabel_.setToolTip(defs_props[prop_key_]['description'])
+                qlabel_.setToolTipDuration(3000)
+            except KeyError:
+                pass
+            container.layout().addWidget(qlabel_)
+
+            container.layout().addWidget(widget_dict_[prop_key_])
+            outer_container.layout().addWidget(container)
+            self._connect_live_preview(task_name, widget_dict_[prop_key_])
+
+        self.task_manager.widget_dicts[task_name][prop_key] = widget_dict_
+
     def _close_tab(self, task_name):
         # TODO: Explicitly handle task_manager dictionaries
         self.task_manager.remove_widget_dict(task_name)
+        if task_name in self.live_preview_timers:
+            self._toggle_live_preview(task_name, False)
+            del self.live_preview_timers[task_name]
+            del self.live_preview_dict[task_name]
 
         for child_widget in self.tab_container.findChildren(QWidget):
             if isinstance(child_widget, QWidget):
@@ -1,23 +1,225 @@
 """
-This module is an example of a barebones writer plugin for napari.
+Writer contributions saving napari image and labels layers as OME-Zarr.
 
 It implements the Writer specification.
 see: https://napari.org/stable/plugins/guides.html?#writers
 
-Replace code below according to your needs.
+Layers are written level by level: the chunks of a level are computed and
+written in parallel by a thread pool, and every further pyramid level is
+downsampled from the level just written to disk. Dask-backed layers are
+therefore streamed chunk by chunk and never loaded as a whole.
 """
 from __future__ import annotations
 
+import os
 from collections.abc import Sequence
 from typing import TYPE_CHECKING, Any, Union
 
+import dask.array as da
+import numpy as np
+import zarr
+from numcodecs import Blosc
+
 if TYPE_CHECKING:
     DataType = Union[Any, Sequence[Any]]
     FullLayerData = tuple[DataType, dict, str]
 
+# OME-NGFF 0.4 axis order, arrays use the trailing axes of it
+AXES = ('t', 'c', 'z', 'y', 'x')
+AXIS_TYPES = dict(t='time', c='channel', z='space', y='space', x='space')
+# Chunk size along y and x, other axes are chunked one plane at a time
+DEFAULT_CHUNK_SIZE = 1024
+DEFAULT_COMPRESSOR = Blosc(cname='zstd', clevel=5, shuffle=Blosc.BITSHUFFLE)
+# Pyramid levels are added until y and x fit into this size
+DEFAULT_MIN_SIZE = 256
+DEFAULT_MAX_LEVELS = 8
+DOWNSCALE = 2
+
+
+def get_axes(ndim, axis_labels=None):
+    """Return OME-NGFF axis names for an array with ``ndim`` dimensions.
+
+    napari axis labels are used if they are valid OME-NGFF axis names,
+    otherwise the last ``ndim`` names of t, c, z, y, x.
+    """
+    if axis_labels is not None:
+        axes = [str(label).lower() for label in axis_labels]
+        if len(axes) == ndim and len(set(axes)) == ndim and set(axes) <= set(AXES) and axes[-2:] == ['y', 'x']:
+            return axes
+    if ndim > len(AXES):
+        raise ValueError(f'Cannot write {ndim}D data as OME-Zarr, at most {len(AXES)}D is supported')
+    return list(AXES[-ndim:])
+
+
+def get_chunks(axes, chunk_size=DEFAULT_CHUNK_SIZE):
+    return tuple(chunk_size if axis in ('y', 'x') else 1 for axis in axes)
+
+
+def mode_downsample(block, axis=None):
+    """Most frequent value of each block, used as reduction by ``da.coarsen``.
+
+    Ties go to the smallest value.
+    """
+    axis = tuple(range(block.ndim)) if axis is None else axis
+    block = np.moveaxis(block, axis, tuple(range(-len(axis), 0)))
+    block = block.reshape(block.shape[:block.ndim - len(axis)] + (-1,))
+    block = np.sort(block, axis=-1)
+    counts = (block[..., :, np.newaxis] == block[..., np.newaxis, :]).sum(axis=-1)
+    return np.take_along_axis(block, counts.argmax(axis=-1)[..., np.newaxis], axis=-1)[..., 0]
+
+
+def mean_downsample(block, axis=None):
+    mean = block.mean(axis=axis)
+    if np.issubdtype(block.dtype, np.integer):
+        mean = np.round(mean)
+    return mean.astype(block.dtype)
+
+
+def downsample(data, axes, is_label=False, factor=DOWNSCALE):
+    """Downsample the y and x axes of a dask array by ``factor``."""
+    factors = {axes.index(axis): factor for axis in ('y', 'x')}
+    # Trim once at the border instead of at the end of every chunk
+    data = data[tuple(slice(0, n - n % factors.get(i, 1)) for i, n in enumerate(data.shape))]
+    data = data.rechunk({i: max(f, data.chunksize[i] // f * f) for i, f in factors.items()})
+    reduction = mode_downsample if is_label else mean_downsample
+    return da.coarsen(reduction, data, factors, trim_excess=True)
+
+
+def _store(source, array, max_workers):
+    # Source chunks are aligned to the Zarr chunks, so that no two threads
+    # ever write to the same chunk and no lock is needed
+    source = da.asarray(source).rechunk(array.chunks)
+    da.store(source, array, lock=False, scheduler='threads', num_workers=max_workers)
+
+
+def write_multiscale(group,
+                     data,
+                     axes,
+                     scale=None,
+                     translate=None,
+                     is_label=False,
+                     chunk_size=DEFAULT_CHUNK_SIZE,
+                     compressor=DEFAULT_COMPRESSOR,
+                     max_workers=None,
+                     min_size=DEFAULT_MIN_SIZE,
+                     max_levels=DEFAULT_MAX_LEVELS):
+    """Write an image pyramid and its ``multiscales`` metadata to a Zarr group.
+
+    Parameters
+    ----------
+    group : zarr.Group
+        Group to write to.
+    data : array-like or list of array-like
+        numpy or dask array, or a list of pyramid levels which are written
+        as they are.
+    axes : list of str
+        Axis names, see ``get_axes``.
+    scale, translate : sequence of float, optional
+        Of the highest resolution level.
+    is_label : bool
+        Downsample by taking the most frequent value instead of the mean.
+    chunk_size : int
+        Chunk size along y and x.
+    compressor : numcodecs.abc.Codec or None
+        Compressor of all levels.
+    max_workers : int, optional
+        Number of threads writing chunks, by default one per CPU.
+    min_size, max_levels : int
+        Pyramid levels are added until y and x fit into ``min_size`` or
+        there are ``max_levels`` levels.
+
+    Returns
+    -------
+    list of str
+        Paths of the written levels in the group.
+    """
+    levels = list(data) if isinstance(data, list) else [data]
+    build_pyramid = not isinstance(data, list)
+    scale = [1.0] * len(axes) if scale is None else [float(s) for s in scale]
+    chunks = get_chunks(axes, chunk_size)
+
+    paths = []
+    datasets = []
+    level = levels[0]
+    while True:
+        path = str(len(paths))
+        array = group.create_dataset(path,
+                                     shape=level.shape,
+                                     dtype=level.dtype,
+                                     chunks=tuple(min(c, max(n, 1)) for c, n in zip(chunks, level.shape)),
+                                     compressor=compressor,
+                                     dimension_separator='/',
+                                     overwrite=True)
+        _store(level, array, max_workers)
+
+        factor = np.array([DOWNSCALE ** len(paths) if axis in ('y', 'x') else 1 for axis in axes])
+        transformations = [dict(type='scale', scale=list(np.array(scale) * factor))]
+        if translate is not None:
+            transformations.append(dict(type='translation', translation=[float(t) for t in translate]))
+        datasets.append(dict(path=path, coordinateTransformations=transformations))
+        paths.append(path)
+
+        if not build_pyramid:
+            if len(paths) == len(levels):
+                break
+            level = levels[len(paths)]
+            continue
+        yx_shape = [level.shape[axes.index(axis)] for axis in ('y', 'x')]
+        if len(paths) >= max_levels or max(yx_shape) <= min_size or min(yx_shape) < DOWNSCALE:
+            break
+        # Downsample from what is on disk, so only chunks are ever in memory
+        level = downsample(da.from_zarr(array), axes, is_label=is_label)
+
+    multiscale = dict(version='0.4',
+                      axes=[dict(name=axis, type=AXIS_TYPES[axis]) for axis in axes],
+                      datasets=datasets)
+    if group.path:
+        multiscale['name'] = os.path.basename(group.path)
+    group.attrs['multiscales'] = [multiscale]
+    return paths
+
+
+def _get_layer_axes(data, meta):
+    ndim = (data[0] if isinstance(data, list) else data).ndim
+    return get_axes(ndim, meta.get('axis_labels'))
+
+
+def _move_rgb_to_channels(data, meta):
+    # RGB(A) layers keep their colors in the last axis, OME-Zarr in c
+    if not meta.get('rgb', False):
+        return data, meta
+    levels = data if isinstance(data, list) else [data]
+    levels = [da.moveaxis(da.asarray(level), -1, 0) for level in levels]
+    meta = dict(meta, axis_labels=['c'] + list(get_axes(levels[0].ndim - 1)))
+    for key in ['scale', 'translate']:
+        if meta.get(key) is not None:
+            meta[key] = [1 if key == 'scale' else 0] + list(meta[key])
+    return (levels if isinstance(data, list) else levels[0]), meta
+
+
+def _get_omero_channel(meta):
+    channel = dict(label=meta.get('name', 'channel'), active=bool(meta.get('visible', True)))
+    contrast_limits = meta.get('contrast_limits')
+    if contrast_limits is not None:
+        channel['window'] = dict(start=float(contrast_limits[0]), end=float(contrast_limits[1]))
+    return channel
+
+
+def _write_labels(root, name, data, meta, **kwargs):
+    labels = root.require_group('labels')
+    label_names = list(labels.attrs.get('labels', []))
+    if name not in label_names:
+        label_names.append(name)
+    labels.attrs['labels'] = label_names
+
+    group = labels.create_group(name, overwrite=True)
+    write_multiscale(group, data, _get_layer_axes(data, meta),
+                     scale=meta.get('scale'), translate=meta.get('translate'), is_label=True, **kwargs)
+    group.attrs['image-label'] = dict(version='0.4')
+
 
 def write_single_image(path: str, data: Any, meta: dict) -> list[str]:
-    """Writes a single image layer.
+    """Writes a single image layer as an OME-Zarr image.
 
     Parameters
     ----------
@@ -33,15 +235,23 @@ def write_single_image(path: str, data: Any, meta: dict) -> list[str]:
     -------
     [path] : A list containing the string path to the saved file.
     """
+    return write_multiple(path, [(data, meta, 'image')])
 
-    # implement your writer logic here ...
 
-    # return path to any file(s) that were successfully written
-    return [path]
+def write_single_labels(path: str, data: Any, meta: dict) -> list[str]:
+    """Writes a single labels layer as an OME-Zarr label image.
 
+    See ``write_single_image`` for the parameters.
+    """
+    return write_multiple(path, [(data, meta, 'labels')])
+
+
+def write_multiple(path: str, data: list[FullLayerData], **kwargs) -> list[str]:
+    """Writes image and labels layers to one OME-Zarr image.
 
-def write_multiple(path: str, data: list[FullLayerData]) -> list[str]:
-    """Writes multiple layers of different types.
+    Image layers become the channels of the image, so they must all have
+    the same shape. Labels layers are written to ``labels/<layer name>``,
+    or as the image itself if there are no image layers.
 
     Parameters
     ----------
@@ -53,13 +263,58 @@ def write_multiple(path: str, data: list[FullLayerData]) -> list[str]:
         `meta` is a dictionary containing all other metadata attributes
         from the napari layer (excluding the `.data` layer attribute).
         `layer_type` is a string, eg: "image", "labels", "surface", etc.
+    **kwargs
+        Passed to ``write_multiscale``, e.g. ``chunk_size``, ``compressor``
+        or ``max_workers``.
 
     Returns
     -------
     [path] : A list containing (potentially multiple) string paths to the saved file(s).
     """
+    images = [_move_rgb_to_channels(layer_data, meta) for layer_data, meta, layer_type in data
+              if layer_type == 'image']
+    labels = [(layer_data, meta) for layer_data, meta, layer_type in data if layer_type == 'labels']
+
+    root = zarr.open_group(path, mode='w')
+    if images:
+        first_data, first_meta = images[0]
+        axes = _get_layer_axes(first_data, first_meta)
+        if len(images) == 1:
+            image_data = first_data
+            channels = [_get_omero_channel(first_meta)] if 'c' not in axes else None
+            if channels is not None:
+                # Written as a single channel image, as Fractal tasks expect
+                image_data = [level[np.newaxis] for level in image_data] if isinstance(image_data, list) \
+                    else da.asarray(image_data)[np.newaxis]
+                axes = ['c'] + axes
+        else:
+            if 'c' in axes or any(isinstance(layer_data, list) for layer_data, _ in images):
+                raise ValueError('Only single resolution layers without a channel axis can be '
+                                 'written as the channels of one image')
+            shapes = {tuple(layer_data.shape) for layer_data, _ in images}
+            if len(shapes) > 1:
+                raise ValueError(f'Image layers have different shapes {sorted(shapes)}, '
+                                 'they cannot be written as channels of one image')
+            image_data = da.stack([da.asarray(layer_data) for layer_data, _ in images])
+            channels = [_get_omero_channel(meta) for _, meta in images]
+            axes = ['c'] + axes
+
+        scale, translate = first_meta.get('scale'), first_meta.get('translate')
+        if 'c' in axes and scale is not None and len(scale) < len(axes):
+            scale = [1] + list(scale)
+            translate = None if translate is None else [0] + list(translate)
+        write_multiscale(root, image_data, axes, scale=scale, translate=translate, **kwargs)
+        if channels is not None:
+            root.attrs['omero'] = dict(channels=channels)
 
-    # implement your writer logic here ...
+        for layer_data, meta in labels:
+            _write_labels(root, meta.get('name', 'labels'), layer_data, meta, **kwargs)
+    elif labels:
+        layer_data, meta = labels[0]
+        write_multiscale(root, layer_data, _get_layer_axes(layer_data, meta),
+                         scale=meta.get('scale'), translate=meta.get('translate'), is_label=True, **kwargs)
+        root.attrs['image-label'] = dict(version='0.4')
+        for layer_data, meta in labels[1:]:
+            _write_labels(root, meta.get('name', 'labels'), layer_data, meta, **kwargs)
 
-    # return path to any file(s) that were successfully written
     return [path]
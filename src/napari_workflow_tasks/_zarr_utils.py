@@ -0,0 +1,143 @@
+"""
+Small helpers to read OME-Zarr metadata and arrays directly.
+
+These only open the groups that are asked for, in contrast to going through
+a full reader plugin that builds every layer of an image. Parsed ``.zattrs``
+and opened arrays are cached by path and modification time, so re-opening an
+unchanged image is free and returns the same dask arrays.
+
+napari caches chunks under keys derived from the dask name of an array. The
+name of an opened array therefore changes whenever the array is written, as
+told by ``mark_written`` or seen from the modification time of its
+directory, so that reopening it after a task wrote it never reads stale
+chunks.
+"""
+import collections
+import copy
+import functools
+import json
+import os
+
+import dask.array as da
+import zarr
+from dask.base import tokenize
+
+# Number of times every array, or group of arrays, was written by a task
+_write_counts = collections.Counter()
+
+
+@functools.lru_cache(maxsize=1024)
+def _read_json(path, mtime_ns):
+    with open(path) as f:
+        return json.load(f)
+
+
+def read_zattrs(zarr_url):
+    path = os.path.join(zarr_url, '.zattrs')
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return dict()
+    # Callers may modify what they get back
+    return copy.deepcopy(_read_json(path, mtime_ns))
+
+
+def mark_written(paths):
+    """Record that arrays, or groups of arrays, were written.
+
+    Arrays opened from them afterwards get new dask names.
+    """
+    for path in paths:
+        _write_counts[os.path.normpath(path)] += 1
+
+
+def _get_write_count(array_url):
+    array_url = os.path.normpath(array_url)
+    return sum(count for path, count in _write_counts.items()
+               if array_url == path or array_url.startswith(path + os.sep))
+
+
+@functools.lru_cache(maxsize=1024)
+def _open_array(array_url, version):
+    return da.from_zarr(array_url, name=f'from-zarr-{tokenize(array_url, version)}')
+
+
+def open_array(array_url):
+    """Open a Zarr array as a dask array, reusing it until it is written."""
+    # Writing chunks replaces files in the array directory, which updates its
+    # modification time for flat chunk layouts
+    version = (os.stat(os.path.join(array_url, '.zarray')).st_mtime_ns,
+               os.stat(array_url).st_mtime_ns,
+               _get_write_count(array_url))
+    return _open_array(array_url, version)
+
+
+def get_label_url(zarr_url, label_name):
+    return os.path.join(zarr_url, 'labels', label_name)
+
+
+def get_multiscale_metadata(group_url):
+    """Return dataset paths, scales and translations of a multiscales group.
+
+    Returns
+    -------
+    dict
+        ``paths`` of the pyramid levels from highest to lowest resolution,
+        ``axes`` names and ``scale``/``translate`` of the highest resolution
+        level, as expected by napari.
+    """
+    multiscales = read_zattrs(group_url).get('multiscales')
+    if not multiscales:
+        raise ValueError(f'{group_url} is not an OME-Zarr multiscales group')
+    multiscale = multiscales[0]
+
+    datasets = multiscale['datasets']
+    axes = [axis['name'] if isinstance(axis, dict) else axis
+            for axis in multiscale.get('axes', [])]
+
+    scale = None
+    translate = None
+    for transformation in datasets[0].get('coordinateTransformations', []):
+        if transformation['type'] == 'scale':
+            scale = transformation['scale']
+        elif transformation['type'] == 'translation':
+            translate = transformation['translation']
+
+    return dict(paths=[dataset['path'] for dataset in datasets],
+                axes=axes,
+                scale=scale,
+                translate=translate)
+
+
+def load_multiscale(group_url, max_levels=None):
+    """Open the pyramid levels of a multiscales group as lazy dask arrays."""
+    metadata = get_multiscale_metadata(group_url)
+    paths = metadata['paths'] if max_levels is None else metadata['paths'][:max_levels]
+    arrays = [open_array(os.path.join(group_url, path)) for path in paths]
+    return arrays, metadata
+
+
+def load_labels(zarr_url, label_name):
+    """Open only the ``labels/<label_name>`` group of an OME-Zarr image.
+
+    Returns
+    -------
+    data : dask.array.Array or list of dask.array.Array
+        A single array, or the pyramid if the labels have several levels.
+    metadata : dict
+        See ``get_multiscale_metadata``.
+    """
+    arrays, metadata = load_multiscale(get_label_url(zarr_url, label_name))
+    data = arrays if len(arrays) > 1 else arrays[0]
+    return data, metadata
+
+
+def get_source_paths(array):
+    """Return the paths of the Zarr arrays a dask array reads from."""
+    paths = set()
+    for value in array.__dask_graph__().values():
+        if isinstance(value, zarr.Array):
+            store_path = getattr(value.store, 'path', None)
+            if store_path is not None:
+                paths.add(os.path.normpath(os.path.join(store_path, value.path)))
+    return paths
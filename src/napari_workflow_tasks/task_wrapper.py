@@ -1,38 +1,677 @@
-import json
-import importlib
 import argparse
+import contextlib
+import functools
+import importlib
+import importlib.util
+import json
+import logging
 import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from inspect import getmembers, isclass, isfunction
+from multiprocessing.connection import Client
 
-from inspect import getmembers, isfunction, isclass
+# Task modules loaded by this interpreter, keyed by executable path and mtime
+_TASK_MODULES = dict()
+# Files written through zarr stores while a job runs, see record_zarr_writes
+_zarr_writes = None
+_zarr_stores_patched = False
 
-import fractal_tasks_core
+# Fractal tasks log e.g. "Now processing ROI 3/24" while looping over ROIs
+ROI_PROGRESS_PATTERN = re.compile(r'ROI (\d+)\s*/\s*(\d+)')
+# Minimum seconds between two progress events sent to the pool
+PROGRESS_INTERVAL = 0.1
 
-from fractal_tasks_core.channels import ChannelInputModel
-from fractal_tasks_core.tasks.cellpose_utils import CellposeChannel1InputModel
-from fractal_tasks_core.tasks.cellpose_utils import CellposeChannel2InputModel
-from fractal_tasks_core.tasks.cellpose_utils import CellposeCustomNormalizer
-from fractal_tasks_core.tasks.cellpose_utils import CellposeModelParams
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--executable', type=str)
-    parser.add_argument('--path_to_task_args', type=str)
-
-    args = parser.parse_args()
+def preload():
+    # Import the heavy task dependencies once so that long-lived workers
+    # start every job warm
+    try:
+        import fractal_tasks_core
+        import fractal_tasks_core.tasks.cellpose_utils
+        from fractal_tasks_core.channels import ChannelInputModel
+    except ImportError:
+        print('fractal_tasks_core not available, skipping preload')
 
-    with open(args.path_to_task_args) as f:
-        task_args = json.load(f)
 
+def decode_task_args(task_args):
+    task_args = dict(task_args)
     for key in task_args.keys():
         if isinstance(task_args[key], dict):
+            import fractal_tasks_core.tasks.cellpose_utils
             type_func = getattr(fractal_tasks_core.tasks.cellpose_utils, task_args[key]['type'])
             task_args[key] = type_func(**task_args[key]['args'])
+    return task_args
+
+
+def load_task_function(executable):
+    executable_name = os.path.splitext(os.path.basename(executable))[0]
+
+    key = (executable, os.path.getmtime(executable))
+    if key not in _TASK_MODULES:
+        spec = importlib.util.spec_from_file_location(f'{executable_name}', executable)
+        task_module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(task_module)
+        _TASK_MODULES[key] = task_module
+
+    return getattr(_TASK_MODULES[key], executable_name)
+
+
+def run_task(executable, path_to_task_args, stats=None, profile_path=None, zarr_url=None):
+    stats = RunStats() if stats is None else stats
+
+    with stats.phase('decode'):
+        with open(path_to_task_args) as f:
+            task_args = json.load(f)
+        if zarr_url is not None:
+            task_args['zarr_url'] = zarr_url
+        task_args = decode_task_args(task_args)
+    with stats.phase('import'):
+        task_func = load_task_function(executable)
+    with stats.phase('task'):
+        if profile_path is None:
+            return task_func(**task_args)
+        stats.profile_path, result = profile_call(task_func, task_args, profile_path)
+        return result
+
+
+def profile_call(func, kwargs, profile_path):
+    # Profile with pyinstrument if it is installed, else with cProfile.
+    # Returns the path of the written profile and the result of the call
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            return profile_path + '.prof', profiler.runcall(func, **kwargs)
+        finally:
+            profiler.dump_stats(profile_path + '.prof')
+
+    profiler = Profiler()
+    profiler.start()
+    try:
+        return profile_path + '.html', func(**kwargs)
+    finally:
+        profiler.stop()
+        with open(profile_path + '.html', 'w') as f:
+            f.write(profiler.output_html())
+
+
+def _cpu_seconds():
+    # User and system time of all threads of this process
+    times = os.times()
+    return times.user + times.system
+
+
+def _io_bytes():
+    try:
+        import psutil
+        io_counters = psutil.Process().io_counters()
+    except (ImportError, AttributeError, OSError):
+        return None
+    return io_counters.read_bytes, io_counters.write_bytes
+
+
+def reset_peak_rss():
+    # Linux only, lets a long-lived worker measure the peak of a single job
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+class RunStats:
+    """Wall and CPU time per phase of a task run, peak memory and I/O.
+
+    ``as_dict`` returns the ``phases`` (name -> ``wall`` and ``cpu``
+    seconds), ``wall`` and ``cpu`` seconds of the whole run, ``peak_rss``,
+    ``read_bytes`` and ``write_bytes`` in bytes and the ``profile_path`` of
+    the run, if it was profiled. Measurements that are not available on the
+    platform are None.
+    """
+    def __init__(self):
+        reset_peak_rss()
+        self.phases = dict()
+        self.profile_path = None
+        self._started = time.perf_counter()
+        self._cpu_started = _cpu_seconds()
+        self._io_started = _io_bytes()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        cpu_started = _cpu_seconds()
+        try:
+            yield
+        finally:
+            self.phases[name] = dict(wall=time.perf_counter() - started,
+                                     cpu=_cpu_seconds() - cpu_started)
+
+    def as_dict(self):
+        io_bytes = _io_bytes()
+        if io_bytes is None or self._io_started is None:
+            read_bytes = write_bytes = None
+        else:
+            read_bytes = io_bytes[0] - self._io_started[0]
+            write_bytes = io_bytes[1] - self._io_started[1]
+        return dict(phases=self.phases,
+                    wall=time.perf_counter() - self._started,
+                    cpu=_cpu_seconds() - self._cpu_started,
+                    peak_rss=peak_rss(),
+                    read_bytes=read_bytes,
+                    write_bytes=write_bytes,
+                    profile_path=self.profile_path)
+
+
+class ProgressReporter(logging.Handler):
+    """Turn the log records of a running task into progress events.
+
+    Every event is a dict with ``current`` and ``total`` (ROIs done and to
+    do, None while unknown), the ``stage`` (last log message), ``rate`` in
+    ROIs per second and ``eta`` in seconds, passed to ``send``.
+    """
+    def __init__(self, send, interval=PROGRESS_INTERVAL):
+        super().__init__(level=logging.INFO)
+        self.send = send
+        self.interval = interval
+        self.started = time.monotonic()
+        self.current = None
+        self.total = None
+        self.stage = None
+        self._last_sent = None
+        # Sends the latest progress once the interval after the last one is over
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        try:
+            message = record.getMessage()
+        except Exception:  # noqa: BLE001
+            # A badly formatted log record of the task must not fail it
+            return
+        match = ROI_PROGRESS_PATTERN.search(message)
+        if match is not None:
+            # "ROI i/N" is logged when ROI i starts, so i - 1 are done
+            self.report(int(match.group(1)) - 1, int(match.group(2)), stage=message)
+        else:
+            self.report(self.current, self.total, stage=message)
+
+    def report(self, current, total, stage=None, force=False):
+        with self._lock:
+            self.current, self.total = current, total
+            if stage is not None and stage.strip():
+                self.stage = stage.strip().splitlines()[0][:120]
+
+            now = time.monotonic()
+            if not force and self._last_sent is not None and now - self._last_sent < self.interval:
+                if self._timer is None:
+                    self._timer = threading.Timer(self._last_sent + self.interval - now, self._send_latest)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            event = self._make_event(now)
+        self._send(event)
+
+    def _make_event(self, now):
+        self._cancel_timer()
+        self._last_sent = now
+        rate = eta = None
+        elapsed = now - self.started
+        if self.current and elapsed > 0:
+            rate = self.current / elapsed
+            if self.total is not None:
+                eta = (self.total - self.current) / rate
+        return dict(current=self.current, total=self.total, stage=self.stage, rate=rate, eta=eta)
+
+    def _send_latest(self):
+        with self._lock:
+            if self._timer is None:
+                # Cancelled meanwhile
+                return
+            self._timer = None
+            event = self._make_event(time.monotonic())
+        self._send(event)
+
+    def _send(self, event):
+        with contextlib.suppress(OSError, ValueError):
+            self.send(event)
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def close(self):
+        # Nothing is sent once the job is over
+        with self._lock:
+            self._cancel_timer()
+        super().close()
+
+
+def find_written_paths(zarr_url, since):
+    # Zarr arrays below zarr_url that were created or modified after `since`.
+    # Chunks are written by renaming a temporary file, which updates the
+    # mtime of the directory holding them
+    written_paths = []
+    if zarr_url is None or not os.path.isdir(zarr_url):
+        return written_paths
+
+    # Allow for coarse file system timestamps
+    since = since - 1
+    for dirpath, dirnames, filenames in os.walk(zarr_url):
+        if '.zarray' not in filenames:
+            continue
+        mtimes = [os.path.getmtime(os.path.join(dirpath, '.zarray'))]
+        for chunk_dirpath, _, _ in os.walk(dirpath):
+            mtimes.append(os.path.getmtime(chunk_dirpath))
+        if max(mtimes) >= since:
+            written_paths.append(dirpath)
+        # Nested chunk directories are not arrays themselves
+        dirnames[:] = []
+    return written_paths
+
+
+def _patch_zarr_stores():
+    # Make the zarr stores writing to local files report the paths of the
+    # keys they write, rename or remove. Returns False without zarr
+    global _zarr_stores_patched
+    if _zarr_stores_patched:
+        return True
+    try:
+        from zarr.storage import DirectoryStore, FSStore
+    except ImportError:
+        return False
+
+    def _record(get_keys):
+        def decorator(method):
+            @functools.wraps(method)
+            def wrapper(store, *args, **kwargs):
+                root = getattr(store, 'path', None)
+                if _zarr_writes is not None and root is not None and _is_local_store(store):
+                    _zarr_writes.update(os.path.join(root, key or '') for key in get_keys(*args, **kwargs))
+                return method(store, *args, **kwargs)
+            return wrapper
+        return decorator
+
+    single_key = _record(lambda key, *args, **kwargs: [key])
+    renamed_key = _record(lambda src_path, dst_path: [dst_path])
+    many_keys = _record(lambda values: list(values))
+    removed_dir = _record(lambda path=None: [path])
+    for cls in [DirectoryStore, FSStore]:
+        cls.__setitem__ = single_key(cls.__setitem__)
+        cls.__delitem__ = single_key(cls.__delitem__)
+        cls.rmdir = removed_dir(cls.rmdir)
+    DirectoryStore.rename = renamed_key(DirectoryStore.rename)
+    FSStore.setitems = many_keys(FSStore.setitems)
+    FSStore.delitems = many_keys(FSStore.delitems)
+    _zarr_stores_patched = True
+    return True
+
 
-    executable_name = os.path.splitext(os.path.basename(args.executable))[0]
+def _is_local_store(store):
+    fs = getattr(store, 'fs', None)
+    if fs is None:
+        return True
+    protocol = fs.protocol if isinstance(fs.protocol, (tuple, list)) else [fs.protocol]
+    return 'file' in protocol or 'local' in protocol
 
-    spec = importlib.util.spec_from_file_location(f'{executable_name}', args.executable)
-    task_module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(task_module)
 
-    task_func = getattr(task_module, executable_name)
-    task_func(**task_args)
+@contextlib.contextmanager
+def record_zarr_writes():
+    """Record the files written through zarr while the block runs.
+
+    Yields the set of the paths of the keys zarr stores write, rename or
+    remove, in all threads of this process, or None if zarr cannot be
+    imported. Tasks that write arrays without zarr are not seen.
+    """
+    global _zarr_writes
+    if not _patch_zarr_stores():
+        yield None
+        return
+    _zarr_writes = written = set()
+    try:
+        yield written
+    finally:
+        _zarr_writes = None
+
+
+def get_written_arrays(zarr_url, written_files):
+    """Return the Zarr arrays below ``zarr_url`` the written files belong to.
+
+    See ``record_zarr_writes``. Arrays that were removed are left out.
+    """
+    if zarr_url is None:
+        return []
+    zarr_url = os.path.abspath(zarr_url)
+    arrays = set()
+    for path in written_files:
+        dirpath = os.path.dirname(os.path.abspath(path))
+        # Chunks are in the array directory or nested below it
+        while dirpath.startswith(zarr_url + os.sep):
+            if os.path.exists(os.path.join(dirpath, '.zarray')):
+                arrays.add(dirpath)
+                break
+            dirpath = os.path.dirname(dirpath)
+    return sorted(arrays)
+
+
+def link_zarr(zarr_url, scratch_url):
+    # Mirror the directory tree of zarr_url with links to its files. Zarr
+    # writes a file by renaming a temporary file over it and deletes arrays
+    # with rmtree, so tasks replace or remove the links and never touch the
+    # original files
+    for dirpath, _, filenames in os.walk(zarr_url):
+        scratch_dirpath = os.path.join(scratch_url, os.path.relpath(dirpath, zarr_url))
+        os.makedirs(scratch_dirpath, exist_ok=True)
+        for filename in filenames:
+            os.symlink(os.path.join(dirpath, filename), os.path.join(scratch_dirpath, filename))
+
+
+def snapshot_written_files(scratch_url):
+    # Files written into the scratch copy by tasks, i.e. no longer links
+    snapshot = dict()
+    for dirpath, _, filenames in os.walk(scratch_url):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            stat = os.lstat(path)
+            if not os.path.islink(path):
+                snapshot[os.path.relpath(path, scratch_url)] = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+def get_output_node(relpath):
+    # Outputs are saved as a whole label image, table or top-level array.
+    # Metadata of the groups above them is saved along with them
+    parts = relpath.split(os.sep)
+    depth = 2 if parts[0] in ('labels', 'tables') else 1
+    if len(parts) <= depth:
+        return None
+    return os.path.join(*parts[:depth])
+
+
+def _save_file(path, target_path):
+    # Replace instead of overwrite, so readers never see a partial file
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    temp_path = target_path + '.partial'
+    shutil.copyfile(path, temp_path)
+    os.replace(temp_path, target_path)
+
+
+def _save_group_metadata(scratch_url, zarr_url, node):
+    # Group metadata from the image root down to the saved node. Lists of
+    # label images and tables only keep the ones that exist on disk, an
+    # unsaved intermediate is never listed
+    parts = node.split(os.sep)
+    for i in range(len(parts)):
+        group = os.path.join(*parts[:i]) if i else ''
+        for filename in ['.zgroup', '.zattrs']:
+            path = os.path.join(scratch_url, group, filename)
+            if not os.path.isfile(path) or os.path.islink(path):
+                continue
+            target_path = os.path.join(zarr_url, group, filename)
+            if filename == '.zattrs' and group in ('labels', 'tables'):
+                with open(path) as f:
+                    attrs = json.load(f)
+                attrs[group] = [name for name in attrs.get(group, [])
+                                if os.path.isdir(os.path.join(zarr_url, group, name))]
+                os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                with open(target_path + '.partial', 'w') as f:
+                    json.dump(attrs, f, indent=4)
+                os.replace(target_path + '.partial', target_path)
+            else:
+                _save_file(path, target_path)
+
+
+def save_outputs(scratch_url, zarr_url, nodes):
+    """Copy output nodes of the scratch copy back to the OME-Zarr image.
+
+    Only files written by the tasks are copied, and files a task removed
+    from a node are removed from the image too.
+    """
+    for node in sorted(nodes):
+        scratch_node, target_node = os.path.join(scratch_url, node), os.path.join(zarr_url, node)
+        for dirpath, _, filenames in os.walk(scratch_node):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if not os.path.islink(path):
+                    _save_file(path, os.path.join(target_node, os.path.relpath(path, scratch_node)))
+        if os.path.isdir(target_node):
+            for dirpath, _, filenames in os.walk(target_node):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    if not os.path.lexists(os.path.join(scratch_node, os.path.relpath(path, target_node))):
+                        os.remove(path)
+        _save_group_metadata(scratch_url, zarr_url, node)
+
+
+def run_pipeline(steps, zarr_url, stats=None, profile_path=None, scratch_dir=None, on_step=None):
+    """Run tasks one after the other on a scratch copy of an OME-Zarr image.
+
+    The scratch copy links to the files of the image, so only what the
+    tasks write takes up space, in memory if ``scratch_dir`` is a tmpfs.
+    The outputs of the steps marked with ``save`` are copied to the image
+    as soon as the step is done, everything else is discarded.
+
+    Parameters
+    ----------
+    steps : list of dict
+        ``executable``, ``path_to_task_args`` and ``save`` of every step.
+    zarr_url : str
+        The OME-Zarr image, replaces the ``zarr_url`` of the task arguments.
+    scratch_dir : str, optional
+        Directory to create the scratch copy in.
+    on_step : callable, optional
+        ``on_step(index, step)`` called before a step starts.
+    """
+    stats = RunStats() if stats is None else stats
+    if scratch_dir is not None and not os.access(scratch_dir, os.W_OK):
+        # E.g. no tmpfs on the machine the job runs on
+        scratch_dir = None
+    scratch_dir = tempfile.mkdtemp(prefix='napari-workflow-tasks-', dir=scratch_dir)
+    scratch_url = os.path.join(scratch_dir, os.path.basename(os.path.normpath(zarr_url)))
+    try:
+        with stats.phase('link'):
+            link_zarr(zarr_url, scratch_url)
+        written_files = dict()
+        for i, step in enumerate(steps):
+            if on_step is not None:
+                on_step(i, step)
+            run_task(step['executable'], step['path_to_task_args'], stats=stats,
+                     profile_path=None if profile_path is None else f'{profile_path}_step{i + 1}',
+                     zarr_url=scratch_url)
+            for name in ['decode', 'import', 'task']:
+                stats.phases[f'step {i + 1} {name}'] = stats.phases.pop(name)
+
+            with stats.phase(f'step {i + 1} scan'):
+                previous_files, written_files = written_files, snapshot_written_files(scratch_url)
+                changed = [path for path in set(written_files) | set(previous_files)
+                           if written_files.get(path) != previous_files.get(path)]
+            if step.get('save', False):
+                with stats.phase(f'step {i + 1} save'):
+                    save_outputs(scratch_url, zarr_url, {get_output_node(path) for path in changed} - {None})
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+def current_rss():
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+def _enable_progress_logging():
+    # INFO records of the tasks have to reach the progress reporter
+    root_logger = logging.getLogger()
+    if root_logger.getEffectiveLevel() > logging.INFO:
+        root_logger.setLevel(logging.INFO)
+    return root_logger
+
+
+def run_job(job, send_progress):
+    """Run a job message and return its result.
+
+    A job is either a single task (``executable``, ``path_to_task_args``)
+    or a ``pipeline`` of steps, both with the ``zarr_url`` they write to and
+    an optional ``profile_path``. Progress events are passed to
+    ``send_progress`` while the job runs.
+
+    Returns
+    -------
+    dict
+        ``status`` ('finished' or 'failed'), ``error``, ``rss``,
+        ``written_paths`` and ``stats``, see ``TaskProcessPool.run``.
+    """
+    root_logger = _enable_progress_logging()
+    started = time.time()
+    reporter = ProgressReporter(send_progress)
+    root_logger.addHandler(reporter)
+    stats = RunStats()
+    written_files = None
+    try:
+        if 'pipeline' in job:
+            def on_step(i, step):
+                reporter.report(None, None, force=True,
+                                stage=f'Step {i + 1}/{len(job["pipeline"])}: {step.get("task_name", "")}')
+            run_pipeline(job['pipeline'], job['zarr_url'], stats=stats, profile_path=job.get('profile_path'),
+                         scratch_dir=job.get('scratch_dir'), on_step=on_step)
+        else:
+            # Only the arrays the task writes itself are reported, not those
+            # other jobs write to the same image meanwhile
+            with record_zarr_writes() as written_files:
+                run_task(job['executable'], job['path_to_task_args'],
+                         stats=stats, profile_path=job.get('profile_path'))
+        result = dict(status='finished', error=None)
+    except Exception:  # noqa: BLE001
+        # Any error of the task fails the job, the worker keeps serving
+        result = dict(status='failed', error=traceback.format_exc())
+    finally:
+        root_logger.removeHandler(reporter)
+    if result['status'] == 'finished' and reporter.total is not None:
+        reporter.report(reporter.total, reporter.total, stage='Done', force=True)
+    reporter.close()
+    result['rss'] = current_rss()
+    # Report what the task wrote, so that only those arrays are reloaded
+    with stats.phase('scan_outputs'):
+        if written_files is None:
+            # Pipelines save their outputs by copying files, and tasks may not use zarr
+            result['written_paths'] = find_written_paths(job.get('zarr_url'), started)
+        else:
+            result['written_paths'] = get_written_arrays(job.get('zarr_url'), written_files)
+    result['stats'] = stats.as_dict()
+    return result
+
+
+def serve(address, authkey, spawned_at=None):
+    # Keep this interpreter alive and run jobs received over the connection
+    # until the pool asks us to stop
+    spawn_seconds = None if spawned_at is None else time.time() - spawned_at
+    conn = Client(address, authkey=authkey)
+    send_lock = threading.Lock()
+
+    def send_progress(event):
+        with send_lock:
+            conn.send(dict(event, event='progress'))
+
+    preload_started = time.perf_counter()
+    preload()
+    # Start-up phases are reported with the first job, which waited for them
+    start_up_phases = dict(preload=dict(wall=time.perf_counter() - preload_started, cpu=None))
+    if spawn_seconds is not None:
+        start_up_phases['spawn'] = dict(wall=spawn_seconds, cpu=None)
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        # A None job is the request to shut down
+        if job is None:
+            break
+
+        result = run_job(job, send_progress)
+        result['stats']['phases'].update(start_up_phases)
+        start_up_phases = dict()
+        with send_lock:
+            conn.send(result)
+    conn.close()
+
+
+def _write_json(path, data):
+    # Readers polling the file never see it half written
+    with open(path + '.partial', 'w') as f:
+        json.dump(data, f)
+    os.replace(path + '.partial', path)
+
+
+def _exit_when_cancelled(cancel_path, interval=0.5):
+    while not os.path.exists(cancel_path):
+        time.sleep(interval)
+    os._exit(1)
+
+
+def run_job_file(job_path):
+    """Run the job in ``<job_path>`` and write the result next to it.
+
+    Used by executors that start the wrapper on another machine and only
+    share a file system with it, see ``_executors``. Progress events are
+    written to ``<job_path>.progress`` and the result to
+    ``<job_path>.result``. Creating ``<job_path>.cancel`` kills the job.
+    """
+    started = time.perf_counter()
+    with open(job_path) as f:
+        job = json.load(f)
+    threading.Thread(target=_exit_when_cancelled, args=(job_path + '.cancel',), daemon=True).start()
+
+    preload()
+    preload_seconds = time.perf_counter() - started
+    result = run_job(job, lambda event: _write_json(job_path + '.progress', event))
+    result['stats']['phases']['preload'] = dict(wall=preload_seconds, cpu=None)
+    result['pid'] = os.getpid()
+    _write_json(job_path + '.result', result)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--executable', type=str)
+    parser.add_argument('--path_to_task_args', type=str)
+    parser.add_argument('--serve', type=str, default=None)
+    parser.add_argument('--job', type=str, default=None)
+
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        # The connection key is passed through the environment, not argv
+        spawned_at = os.environ.pop('TASK_WORKER_SPAWNED_AT', None)
+        serve(args.serve,
+              bytes.fromhex(os.environ.pop('TASK_WORKER_AUTHKEY')),
+              spawned_at=None if spawned_at is None else float(spawned_at))
+    elif args.job is not None:
+        run_job_file(args.job)
+    else:
+        preload()
+        run_task(args.executable, args.path_to_task_args)